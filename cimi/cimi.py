@@ -17,10 +17,11 @@ Cimi middleware.
 
 from nova.openstack.common import log as logging
 from urllib import unquote
-from webob import Request
+from webob import Request, Response
 from urlparse import urlparse
 import json
 import threading
+import time
 
 from cimiapp.machine import (MachineCtrler,
                                       MachineColCtrler)
@@ -36,8 +37,23 @@ from cimiapp.address import (NetworkAddressCtrler,
 from cimiapp.volume import VolumeColCtrler, VolumeCtrler
 from cimiapp.machinevolume import (MachineVolumeCtrler,
                                             MachineVolumeColCtrler)
+from cimiapp.job import JobCtrler, JobColCtrler
 
-from cimiapp.cimiutils import get_err_response
+from cimiapp.cimibase import FLAVOR_CACHE, VALIDATOR_CACHE
+from cimiapp.cimiutils import get_err_response, CONNECTION_POOL
+from cimiapp.compression import Compression
+from cimiapp.jobs import JOBS
+from cimiapp.conditional import GENERATIONS
+from cimiapp.jsoncodec import CODEC
+from cimiapp.metrics import METRICS, MeteredApp, MeteredBody
+from cimiapp.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from cimiapp.responsecache import RESPONSE_CACHE, authorized
+from cimiapp.singleflight import FLIGHTS, CoalescedApp
+from cimiapp.snapshot import SNAPSHOTS
+from cimiapp.transitions import TRANSITIONS
+from cimiapp.waiters import WAITERS
+from cimiapp.inventory import InventoryReader
+from cimiapp.timing import ServerTiming, TimedApp, activate, timed
 
 LOG = logging.getLogger(__name__)
 
@@ -62,13 +78,67 @@ class CIMIMiddleware(object):
                    'volumecollection': VolumeColCtrler,
                    'volume': VolumeCtrler,
                    'machinevolume': MachineVolumeCtrler,
-                   'machinevolumecollection': MachineVolumeColCtrler}
+                   'machinevolumecollection': MachineVolumeColCtrler,
+                   'job': JobCtrler,
+                   'jobcollection': JobColCtrler}
 
     def __init__(self, app, conf, *args, **kwargs):
         self.app = app
         self.conf = conf
         self.request_prefix = self.conf.get('request_prefix')
         self.prefix_length = len(self.request_prefix)
+        CONNECTION_POOL.configure(self.conf)
+        FLAVOR_CACHE.configure(self.conf, 'flavor_cache')
+        VALIDATOR_CACHE.configure(self.conf, 'etag_cache')
+        RESPONSE_CACHE.configure(self.conf)
+        CODEC.configure(self.conf)
+        self.compression = Compression(self.conf)
+        self.timing = ServerTiming(self.conf)
+
+        # the controllers reach Nova through the metered app, identical
+        # concurrent GET subrequests are coalesced before they are metered,
+        # the time a subrequest took, waiting included, is added to the
+        # timings of its request
+        FLIGHTS.configure(self.conf)
+        self.backend_app = TimedApp(CoalescedApp(MeteredApp(app, METRICS),
+                                                 FLIGHTS))
+        METRICS.configure(self.conf)
+        METRICS.add_stats('cimi_connection_pool',
+                          'Keep-alive connection pool statistics.',
+                          CONNECTION_POOL.stats)
+        METRICS.add_stats('cimi_flavor_cache', 'Flavor cache statistics.',
+                          FLAVOR_CACHE.stats)
+        METRICS.add_stats('cimi_etag_cache', 'Collection etag statistics.',
+                          VALIDATOR_CACHE.stats)
+        METRICS.add_stats('cimi_response_cache', 'Response cache statistics.',
+                          RESPONSE_CACHE.stats)
+        METRICS.add_stats('cimi_coalesced_requests',
+                          'Backend GET requests sent (leaders) and shared '
+                          '(followers).', FLIGHTS.stats)
+
+        # the inventory snapshots of the active tenants, the machines in
+        # transition and the resources of running jobs are read through
+        # the same backend app as the requests
+        inventory = InventoryReader(self.conf, self.backend_app)
+        SNAPSHOTS.configure(self.conf, inventory)
+        TRANSITIONS.configure(self.conf, inventory.servers)
+        WAITERS.configure(self.conf, inventory.servers, inventory.volumes)
+        JOBS.configure(self.conf, inventory.servers, inventory.volumes)
+        METRICS.add_stats('cimi_snapshot', 'Tenant inventory snapshot '
+                          'statistics.', SNAPSHOTS.stats)
+        METRICS.add_stats('cimi_transitions', 'Machines tracked through '
+                          'a transitional state.', TRANSITIONS.stats)
+        METRICS.add_stats('cimi_jobs', 'Job table statistics.', JOBS.stats)
+        METRICS.add_stats('cimi_waiters', 'Reads waiting for a machine or '
+                          'volume state.', WAITERS.stats)
+        METRICS.add_stats('cimi_snapshot_lag', 'Age of the oldest inventory '
+                          'snapshot and count of the stale ones.',
+                          SNAPSHOTS.lags)
+
+        # one configured controller per route, each request is handled by
+        # a copy of it bound to the tenant and the path
+        self.routes = dict((key, controller(self.conf, self.backend_app))
+                           for key, controller in self.CONTROLLERS.items())
 
     def _process_config(self, service_name):
         endpoint = self.conf.get(service_name)
@@ -122,35 +192,111 @@ class CIMIMiddleware(object):
         # in its url pattern.
         if len(parts) >= 2:
             controller_key = parts[1].lower()
-            controller = self.CONTROLLERS.get(controller_key)
+            controller = self.routes.get(controller_key)
             return None, controller, parts[0], parts[2:]
         else:
             resp = get_err_response('BadRequest')
             return resp, None, None, None
 
+    def _dispatch(self, ctrler, env, req, method, tenant_id, parts):
+        """
+        Run the handler of the request. GET requests authenticated for the
+        tenant are answered from the response cache when possible, any
+        other handler may change the resources of the tenant, so the
+        cached responses of the tenant are dropped. Reads waiting for a
+        state are never answered from the cache.
+        """
+        if method != 'GET':
+            try:
+                return getattr(ctrler, method)(req, *parts)
+            finally:
+                GENERATIONS.bump(tenant_id)
+
+        if not RESPONSE_CACHE.enabled or req.GET.get('waitFor') or \
+           not authorized(env, tenant_id):
+            return ctrler.GET(req, *parts)
+        key = RESPONSE_CACHE.key(env, tenant_id, ctrler.res_content_type,
+                                 ctrler.pretty)
+        res = RESPONSE_CACHE.get(env, key)
+        if res is None:
+            res = RESPONSE_CACHE.store(ctrler.GET(req, *parts), key)
+        return res
+
+    def _metrics_response(self):
+        """
+        Render the metrics in the Prometheus text format
+        """
+        res = Response()
+        res.status = 200
+        res.headers['Content-Type'] = METRICS_CONTENT_TYPE
+        res.body = METRICS.render()
+        return res
+
+    def _metered(self, res, env, start_response, name, method, start,
+                 timings=None):
+        """
+        Send the response, the request is recorded, and logged when it was
+        slow, once its body is sent
+        """
+        slow = self.timing.slow(timings)
+        if not METRICS.enabled and not slow:
+            return res(env, start_response)
+        status = str(res.status_int)
+
+        def done(size):
+            duration = time.time() - start
+            if METRICS.enabled:
+                METRICS.request_done(name, method, status, duration, size)
+            if slow:
+                self.timing.log_slow(timings, env, method, status, duration)
+        return MeteredBody(res(env, start_response), done)
+
     def __call__(self, env, start_response):
 
-        LOG.info(env)
         if env.get('SCRIPT_NAME', '').startswith(self.request_prefix):
-            self._process_config_header(env)
+            start = time.time()
             path = unquote(env.get('PATH_INFO', ''))
-            response, controller, tenant_id, parts = self.get_controller(path)
+            # _metrics is reserved, it can never be a tenant id
+            if path.strip('/') == '_metrics' and METRICS.enabled:
+                if METRICS.allowed(env):
+                    res = self._metrics_response()
+                else:
+                    res = get_err_response('AccessDenied')
+                res = self.compression.compress(env, res)
+                return res(env, start_response)
+
+            self._process_config_header(env)
+            timings = self.timing.start(env)
+            with timed(timings, 'route'):
+                response, controller, tenant_id, parts = \
+                    self.get_controller(path)
+            method = env.get('REQUEST_METHOD', 'GET').upper()
+            name = 'none'
 
             if response:
-                return response(env, start_response)
+                res = response
             elif controller:
+                name = type(controller).__name__
+                if SNAPSHOTS.enabled and authorized(env, tenant_id):
+                    SNAPSHOTS.touch(tenant_id, env)
                 req = Request(env)
-                ctrler = controller(self.conf, self.app, req,
-                                    tenant_id, *parts)
-                method = env.get('REQUEST_METHOD').upper()
+                with timed(timings, 'negotiate'):
+                    ctrler = controller.bind(req, tenant_id, *parts)
                 if hasattr(ctrler, method) and not method.startswith('_'):
-                    res = getattr(ctrler, method)(req, *parts)
-                    return res(env, start_response)
+                    activate(timings)
+                    try:
+                        with timed(timings, 'handler'):
+                            res = self._dispatch(ctrler, env, req, method,
+                                                 tenant_id, parts)
+                    finally:
+                        activate(None)
                 else:
                     res = get_err_response('NotImplemented')
-                    return res(env, start_response)
             else:
                 res = get_err_response('NotImplemented')
-                return res(env, start_response)
+            res = self.compression.compress(env, res)
+            res = self.timing.finish(timings, res)
+            return self._metered(res, env, start_response, name, method,
+                                 start, timings)
         else:
             return self.app(env, start_response)
@@ -34,15 +34,16 @@ class NetworkAddressCtrler(Controller):
     """
     Handles machine request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(NetworkAddressCtrler, self).__init__(conf, app, req,
-                                tenant_id, *args)
-        self.os_path = '/%s/servers' % (tenant_id)
+    def __init__(self, conf, app):
+        super(NetworkAddressCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineNetworkInterfacesAddress'
+        self.metadata = Consts.ADDRESS_METADATA
+
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers' % (tenant_id)
         self.machine_id = args[0] if len(args) > 0 else ''
         self.address_key = args[1] if len(args) > 1 else ''
         self.machine_ip = args[2] if len(args) > 2 else ''
-        self.metadata = Consts.ADDRESS_METADATA
 
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
@@ -81,7 +82,8 @@ class NetworkAddressCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
@@ -97,14 +99,15 @@ class NetworkAddressColCtrler(Controller):
     """
     Handles machine collection request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(NetworkAddressColCtrler, self).__init__(conf,
-            app, req, tenant_id, *args)
+    def __init__(self, conf, app):
+        super(NetworkAddressColCtrler, self).__init__(conf, app)
+        self.entity_uri = 'MachineNetworkInterfacesAddressesCollection'
+        self.metadata = Consts.ADDRESS_COL_METADATA
+
+    def _bind(self, tenant_id, *args):
         self.os_path = '/%s/servers' % (tenant_id)
         self.machine_id = args[0] if len(args) > 0 else ''
         self.address_key = args[1] if len(args) > 1 else ''
-        self.entity_uri = 'MachineNetworkInterfacesAddressesCollection'
-        self.metadata = Consts.ADDRESS_COL_METADATA
 
     def _get_entry(self, data):
 
@@ -137,15 +140,8 @@ class NetworkAddressColCtrler(Controller):
         Handle GET machine request
         """
 
-        env = self._fresh_env(req)
-        env['PATH_INFO'] = concat(self.os_path, '/', parts[0])
-
-        new_req = Request(env)
-        res = new_req.get_response(self.app)
-
-        if res.status_int == 200:
-            data = json.loads(res.body).get('server')
-
+        res, data = self._get_server(req, parts[0])
+        if res is None:
             body = {}
             body['id'] = concat(self.tenant_id, '/',
                                 self.entity_uri, '/',
@@ -162,7 +158,8 @@ class NetworkAddressColCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
@@ -0,0 +1,93 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# In-process caches used by the cimi controllers. Like cimiutils, this module
+# must not reference any cimi implementation modules.
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    A size bounded least recently used cache whose entries expire after ttl
+    seconds.
+
+    Every entry has a weight, 1 by default, and the least recently used
+    entries are evicted once the total weight goes over max_size.
+    """
+
+    def __init__(self, max_size=1000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.weight = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, conf, prefix):
+        """
+        Pick up <prefix>_size and <prefix>_ttl from the filter configuration
+        """
+        self.max_size = int(conf.get(prefix + '_size', self.max_size))
+        self.ttl = float(conf.get(prefix + '_ttl', self.ttl))
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return None
+            value, weight, expires = item
+            if expires < time.time():
+                self.weight -= weight
+                self.misses += 1
+                return None
+            # re-insert the entry so that it becomes the most recent one
+            self._data[key] = item
+            self.hits += 1
+            return value
+
+    def put(self, key, value, weight=1):
+        if weight > self.max_size:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old:
+                self.weight -= old[1]
+            self._data[key] = (value, weight, time.time() + self.ttl)
+            self.weight += weight
+            while self.weight > self.max_size:
+                old_key, old = self._data.popitem(last=False)
+                self.weight -= old[1]
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old:
+                self.weight -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._data),
+                'weight': self.weight}
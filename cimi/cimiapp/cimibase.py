@@ -13,127 +13,123 @@
 #    under the License.
 
 
-from xml.dom import minidom
-from webob import Request
+from webob import Request, Response
 from nova.openstack.common import log as logging
 from nova.api.openstack.wsgi import XMLDictSerializer, JSONDictSerializer
-from nova.api.openstack.wsgi import XMLDeserializer, JSONDeserializer
-from cimiutils import best_match
+from nova.api.openstack.wsgi import XMLDeserializer
+from cimiutils import best_match, concat, conf_true, access_resource
+from cimiutils import paginate, project, match_up, map_volume_state
+from cimiutils import wants_pretty
+from urllib import quote, urlencode
+from cache import LRUCache
+from xmlwriter import XMLWriter
+from schema import get_serializers, PRETTY_JSON_SERIALIZER
+from jsoncodec import CODEC
+from scheduler import Scheduler
+from conditional import CLOCK_SKEW, GENERATIONS, Validator
+from conditional import make_etag, etag_matches, changes_since
+from timing import current as current_timings, timed, timed_iter
+from responsecache import authorized
+from snapshot import SNAPSHOTS
+from transitions import TRANSITIONS
+from jobs import JOBS
 import copy
 import json
+import time
 
 LOG = logging.getLogger(__name__)
 
+# flavors hardly ever change, so the flavor list of a tenant is cached
+FLAVOR_CACHE = LRUCache(max_size=1000, ttl=300)
+
+# the etag last sent for each tenant collection, see _check_validator
+VALIDATOR_CACHE = LRUCache(max_size=10000, ttl=3600)
+
+
+class EntryStream(object):
+    """
+    The entries of a collection. Each backend item is converted into its
+    entry only when the serializer gets to it, so the converted collection
+    never sits in memory as a whole.
+    """
+
+    def __init__(self, items, convert):
+        self.items = items
+        self.convert = convert
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        for item in self.items:
+            yield self.convert(item)
+
 
 class CimiJSONDictSerializer(JSONDictSerializer):
     """Default JSON request body serialization"""
 
     def default(self, data):
-        return json.dumps(data, indent=2)
+        return PRETTY_JSON_SERIALIZER.to_string(data)
 
 
 class CimiXMLSerializer(XMLDictSerializer):
+    """
+    Writes the xml document straight from the data and the metadata rules
+    without building a dom tree. The data passed in is not changed.
+    """
+
+    def __init__(self, metadata=None, xmlns=None, pretty=True):
+        super(CimiXMLSerializer, self).__init__(metadata, xmlns)
+        self.pretty = pretty
 
     def default(self, data):
         # We expect data to contain a single key which is the XML root.
-        root_key = data.keys()[0]
-        doc = minidom.Document()
-        node = self._to_xml_node(doc, self.metadata, root_key,
-                                 data[root_key], None)
-
-        header = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        return header + self.to_xml_string(node)
-
-    def to_xml_string(self, node, has_atom=False):
-        self._add_xmlns(node, has_atom)
-        return node.toprettyxml(indent='  ')
-        #return node.toxml('UTF-8')
-
-    def _to_xml_node(self, doc, metadata, nodename, data, parentnode=None):
-        """Recursive method to convert data members to XML nodes."""
-
-        if isinstance(data, list):
-            collections = metadata.get('list_collections', {})
-            singular = metadata.get('plurals', {}).get(nodename, None)
-            if singular is None:
-                if nodename.endswith('s'):
-                    singular = nodename[:-1]
-                else:
-                    singular = 'item'
-            for item in data:
-                node = self._to_xml_node(doc, metadata, singular,
-                                         item, parentnode)
-                #result.appendChild(node)
-                if parentnode:
-                    parentnode.appendChild(node)
-            result = None
-        elif isinstance(data, dict):
-            result = doc.createElement(nodename)
-
-            if self.xmlns and parentnode is None:
-                result.setAttribute('xmlns', self.xmlns)
-
-            attrs = metadata.get('attributes', {}).get(nodename, {})
-            sequence = metadata.get('sequence', []).get(nodename, {})
-
-            # Deal with the specified elements
-            for k in sequence:
-
-                if k in data:
-                    v = data.get(k)
-                    if k in attrs:
-                        result.setAttribute(k, str(v))
-                    else:
-                        node = self._to_xml_node(doc, metadata, k, v, result)
-                        if node:
-                            result.appendChild(node)
-                    data.pop(k)
-
-            # Process the items still left
-            for k, v in data.items():
-                if k in attrs:
-                    result.setAttribute(k, str(v))
-                else:
-                    node = self._to_xml_node(doc, metadata, k, v, result)
-                    if node:
-                        result.appendChild(node)
-        else:
-            # Type is atom
-            result = doc.createElement(nodename)
+        return XMLWriter(self.metadata, self.xmlns,
+                         self.pretty).to_string(data)
 
-            if self.xmlns and parentnode is None:
-                result.setAttribute('xmlns', self.xmlns)
 
-            node = doc.createTextNode(str(data))
-            result.appendChild(node)
-        return result
+def make_response_data(data, content_type, metadata, namespace,
+                       pretty=False):
+    """
+    Use the compiled serializers of the metadata to create response body,
+    json is only indented when pretty is set
+    """
+    serializer = get_serializers(metadata, namespace,
+                                 pretty).get(content_type)
+    if serializer:
+        with timed(current_timings(), 'serialize'):
+            return serializer.to_string(data)
+    else:
+        return ''
 
 
-def make_response_data(data, content_type, metadata, namespace):
+def make_response_iter(data, content_type, metadata, namespace,
+                       pretty=False):
     """
-    Use xml serializer and json serializer to create response body
+    Same as make_response_data but the body is handed out in chunks so that
+    it can be used as the app_iter of a response
     """
-    xml_serializer = CimiXMLSerializer(metadata, namespace)
-    serializer = {'application/xml': xml_serializer,
-                  'application/json': CimiJSONDictSerializer()
-                 }.get(content_type, None)
+    serializer = get_serializers(metadata, namespace,
+                                 pretty).get(content_type)
     if serializer:
-        return serializer.serialize(data)
+        body = serializer.iter_document(data)
+        timings = current_timings()
+        return timed_iter(body, timings) if timings is not None else body
     else:
-        return ''
+        return iter([''])
 
 
-def get_request_data(data, content_type):
+def get_request_data(data, content_type, metadata=None):
     """
-    Use openstack json and xml deserializer to parse request body and
-    return a python object.
+    Parse the request body, json with the json codec and xml with the
+    openstack xml deserializer, and return a python object. The plurals
+    of the metadata name the xml elements which hold lists.
     """
 
-    deserializer = {'application/xml': XMLDeserializer(),
-                    'application/json': JSONDeserializer()
-                   }.get(content_type)
-    if deserializer:
-        return deserializer.default(data)
+    if content_type == 'application/json':
+        return {'body': CODEC.loads(data)}
+    elif content_type == 'application/xml':
+        return XMLDeserializer(metadata).default(data)
     else:
         return None
 
@@ -182,31 +178,44 @@ class Consts(object):
                                         'machineImages': 'href',
                                         'machines': 'href',
                                         'volumes': 'href',
+                                        'jobs': 'href',
                                         'CloudEntryPoint': 'resourceURI'},
                          'sequence': {'CloudEntryPoint':
                                       ['id', 'name', 'description',
                                        'created', 'updated', 'property',
                                        'baseURI', 'machines', 'machineConfigs',
                                        'machineImages', 'volumes',
-                                       'operation']}}
+                                       'jobs', 'operation']}}
+
+    # expanded volumes and networkInterfaces of a machine
+    MACHINE_EXPAND_SEQUENCE = {'volumes': ['count', 'machineVolumes'],
+        'MachineVolume': ['id', 'initialLocation', 'volume', 'state',
+                          'operations'],
+        'networkInterfaces': ['count', 'entries'],
+        'Entry': ['id', 'addresses']}
 
     MACHINE_METADATA = {'attributes':
         {'property': 'key', 'volumes': 'href', 'disks': 'href',
          'networkInterfaces': 'href', 'Entry': 'resourceURI',
-         'operation': ['rel', 'href']},
-        'plurals': {'entries': 'Entry'},
-        'sequence': {'Machine': ['id', 'name', 'description', 'created',
-                                 'updated', 'property', 'state', 'cpu',
-                                 'memory', 'disks', 'volumes',
-                                 'networkInterfaces',
-                                 'credentials', 'operations']}}
+         'operation': ['rel', 'href'], 'volume': 'href',
+         'addresses': 'href'},
+        'plurals': {'entries': 'Entry', 'machineVolumes': 'MachineVolume'},
+        'sequence': dict(MACHINE_EXPAND_SEQUENCE,
+                         Machine=['id', 'name', 'description', 'created',
+                                  'updated', 'property', 'state', 'cpu',
+                                  'memory', 'disks', 'volumes',
+                                  'networkInterfaces',
+                                  'credentials', 'operations'])}
     MACHINE_COL_METADATA = {'attributes':
         {'Collection': 'resourceURI', 'Entry': 'resourceURI',
          'disks': 'href', 'networkInterfaces': 'href', 'volumes': 'href',
-         'machine': 'href', 'operation': ['rel', 'href']},
-        'plurals': {'machines': 'Machine', 'operations': 'operation'},
-        'sequence': {'Collection': ['id', 'count', 'machines', 'operation'],
-                     'Machine': MACHINE_METADATA['sequence']['Machine']}}
+         'machine': 'href', 'operation': ['rel', 'href'],
+         'volume': 'href', 'addresses': 'href'},
+        'plurals': {'machines': 'Machine', 'operations': 'operation',
+                    'entries': 'Entry', 'machineVolumes': 'MachineVolume'},
+        'sequence': dict(MACHINE_EXPAND_SEQUENCE,
+                         Collection=['id', 'count', 'machines', 'operation'],
+                         Machine=MACHINE_METADATA['sequence']['Machine'])}
 
     MACHINECONFIG_METADATA = {'attributes': {},
                          'plurals': {'disks': 'disk'},
@@ -217,9 +226,11 @@ class Consts(object):
                                       'disk': ['capacity']}}
     MACHINECONFIG_COL_METADATA = {'attributes':
         {'Collection': 'resourceURI', 'Entry': 'resourceURI',
-         'machineConfiguration': 'href'},
-        'plurals': {'machineConfigurations': 'MachineConfiguration'},
-        'sequence': {'Collection': ['id', 'count', 'machineConfigurations'],
+         'machineConfiguration': 'href', 'operation': ['rel', 'href']},
+        'plurals': {'machineConfigurations': 'MachineConfiguration',
+                    'operations': 'operation'},
+        'sequence': {'Collection': ['id', 'count', 'machineConfigurations',
+                                    'operation'],
             'MachineConfiguration':
                 MACHINECONFIG_METADATA['sequence']['MachineConfiguration']}}
 
@@ -232,9 +243,12 @@ class Consts(object):
                                        'relatedImage', 'operations']}}
 
     MACHINEIMAGE_COL_METADATA = {'attributes': {'Collection': 'resourceURI',
-        'Entry': 'resourceURI', 'machineImage': 'href'},
-        'plurals': {'machineImages': 'MachineImage'},
-        'sequence': {'Collection': ['id', 'count', 'machineImages'],
+        'Entry': 'resourceURI', 'machineImage': 'href',
+        'operation': ['rel', 'href']},
+        'plurals': {'machineImages': 'MachineImage',
+                    'operations': 'operation'},
+        'sequence': {'Collection': ['id', 'count', 'machineImages',
+                                    'operation'],
             'MachineImage': MACHINEIMAGE_METADATA['sequence']['MachineImage']}}
 
     MACHINEVOLUME_METADATA = {'attributes': {'volume': 'href',
@@ -287,17 +301,131 @@ class Consts(object):
                            'active_stop': 'os-stop',
                            'active_delete': 'delete'}
 
+    JOB_METADATA = {'attributes': {'targetResource': 'href',
+                                   'operation': ['rel', 'href']},
+                    'plurals': {},
+                    'sequence': {'Job': ['id', 'name', 'description',
+                                         'created', 'updated', 'property',
+                                         'targetResource', 'returnCode',
+                                         'progress', 'status',
+                                         'statusMessage', 'action',
+                                         'timeOfStatusChange',
+                                         'isCancellable', 'operations']}}
+
+    JOB_COL_METADATA = {'attributes': {'Collection': 'resourceURI',
+                                       'targetResource': 'href',
+                                       'operation': ['rel', 'href']},
+                        'plurals': {'jobs': 'Job',
+                                    'operations': 'operation'},
+                        'sequence': {'Collection': ['id', 'count', 'jobs',
+                                                    'operation'],
+                                     'Job': JOB_METADATA['sequence']['Job']}}
+
+    MACHINE_ACTION_RESULTS_METADATA = {'attributes':
+        {'Collection': 'resourceURI', 'machine': 'href', 'job': 'href'},
+        'plurals': {'results': 'Result'},
+        'sequence': {'Collection': ['id', 'action', 'count', 'results'],
+                     'Result': ['machine', 'status', 'statusMessage',
+                                'job']}}
+
+    # the cimi state a machine ends in after each Nova action
+    MACHINE_ACTION_STATES = {'unpause': 'STARTED',
+                             'resume': 'STARTED',
+                             'os-start': 'STARTED',
+                             'reboot': 'STARTED',
+                             'pause': 'PAUSED',
+                             'suspend': 'SUSPENDED',
+                             'os-stop': 'STOPPED'}
+
+
+# compile the serializers of every resource when the module is loaded
+for _name in dir(Consts):
+    if _name.endswith('_METADATA'):
+        get_serializers(getattr(Consts, _name), Consts.CIMI_NS)
+
 
 class Controller(object):
-    def __init__(self, conf, app, req, tenant_id, *args):
+    # the backend call each attribute of the resource depends on, the call
+    # is skipped when $select leaves out all of its attributes
+    ATTRIBUTE_SOURCES = {}
+
+    def __init__(self, conf, app):
         self.conf = conf
         self.app = app
-        self.tenant_id = tenant_id
         self.request_prefix = self.conf.get('request_prefix')
         self.os_version = self.conf.get('os_version')
         self.uri_prefix = Consts.CIMI_NS
-        self.res_content_type = best_match(req.environ.get('HTTP_ACCEPT', ''))
-        self.req_content_type = best_match(req.environ.get('CONTENT_TYPE', ''))
+        self.stream_collections = conf_true(self.conf, 'stream_collections',
+                                            True)
+        self.subrequest_concurrency = int(self.conf.get(
+            'subrequest_concurrency', 4))
+        self.json_pretty = conf_true(self.conf, 'json_pretty')
+
+    def bind(self, req, tenant_id, *args):
+        """
+        Create the controller of one request. The middleware keeps one
+        configured controller per route and hands each request a shallow
+        copy of it, so only the tenant and request specific members are set
+        here.
+        """
+        ctrler = copy.copy(self)
+        ctrler.tenant_id = tenant_id
+        ctrler.res_content_type = best_match(req.environ.get('HTTP_ACCEPT',
+                                                             ''))
+        ctrler.req_content_type = best_match(req.environ.get('CONTENT_TYPE',
+                                                             ''))
+        ctrler.pretty = wants_pretty(req.GET,
+                                     req.environ.get('HTTP_ACCEPT', ''),
+                                     self.json_pretty)
+        ctrler._bind(tenant_id, *args)
+        return ctrler
+
+    def _bind(self, tenant_id, *args):
+        """
+        Set the members which depend on the tenant and the path arguments
+        """
+        pass
+
+    def _run_method(self, req, request_data, method, *parts):
+        """
+        Send the Nova action method of a cimi machine action to the server
+        parts[0]
+        """
+        data = {}
+        if method == 'reboot':
+            force = request_data.get('force', False)
+            if isinstance(force, str):
+                force = 'HARD' if force.lower() == 'true' else 'SOFT'
+            else:
+                force = 'HARD' if force else 'SOFT'
+            data['reboot'] = {'type': force}
+        else:
+            data[method] = None
+
+        env = self._fresh_env(req)
+        env['PATH_INFO'] = '/%s/servers/%s/action' % (self.tenant_id,
+                                                      parts[0])
+        env['CONTENT_TYPE'] = 'application/json'
+        new_req = Request(env)
+        new_req.body = json.dumps(data)
+        res = new_req.get_response(self.app)
+
+        return res
+
+    def _start_job(self, req, res, action, target, kind, resource_id,
+                   states, updated=None):
+        """
+        Start the job of an asynchronous operation on the target resource
+        and send its address in the CIMI-Job-URI header of the response.
+        See Job for the other arguments.
+        """
+        job = JOBS.create(self.tenant_id, req.environ, action, target, kind,
+                          resource_id, states, updated)
+        if job is not None:
+            res.headers['CIMI-Job-URI'] = '/'.join([self.request_prefix,
+                                                    self.tenant_id, 'Job',
+                                                    job.id])
+        return job
 
     def _create_op(self, name, href):
         entry = {}
@@ -306,20 +434,7 @@ class Controller(object):
         return entry
 
     def _fresh_request(self, req):
-        env = copy.copy(req.environ)
-
-        env['SCRIPT_NAME'] = self.os_version
-        env['PATH_INFO'] = self.os_path
-        # we will always use json format to get Nova information
-        env['HTTP_ACCEPT'] = 'application/json'
-        env['CONTENT_TYPE'] = 'application/json'
-
-        # need to remove this header, otherwise, it will always take the
-        # original request accept content type
-        if env.has_key('nova.best_content_type'):
-            env.pop('nova.best_content_type')
-        new_req = Request(env)
-        return new_req
+        return Request(self._fresh_env(req))
 
     def _fresh_env(self, req):
         env = copy.copy(req.environ)
@@ -330,12 +445,500 @@ class Controller(object):
         env['HTTP_ACCEPT'] = 'application/json'
         env['CONTENT_TYPE'] = 'application/json'
 
+        # the cimi query parameters mean nothing to the backend
+        env['QUERY_STRING'] = ''
+
+        # the conditions and the encoding apply to the cimi response only
+        for key in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE',
+                    'HTTP_ACCEPT_ENCODING'):
+            env.pop(key, None)
+
         # need to remove this header, otherwise, it will always take the
         # original request accept content type
         if env.has_key('nova.best_content_type'):
             env.pop('nova.best_content_type')
         return env
 
+    def _volume_env(self, req):
+        """
+        Create the environment for a request to the volume endpoint
+        """
+        env = self._fresh_env(req)
+        env['SERVER_PORT'] = self.conf.get('volume_endpoint_port')
+        env['SCRIPT_NAME'] = '/v1'
+        env['HTTP_HOST'] = '%s:%s' % \
+            (self.conf.get('volume_endpoint_host'),
+             self.conf.get('volume_endpoint_port'))
+        env['CONTENT_LENGTH'] = 0
+        return env
+
+    def _volume_request(self, req, method, path, query_string=None,
+                        body=None):
+        """
+        Send a request to the volume endpoint, path is relative to /v1
+        """
+        env = self._volume_env(req)
+        if body is not None:
+            env['CONTENT_LENGTH'] = len(body)
+        return access_resource(env, method, '/v1' + path, True,
+                               query_string, body)
+
+    def _scheduler(self):
+        """
+        Create the scheduler running the backend calls of one request
+        """
+        return Scheduler(self.subrequest_concurrency)
+
+    def _nova_request(self, req, path, query_string='', method='GET',
+                      body=None):
+        """
+        Send a request to Nova, path is relative to the os_version
+        """
+        env = self._fresh_env(req)
+        env['PATH_INFO'] = path
+        env['QUERY_STRING'] = query_string
+        env['REQUEST_METHOD'] = method
+        new_req = Request(env)
+        if body is not None:
+            new_req.body = body
+        return new_req.get_response(self.app)
+
+    def _snapshot(self, req):
+        """
+        Return the inventory snapshot of the tenant when reads may be
+        answered from it, otherwise None. Only requests authenticated for
+        the tenant are answered from its snapshot.
+        """
+        if not authorized(req.environ, self.tenant_id):
+            return None
+        return SNAPSHOTS.fresh(self.tenant_id)
+
+    def _get_server(self, req, server_id):
+        """
+        Read one Nova server, from the transition tracker or the inventory
+        snapshot when they hold the server. Those only answer requests
+        authenticated for the tenant. Returns the failed Nova response or
+        None, and the server.
+        """
+        if authorized(req.environ, self.tenant_id):
+            server = TRANSITIONS.server(self.tenant_id, server_id)
+            if server is not None:
+                return None, server
+        snapshot = self._snapshot(req)
+        if snapshot is not None:
+            server = snapshot.servers.get(server_id)
+            if server is not None:
+                return None, server
+        res = self._nova_request(req, concat(self.os_path, '/', server_id))
+        if res.status_int != 200:
+            return res, None
+        return None, json.loads(res.body).get('server')
+
+    def _get_nova_list(self, req, path, key, paging, params=None):
+        """
+        Read a Nova listing such as servers/detail. When paging is asked
+        for, the page is pushed down to Nova with limit and marker so only
+        the items up to the end of the page are read, the marker hint left
+        in our own next links is used when the client follows one.
+
+        Returns the failed Nova response or None, the items and whether
+        more items follow them.
+        """
+        params = dict(params or {})
+        if not paging:
+            res = self._nova_request(req, path, urlencode(params))
+            if res.status_int != 200:
+                return res, None, False
+            return None, json.loads(res.body).get(key, []), False
+
+        first, last = paging
+        marker = req.GET.get('marker') if first > 1 else None
+        while True:
+            query = dict(params)
+            if marker:
+                query['marker'] = marker
+                skip = 0
+            else:
+                skip = first - 1
+            # read one more item than needed to know if a next page exists
+            needed = None if last is None else skip + last - first + 2
+
+            items = []
+            while True:
+                if needed is not None:
+                    query['limit'] = needed - len(items)
+                res = self._nova_request(req, path, urlencode(query))
+                if res.status_int != 200:
+                    break
+                content = json.loads(res.body)
+                page = content.get(key, [])
+                items.extend(page)
+                links = [link for link in content.get(key + '_links', [])
+                         if link.get('rel') == 'next']
+                if (not page or not links or
+                    (needed is not None and len(items) >= needed)):
+                    break
+                query['marker'] = page[-1]['id']
+
+            if res.status_int == 200:
+                break
+            elif marker and res.status_int == 400:
+                # the marker item is gone, start over from the beginning
+                marker = None
+            else:
+                return res, None, False
+
+        if last is None:
+            return None, items[skip:], False
+        size = last - first + 1
+        return None, items[skip:skip + size], len(items) > skip + size
+
+    def _add_paging_ops(self, body, href, paging, has_more, marker=None,
+                        extra=None):
+        """
+        Add the next and previous operations to a paged collection. The
+        marker is the backend id of the last item of the page, for listings
+        which are paged by the backend. extra is an encoded query string,
+        such as the $filter of the request, which the links carry over.
+        """
+        if not paging:
+            return
+        first, last = paging
+        operations = body.setdefault('operations', [])
+        if last is not None and has_more:
+            size = last - first + 1
+            query = '$first=%d&$last=%d' % (last + 1, last + size)
+            if marker:
+                query = concat(query, '&marker=', quote(marker))
+            if extra:
+                query = concat(query, '&', extra)
+            operations.append(self._create_op('next',
+                                              concat(href, '?', query)))
+        if first > 1:
+            size = last - first + 1 if last is not None else first - 1
+            query = '$first=%d&$last=%d' % (max(1, first - size), first - 1)
+            if extra:
+                query = concat(query, '&', extra)
+            operations.append(self._create_op('previous',
+                                              concat(href, '?', query)))
+
+    def _make_entries(self, items, convert, paging, residual=None,
+                      has_more=None, select=None):
+        """
+        Turn backend items into the entries of a collection page. has_more
+        is None when the items are the complete listing, the page is then
+        cut out here. Without a residual filter predicate the entries are
+        converted lazily, otherwise every item is converted and checked
+        first so the page is cut out of the matching entries. The entries
+        are projected on select after the filter has seen them.
+
+        Returns the entries and whether more entries follow them.
+        """
+        if residual is not None:
+            entries = [entry for entry in (convert(item) for item in items)
+                       if residual(entry)]
+            entries, has_more = paginate(entries, paging)
+            if select is not None:
+                entries = [project(entry, select) for entry in entries]
+            return entries, has_more
+        if has_more is None:
+            items, has_more = paginate(items, paging)
+        if select is not None:
+            return EntryStream(items,
+                lambda item: project(convert(item), select)), has_more
+        return EntryStream(items, convert), has_more
+
+    def _needs(self, source, select, cimi_filter=None):
+        """
+        Check if the response needs the given backend call, that is if no
+        $select is given or an attribute depending on the call is either
+        selected or looked at by the filter
+        """
+        if select is None:
+            return True
+        names = set(select)
+        if cimi_filter:
+            names.update(cimi_filter.attributes())
+        for name in names:
+            if self.ATTRIBUTE_SOURCES.get(name) == source:
+                return True
+        return False
+
+    def _get_flavors(self, req):
+        """
+        Return the flavor list of the tenant and the same flavors keyed by
+        id, None if Nova can not list the flavors. The lists are served from
+        the inventory snapshot or the flavor cache whenever possible.
+        """
+        return self._get_catalog(req)[1]
+
+    def _get_catalog(self, req):
+        """
+        Same as _get_flavors, returns the failed Nova response or None and
+        the flavor lists
+        """
+        snapshot = self._snapshot(req)
+        if snapshot is not None and snapshot.flavors is not None:
+            return None, snapshot.flavors
+        return self._read_catalog(req)
+
+    def _read_flavors(self, req):
+        """
+        Same as _get_flavors, without looking at the inventory snapshot
+        """
+        return self._read_catalog(req)[1]
+
+    def _read_catalog(self, req):
+        """
+        Same as _get_catalog, without looking at the inventory snapshot.
+        Only requests authenticated for the tenant use the flavor cache.
+        """
+        cached = authorized(req.environ, self.tenant_id)
+        catalog = FLAVOR_CACHE.get(self.tenant_id) if cached else None
+        if catalog is None:
+            env = self._fresh_env(req)
+            env['PATH_INFO'] = '/%s/flavors/detail' % (self.tenant_id)
+            new_req = Request(env)
+            res = new_req.get_response(self.app)
+            if res.status_int != 200:
+                return res, None
+
+            flavors = json.loads(res.body).get('flavors', [])
+            keyed_flavors = {}
+            for flavor in flavors:
+                keyed_flavors[flavor['id']] = flavor
+            catalog = (flavors, keyed_flavors)
+            if cached:
+                FLAVOR_CACHE.put(self.tenant_id, catalog)
+        return None, catalog
+
+    def _get_flavor(self, req, flavor_id, catalog=None):
+        """
+        Return one flavor of the tenant, None if it can not be found.
+        Flavors missing from the flavor list, deleted ones for example, are
+        read from Nova and added to the cached catalog. catalog is what
+        _get_flavors returned, when the caller already has it.
+        """
+        return self._find_flavor(req, flavor_id, catalog)[1]
+
+    def _find_flavor(self, req, flavor_id, catalog=None):
+        """
+        Same as _get_flavor, returns the failed Nova response or None and
+        the flavor
+        """
+        if catalog is None:
+            catalog = self._get_flavors(req)
+        flavors, keyed_flavors = catalog or ([], {})
+        flavor = keyed_flavors.get(flavor_id)
+        if flavor is None:
+            env = self._fresh_env(req)
+            env['PATH_INFO'] = '/%s/flavors/%s' % (self.tenant_id, flavor_id)
+            new_req = Request(env)
+            res = new_req.get_response(self.app)
+            if res.status_int != 200:
+                return res, None
+            flavor = json.loads(res.body).get('flavor')
+            keyed_flavors[flavor_id] = flavor
+        return None, flavor
+
+    def _machine_volume_entry(self, server_id, attachment_id, device,
+                              volume_id):
+        """
+        Create the machine volume entry of one volume attachment
+        """
+        entry = {}
+        if self.res_content_type == 'application/json':
+            entry['resourceURI'] = concat(self.uri_prefix,
+                                    '/MachineVolume')
+        entry['id'] = concat(self.tenant_id, '/',
+                             'machineVolume/',
+                             server_id, '/',
+                             attachment_id)
+        entry['initialLocation'] = device
+        entry['volume'] = {'href': concat(self.tenant_id,
+            '/Volume/', volume_id)}
+
+        operations = []
+        operations.append(self._create_op('edit', entry['id']))
+        operations.append(self._create_op('delete', entry['id']))
+        entry['operations'] = operations
+        return entry
+
+    def _interface_entries(self, server, server_id):
+        """
+        Create the network interface entries of a Nova server, one for each
+        of its private and public networks
+        """
+        entries = []
+        for key in ('private', 'public'):
+            adds = {}
+            match_up(adds, server, 'addr', 'addresses/' + key)
+            if adds.get('addr'):
+                entry = {}
+                name = 'MachineNetworkInterfacesCollectionEntry'
+                entry['id'] = concat(self.tenant_id, '/', name,
+                                     '/', server_id, '/', key)
+                entry['resourceURI'] = concat(self.uri_prefix,
+                    '/', name,)
+                name = 'MachineNetworkInterfaceAddressesCollection'
+                entry['addresses'] = {'href': concat(self.tenant_id,
+                    '/', name, '/', server_id, '/', key)}
+                entries.append(entry)
+        return entries
+
+    def _get_attached_volumes(self, req):
+        """
+        Read the Cinder volume listing once, or take it from the inventory
+        snapshot, and return the machine volume entries of all attachments
+        keyed by server id, None if Cinder can not list the volumes. The
+        attachment id is the volume id, as Nova uses it for its volume
+        attachments.
+        """
+        snapshot = self._snapshot(req)
+        if snapshot is not None:
+            volumes = snapshot.volume_list
+        else:
+            status, headers, body, status_code = self._volume_request(req,
+                'GET', '/%s/volumes/detail' % self.tenant_id)
+            if not status:
+                return None
+            volumes = json.loads(body).get('volumes', [])
+        attached = {}
+        for volume in volumes:
+            for attachment in volume.get('attachments') or []:
+                server_id = attachment.get('server_id')
+                if not server_id:
+                    continue
+                entry = self._machine_volume_entry(server_id, volume['id'],
+                    attachment.get('device'), volume['id'])
+                entry['state'] = map_volume_state(volume['status'])
+                attached.setdefault(server_id, []).append(entry)
+        return attached
+
+    def _expand_machine(self, entry, server, expand, attached):
+        """
+        Inline the volumes and network interfaces of a machine, the
+        attached volumes come from _get_attached_volumes
+        """
+        if 'volumes' in expand and attached is not None and \
+           'volumes' in entry:
+            volumes = attached.get(server['id'], [])
+            entry['volumes'] = {'href': entry['volumes']['href'],
+                                'count': len(volumes),
+                                'machineVolumes': volumes}
+        if 'networkInterfaces' in expand and 'networkInterfaces' in entry:
+            interfaces = self._interface_entries(server, server['id'])
+            entry['networkInterfaces'] = {
+                'href': entry['networkInterfaces']['href'],
+                'count': len(interfaces),
+                'entries': interfaces}
+
+    def _etag(self, req, *parts):
+        """
+        Make the etag of a response from the backend state it shows, ids
+        and updated times mostly, and the representation the request asks
+        for
+        """
+        return make_etag(self.res_content_type, self.pretty,
+                         req.environ.get('QUERY_STRING', ''), *parts)
+
+    def _not_modified(self, req, etag):
+        """
+        Return the 304 response when the client already has the etag,
+        otherwise None
+        """
+        if not etag_matches(req.environ.get('HTTP_IF_NONE_MATCH'), etag):
+            return None
+        resp = Response()
+        self._fixup_cimi_header(resp)
+        resp.status = 304
+        resp.headers['ETag'] = etag
+        return resp
+
+    def _validator_key(self, req):
+        return (self.tenant_id, self.entity_uri, self.res_content_type,
+                self.pretty, req.environ.get('QUERY_STRING', ''))
+
+    def _check_validator(self, req, key):
+        """
+        Answer a conditional collection request without reading the Nova
+        listing at os_path. This is possible when the client has the etag
+        last sent for the collection, no write request went through the
+        middleware for the tenant since, and Nova lists nothing, deleted
+        items included, as changed since the listing was read. key is the
+        member holding the items of the listing.
+
+        Returns the 304 response or None.
+        """
+        if_none_match = req.environ.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return None
+        validator_key = self._validator_key(req)
+        validator = VALIDATOR_CACHE.get(validator_key)
+        if (validator is None or
+            validator.generation != GENERATIONS.get(self.tenant_id) or
+            not etag_matches(if_none_match, validator.etag)):
+            return None
+
+        now = time.time()
+        query = urlencode({'changes-since': changes_since(validator.since),
+                           'limit': 1})
+        res = self._nova_request(req, self.os_path, query)
+        if res.status_int != 200 or json.loads(res.body).get(key):
+            return None
+        VALIDATOR_CACHE.put(validator_key, Validator(validator.etag,
+            validator.generation, now - CLOCK_SKEW))
+        return self._not_modified(req, validator.etag)
+
+    def _remember_validator(self, req, etag, generation, started):
+        """
+        Keep the etag of a collection read at the started time, in the
+        given tenant generation, for _check_validator
+        """
+        VALIDATOR_CACHE.put(self._validator_key(req),
+                            Validator(etag, generation,
+                                      started - CLOCK_SKEW))
+
+    def _machine_etag_parts(self, server, expand, attached):
+        """
+        The state of a Nova server shown by its machine. Nova bumps the
+        updated time on every change of the server, the expanded volumes
+        have their own state.
+        """
+        parts = [server['id'], server['updated'], server['status']]
+        if 'networkInterfaces' in expand:
+            parts.append(server.get('addresses'))
+        if 'volumes' in expand and attached is not None:
+            parts.append([(entry['id'], entry.get('state'))
+                          for entry in attached.get(server['id'], [])])
+        return parts
+
+    def _collection_response(self, response_data, metadata, etag=None):
+        """
+        Create the response of a collection request. When collections are
+        streamed, the entries are converted and serialized while the
+        response body is being sent.
+        """
+        if self.stream_collections:
+            resp = Response(app_iter=make_response_iter(response_data,
+                                                        self.res_content_type,
+                                                        metadata,
+                                                        self.uri_prefix,
+                                                        self.pretty))
+        else:
+            resp = Response()
+            resp.body = make_response_data(response_data,
+                                           self.res_content_type,
+                                           metadata,
+                                           self.uri_prefix,
+                                           self.pretty)
+        self._fixup_cimi_header(resp)
+        resp.headers['Content-Type'] = self.res_content_type
+        if etag:
+            resp.headers['ETag'] = etag
+        resp.status = 200
+        return resp
+
     def _fixup_cimi_header(self, res):
         if res:
             res.headers['CIMI-Specification-Version'] = '1.0.0'
\ No newline at end of file
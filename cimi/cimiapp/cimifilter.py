@@ -0,0 +1,405 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Parser and compiler for the CIMI $filter query parameter. Like cimiutils,
+# this module must not reference any cimi implementation modules.
+#
+# The grammar is the one from the CIMI specification:
+#
+#   Filter   ::= AndExpr ( 'or' AndExpr )*
+#   AndExpr  ::= Comp ( 'and' Comp )*
+#   Comp     ::= Attribute Op Value | Value Op Attribute | PropExpr
+#              | Attribute | 'not' Comp | '(' Filter ')'
+#   PropExpr ::= 'property[' StringValue ']' Op StringValue
+#   Op       ::= '<' | '<=' | '=' | '>=' | '>' | '!='
+#   Value    ::= IntValue | DateValue | StringValue | BoolValue
+
+from datetime import datetime, timedelta
+import re
+
+TOKEN_RE = re.compile(r'''
+    \s*(?:
+      (?P<string>'[^']*'|"[^"]*")
+     |(?P<date>\d{4}-\d\d-\d\d(?:T\d\d:\d\d(?::\d\d(?:\.\d+)?)?
+                               (?:Z|[+-]\d\d:?\d\d)?)?)
+     |(?P<int>-?\d+)
+     |(?P<op><=|>=|!=|<|>|=)
+     |(?P<paren>[()\[\]])
+     |(?P<name>[A-Za-z_][\w/]*)
+    )''', re.VERBOSE)
+
+DATE_RE = re.compile(r'''^(\d{4})-(\d\d)-(\d\d)
+                         (?:[T\ ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d+))?)?)?
+                         (Z|([+-])(\d\d):?(\d\d))?$''', re.VERBOSE)
+
+FLIPPED_OPS = {'<': '>', '<=': '>=', '=': '=', '!=': '!=',
+               '>': '<', '>=': '<='}
+
+KEYWORDS = ('and', 'or', 'not', 'true', 'false', 'property')
+
+
+class FilterError(ValueError):
+    """The $filter expression can not be parsed"""
+    pass
+
+
+class Date(object):
+    """A date literal, kept as given and as a utc datetime"""
+
+    def __init__(self, text):
+        self.text = text
+        self.value = parse_date(text)
+        if self.value is None:
+            raise FilterError('Invalid date %s' % text)
+
+
+def parse_date(text):
+    """
+    Convert an iso 8601 date string into a naive utc datetime, None if the
+    text is not a date
+    """
+    if not isinstance(text, basestring):
+        return None
+    match = DATE_RE.match(text.strip())
+    if not match:
+        return None
+    parts = match.groups()
+    fraction = parts[6] or '0'
+    try:
+        value = datetime(int(parts[0]), int(parts[1]), int(parts[2]),
+                         int(parts[3] or 0), int(parts[4] or 0),
+                         int(parts[5] or 0), int(fraction[:6].ljust(6, '0')))
+    except ValueError:
+        return None
+    if parts[8]:
+        offset = timedelta(hours=int(parts[9]), minutes=int(parts[10]))
+        if parts[8] == '+':
+            value -= offset
+        else:
+            value += offset
+    return value
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise FilterError('Unexpected character at %d' % pos)
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            value = value[1:-1]
+        elif kind == 'paren' or (kind == 'name' and value in KEYWORDS):
+            kind = value
+        tokens.append((kind, value))
+    return tokens
+
+
+class Parser(object):
+    """
+    Recursive descent parser which turns a $filter expression into a tree
+    of tuples:
+
+        ('or', left, right), ('and', left, right), ('not', node),
+        ('cmp', attribute, op, value), ('prop', key, op, value),
+        ('bool', attribute)
+    """
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def take(self, kind=None):
+        if self.pos >= len(self.tokens):
+            raise FilterError('Unexpected end of filter')
+        token = self.tokens[self.pos]
+        if kind and token[0] != kind and token[1] != kind:
+            raise FilterError('Expected %s but found %s' % (kind, token[1]))
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterError('Empty filter')
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise FilterError('Unexpected %s' % self.tokens[self.pos][1])
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == 'or':
+            self.take()
+            node = ('or', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_comp()
+        while self.peek() == 'and':
+            self.take()
+            node = ('and', node, self.parse_comp())
+        return node
+
+    def parse_value(self):
+        kind, value = self.take()
+        if kind == 'string':
+            return value
+        elif kind == 'int':
+            return int(value)
+        elif kind == 'date':
+            return Date(value)
+        elif kind in ('true', 'false'):
+            return kind == 'true'
+        raise FilterError('Expected a value but found %s' % value)
+
+    def parse_comp(self):
+        kind = self.peek()
+        if kind == 'not':
+            self.take()
+            return ('not', self.parse_comp())
+        elif kind == '(':
+            self.take()
+            node = self.parse_or()
+            self.take(')')
+            return node
+        elif kind == 'property':
+            self.take()
+            self.take('[')
+            key = self.take('string')[1]
+            self.take(']')
+            op = self.take('op')[1]
+            return ('prop', key, op, self.parse_value())
+        elif kind == 'name':
+            attribute = self.take()[1]
+            if self.peek() != 'op':
+                return ('bool', attribute)
+            op = self.take('op')[1]
+            return ('cmp', attribute, op, self.parse_value())
+        else:
+            value = self.parse_value()
+            op = self.take('op')[1]
+            attribute = self.take('name')[1]
+            return ('cmp', attribute, FLIPPED_OPS[op], value)
+
+
+def get_member(entry, attribute):
+    value = entry
+    for key in attribute.split('/'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(actual, op, expected):
+    """
+    Compare an entry value with a filter literal, the entry value is
+    converted to the type of the literal first
+    """
+    if actual is None:
+        return op == '!='
+    try:
+        if isinstance(expected, bool):
+            if isinstance(actual, basestring):
+                actual = actual.lower() == 'true'
+            actual = bool(actual)
+        elif isinstance(expected, (int, long)):
+            actual = int(actual)
+        elif isinstance(expected, Date):
+            actual = parse_date(actual)
+            if actual is None:
+                return op == '!='
+            expected = expected.value
+        elif not isinstance(actual, basestring):
+            actual = str(actual)
+    except (TypeError, ValueError):
+        return op == '!='
+
+    if op == '=':
+        return actual == expected
+    elif op == '!=':
+        return actual != expected
+    elif op == '<':
+        return actual < expected
+    elif op == '<=':
+        return actual <= expected
+    elif op == '>':
+        return actual > expected
+    else:
+        return actual >= expected
+
+
+def compile_node(node):
+    """
+    Turn a filter tree into a function which takes an entry and tells if
+    the entry matches
+    """
+    kind = node[0]
+    if kind == 'and':
+        left, right = compile_node(node[1]), compile_node(node[2])
+        return lambda entry: left(entry) and right(entry)
+    elif kind == 'or':
+        left, right = compile_node(node[1]), compile_node(node[2])
+        return lambda entry: left(entry) or right(entry)
+    elif kind == 'not':
+        inner = compile_node(node[1])
+        return lambda entry: not inner(entry)
+    elif kind == 'bool':
+        attribute = node[1]
+        return lambda entry: compare(get_member(entry, attribute), '=', True)
+    elif kind == 'prop':
+        key, op, value = node[1:]
+        return lambda entry: compare(get_member(entry.get('property'), key),
+                                     op, value)
+    else:
+        attribute, op, value = node[1:]
+        return lambda entry: compare(get_member(entry, attribute), op, value)
+
+
+def conjuncts(node):
+    if node[0] == 'and':
+        return conjuncts(node[1]) + conjuncts(node[2])
+    return [node]
+
+
+class CimiFilter(object):
+    """
+    The $filter expressions of a request, several of them are and-ed
+    """
+
+    def __init__(self, expressions):
+        self.tree = None
+        for text in expressions:
+            node = Parser(text).parse()
+            if self.tree is None:
+                self.tree = node
+            else:
+                self.tree = ('and', self.tree, node)
+
+    def attributes(self):
+        """
+        The top level entry attributes the filter looks at
+        """
+        found = set()
+
+        def walk(node):
+            if node[0] in ('and', 'or'):
+                walk(node[1])
+                walk(node[2])
+            elif node[0] == 'not':
+                walk(node[1])
+            elif node[0] == 'prop':
+                found.add('property')
+            else:
+                found.add(node[1].split('/')[0])
+        walk(self.tree)
+        return found
+
+    def pushdown(self, rules):
+        """
+        Split the filter into backend query parameters and a residual
+        predicate. rules maps an attribute to a function taking the
+        operator and the literal, which returns None when the backend can
+        not evaluate the comparison, otherwise the query parameters and
+        whether the backend evaluates it exactly.
+
+        Only top level and-ed comparisons are pushed down. Comparisons the
+        backend only narrows down stay in the residual predicate, which is
+        None when nothing is left to check.
+        """
+        params = {}
+        residual = []
+        for node in conjuncts(self.tree):
+            pushed = None
+            if node[0] == 'cmp' and node[1] in rules:
+                pushed = rules[node[1]](node[2], node[3])
+            if pushed:
+                query, exact = pushed
+                if not [k for k in query if k in params]:
+                    params.update(query)
+                    if exact:
+                        continue
+            residual.append(node)
+
+        if not residual:
+            return params, None
+        tree = residual[0]
+        for node in residual[1:]:
+            tree = ('and', tree, node)
+        return params, compile_node(tree)
+
+    def compile(self):
+        return compile_node(self.tree)
+
+
+def get_filter(params):
+    """
+    Build the filter of a request from its $filter query parameters, None
+    when there is no filter. Raises FilterError for invalid expressions.
+    """
+    expressions = [text for text in params.getall('$filter') if text.strip()]
+    if not expressions:
+        return None
+    return CimiFilter(expressions)
+
+
+def equal_rule(param, exact=True, pattern=None):
+    """
+    Push attribute = 'string' down as param=string. When pattern is given,
+    only strings matching it are pushed down.
+    """
+    def rule(op, value):
+        if op != '=' or not isinstance(value, basestring):
+            return None
+        if pattern and not re.match(pattern, value):
+            return None
+        return {param: value}, exact
+    return rule
+
+
+def state_rule(param, state_map, exact=True):
+    """
+    Push state = 'STATE' down as param=<backend status>, only when a single
+    backend status maps to the cimi state. exact is False for backends
+    which match more statuses than the one sent.
+    """
+    def rule(op, value):
+        if op != '=' or not isinstance(value, basestring):
+            return None
+        statuses = [k for k, v in state_map.items() if v == value]
+        if len(statuses) != 1:
+            return None
+        return {param: statuses[0]}, exact
+    return rule
+
+
+def since_rule(param):
+    """
+    Push attribute > date and attribute >= date down as param=date, the
+    backend returns a superset so the comparison is checked again
+    """
+    def rule(op, value):
+        if op not in ('>', '>=') or not isinstance(value, Date):
+            return None
+        return {param: value.text}, False
+    return rule
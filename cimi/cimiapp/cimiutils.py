@@ -18,11 +18,20 @@
 
 from webob import Request, Response
 from nova.openstack.common import log as logging
-from eventlet.green.httplib import HTTPConnection, HTTPSConnection
+from httppool import ConnectionPool
+from metrics import METRICS
+from singleflight import FLIGHTS
+from timing import ENV_KEY as TIMINGS_KEY, timed
+from urllib import urlencode
+import re
+import time
 
 CIMI_CONTENT_TYPES = ['application/json', 'application/xml']
 LOG = logging.getLogger(__name__)
 
+# keep-alive connections shared by every access_resource call
+CONNECTION_POOL = ConnectionPool()
+
 
 def get_err_response(code):
     """
@@ -58,6 +67,12 @@ def concat(*args):
     return ''.join(args)
 
 
+# the best match of each accept or content type header value seen so far,
+# clients send the same few values so the table stays small
+BEST_MATCHES = {}
+BEST_MATCHES_SIZE = 256
+
+
 def best_match(content_type):
     """
     Use webob request accept member to determine what is the best match
@@ -65,12 +80,167 @@ def best_match(content_type):
     and response content type
     """
 
+    match = BEST_MATCHES.get(content_type)
+    if match is not None:
+        return match
     try:
         req = Request.blank('/')
         req.accept = content_type.lower()
-        return req.accept.best_match(CIMI_CONTENT_TYPES) or 'application/json'
+        match = req.accept.best_match(CIMI_CONTENT_TYPES) or \
+            'application/json'
     except:
-        return 'application/json'
+        match = 'application/json'
+    if len(BEST_MATCHES) >= BEST_MATCHES_SIZE:
+        BEST_MATCHES.clear()
+    BEST_MATCHES[content_type] = match
+    return match
+
+
+def wants_pretty(params, accept, default=False):
+    """
+    Tell if the json response should be indented. Clients ask for it with
+    the pretty query parameter or with a pretty parameter of the media type
+    in the Accept header, such as application/json; pretty=true
+    """
+    value = params.get('pretty')
+    if value is None and 'pretty' in accept:
+        for media_range in accept.split(','):
+            for param in media_range.split(';')[1:]:
+                name, _, param_value = param.partition('=')
+                if name.strip().lower() == 'pretty':
+                    value = param_value.strip().strip('"') or 'true'
+    if value is None:
+        return default
+    return value.lower() in ('true', '1', 'yes', 'on', '')
+
+
+def conf_true(conf, name, default=False):
+    """
+    Read a boolean option from the filter configuration
+    """
+    value = conf.get(name)
+    if value is None:
+        return default
+    return str(value).lower() in ('true', '1', 'yes', 'on')
+
+
+def get_paging(params):
+    """
+    Parse the CIMI $first and $last query parameters, both are 1 based
+    and inclusive. Returns None when no paging is asked for, otherwise
+    (first, last) where last is None when only $first is given.
+    Raises ValueError when the values are not valid.
+    """
+    first = params.get('$first')
+    last = params.get('$last')
+    if first is None and last is None:
+        return None
+
+    first = int(first) if first is not None else 1
+    last = int(last) if last is not None else None
+    if first < 1 or (last is not None and last < first):
+        raise ValueError('Invalid $first or $last')
+    return first, last
+
+
+def paginate(items, paging):
+    """
+    Cut the requested page out of a complete list of items. Returns the
+    page and whether more items follow it.
+    """
+    if not paging:
+        return items, False
+    first, last = paging
+    if last is None:
+        return items[first - 1:], False
+    return items[first - 1:last], len(items) > last
+
+
+# members every selected resource or entry keeps
+SELECT_KEEP = ('id', 'resourceURI', 'operations')
+
+
+def get_names(params, key):
+    """
+    Parse the comma separated attribute names of the $select or $expand
+    query parameters. Returns None for '*', otherwise the set of names.
+    Raises ValueError when a name is not valid.
+    """
+    names = set()
+    for value in params.getall(key):
+        for name in value.split(','):
+            name = name.strip()
+            if name == '*':
+                return None
+            elif not name:
+                continue
+            elif not re.match(r'^[A-Za-z]\w*$', name):
+                raise ValueError('Invalid %s' % key)
+            names.add(name)
+    return names
+
+
+def get_select(params):
+    """
+    Parse the CIMI $select query parameters into the set of selected
+    attribute names. Returns None when every attribute is wanted.
+    Raises ValueError when a name is not valid.
+    """
+    return get_names(params, '$select') or None
+
+
+def get_expand(params, expandable):
+    """
+    Parse the CIMI $expand query parameters into the set of attributes to
+    expand, only the expandable ones are kept.
+    Raises ValueError when a name is not valid.
+    """
+    names = get_names(params, '$expand')
+    if names is None:
+        return set(expandable)
+    return names & set(expandable)
+
+
+def get_wait(params, state_map, max_timeout):
+    """
+    Parse the waitFor and timeout query parameters of a resource read.
+    waitFor holds one or more comma separated states of the state map,
+    timeout the seconds to wait at most, max_timeout when it is not given.
+    Returns None when no wait is asked for, otherwise the set of states
+    and the timeout. Raises ValueError when the values are not valid.
+    """
+    value = params.get('waitFor')
+    if not value:
+        return None
+    states = set(state.strip().upper() for state in value.split(',')
+                 if state.strip())
+    if not states or not states <= set(state_map.values()):
+        raise ValueError('Invalid waitFor')
+    timeout = float(params.get('timeout', max_timeout))
+    if not timeout >= 0:
+        raise ValueError('Invalid timeout')
+    return states, min(timeout, max_timeout)
+
+
+def carried_query(params):
+    """
+    Encode the $filter, $select and $expand parameters of a request again,
+    so that links to other pages of a collection keep them
+    """
+    query = []
+    for key in ('$filter', '$select', '$expand'):
+        query.extend([(key, value) for value in params.getall(key)])
+    return urlencode(query)
+
+
+def project(data, select):
+    """
+    Keep only the selected members of a resource or an entry
+    """
+    if select is None:
+        return data
+    return dict([(k, v) for k, v in data.items()
+                 if k in select or k in SELECT_KEEP])
 
 
 def get_href(data, member):
@@ -185,60 +355,82 @@ def map_image_state(value):
 
 
 def access_resource(env, method, path, get_body=False,
-                    query_string=None, body=None):
+                    query_string=None, body=None, backend='cinder'):
     """
     Use this method to send a http request
     If the resource exists, then it should return True with headers.
     If the resource does not exist, then it should return False with None
     headers
     If the get_body is set to True, the response body will also be returned
+    backend names the service in the metrics
+    Identical GET requests made at the same time with the same auth token
+    are sent once and share the response.
+    """
+
+    method = 'GET' if not method else method
+    with timed(env.get(TIMINGS_KEY), backend,
+               ' '.join([method, path or env.get('PATH_INFO', '')])):
+        token = env.get('HTTP_X_AUTH_TOKEN')
+        if method != 'GET' or not token or not FLIGHTS.enabled:
+            return send_request(env, method, path, get_body, query_string,
+                                body, backend)
+
+        key = (backend, token, env.get('HTTP_HOST'), env.get('SERVER_PORT'),
+               path or env.get('PATH_INFO'), query_string, get_body)
+        status, values, body, status_code = FLIGHTS.do(key, send_request,
+            env, method, path, get_body, query_string, body, backend)
+        return status, dict(values), body, status_code
+
+
+def send_request(env, method, path, get_body, query_string, body, backend):
+    """
+    Send the http request of access_resource
     """
 
     # Create a new Request
     req = Request(env)
-    if req.scheme.lower() == 'https':
-        connection = HTTPSConnection
-        ssl = True
-    else:
-        connection = HTTPConnection
-        ssl = False
+    key = (req.scheme.lower(), req.server_name, int(req.server_port))
 
     headers = {}
     headers['Accept'] = 'application/json'
     for header, value in req.headers.items():
         headers[header] = value
+    # the connection is pooled, so never ask the backend to close it
+    headers.pop('Connection', None)
 
-    method = 'GET' if not method else method
     path = req.path if not path else path
+    if query_string:
+        path = '?'.join([path, query_string])
 
-    conn = connection(req.server_name, req.server_port)
+    start = time.time()
+    try:
+        conn, res = CONNECTION_POOL.request(key, method, path, body, headers)
+    except Exception:
+        METRICS.backend_done(backend, method, 'error', time.time() - start)
+        raise
+    try:
+        values = {}
+        header_list = res.getheaders()
+        for header in header_list:
+            values[header[0]] = header[1]
 
-    conn.request(method, path, body, headers)
-    res = conn.getresponse()
+        # the body is always drained so that the connection can be reused
+        length = res.getheader('content-length')
+        if length:
+            body = res.read(int(length))
+        else:
+            body = res.read()
+    finally:
+        CONNECTION_POOL.release(key, conn, res)
+    METRICS.backend_done(backend, method, str(res.status),
+                         time.time() - start)
 
     if res.status == 404 or res.status == 413:
-        conn.close()
         return False, {}, None, res.status
     elif (res.status == 200 or res.status == 204 or
           res.status == 201):
-        values = {}
-        header_list = res.getheaders()
-        for header in header_list:
-            values[header[0]] = header[1]
-        if get_body:
-            length = res.getheader('content-length')
-            if length:
-                body = res.read(int(length))
-            else:
-                body = res.read()
-        else:
+        if not get_body:
             body = ""
-        conn.close()
         return True, values, body, res.status
     else:
-        values = {}
-        header_list = res.getheaders()
-        for header in header_list:
-            values[header[0]] = header[1]
-        conn.close()
         return True, values, None, res.status
@@ -29,9 +29,8 @@ class CloudEntryPointCtrler(Controller):
     """
     Handles machine image request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(CloudEntryPointCtrler, self).__init__(conf, app, req,
-                                                    tenant_id, *args)
+    def __init__(self, conf, app):
+        super(CloudEntryPointCtrler, self).__init__(conf, app)
         self.entity_uri = 'CloudEntryPoint'
         self.metadata = Consts.CLOUDENTRYPOINT_METADATA
 
@@ -59,6 +58,9 @@ class CloudEntryPointCtrler(Controller):
         body['volumes'] = {'href':
                 '/'.join([self.tenant_id, 'VolumeCollection'])}
 
+        body['jobs'] = {'href':
+                '/'.join([self.tenant_id, 'JobCollection'])}
+
         if self.res_content_type == 'application/xml':
             response_data = {'CloudEntryPoint': body}
         else:
@@ -69,7 +71,8 @@ class CloudEntryPointCtrler(Controller):
         new_content = make_response_data(response_data,
                                          self.res_content_type,
                                          self.metadata,
-                                         self.uri_prefix)
+                                         self.uri_prefix,
+                                         self.pretty)
         resp = Response()
         self._fixup_cimi_header(resp)
         resp.headers['Content-Type'] = self.res_content_type
@@ -0,0 +1,144 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# gzip and deflate compression of the cimi responses. Like cimiutils, this
+# module must not reference any cimi implementation modules.
+
+import zlib
+
+# the encodings in the order of preference
+ENCODINGS = ('gzip', 'deflate')
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/xml', 'text/plain')
+
+
+def choose_encoding(accept_encoding):
+    """
+    Pick the encoding of the response from an Accept-Encoding header value,
+    None when the client accepts neither gzip nor deflate
+    """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        parts = coding.split(';')
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressobj(encoding, level):
+    """
+    gzip gets the gzip header and trailer, deflate is the zlib format
+    """
+    if encoding == 'gzip':
+        wbits = 16 + zlib.MAX_WBITS
+    else:
+        wbits = zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def add_vary(headers, name):
+    vary = headers.get('Vary')
+    if not vary:
+        headers['Vary'] = name
+    elif name.lower() not in [v.strip().lower() for v in vary.split(',')]:
+        headers['Vary'] = '%s, %s' % (vary, name)
+
+
+class CompressedBody(object):
+    """
+    Compresses a WSGI response body chunk by chunk as it is sent
+    """
+
+    def __init__(self, body, compressor):
+        self.body = body
+        self.compressor = compressor
+
+    def __iter__(self):
+        for chunk in self.body:
+            data = self.compressor.compress(chunk)
+            if data:
+                yield data
+        yield self.compressor.flush()
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+class Compression(object):
+    """
+    Negotiates and applies the compression of the responses.
+
+    A response with a Content-Length is compressed at once when it has at
+    least compression_min_size bytes, a streamed response is always
+    compressed while it is sent.
+    """
+
+    def __init__(self, conf):
+        value = conf.get('compression_enabled')
+        self.enabled = value is None or \
+            str(value).lower() in ('true', '1', 'yes', 'on')
+        self.min_size = int(conf.get('compression_min_size', 1024))
+        self.level = int(conf.get('compression_level', 6))
+
+    def compress(self, env, res):
+        """
+        Give the response to send, res itself with its body compressed
+        when the client accepts it
+        """
+        if not self.enabled:
+            return res
+        content_type = res.headers.get('Content-Type') or ''
+        if content_type.split(';')[0].strip().lower() not in \
+                COMPRESSIBLE_TYPES:
+            return res
+        # caches must keep the encoded and the plain responses apart
+        add_vary(res.headers, 'Accept-Encoding')
+        if res.headers.get('Content-Encoding') or \
+                env.get('REQUEST_METHOD') == 'HEAD' or \
+                res.status_int in (204, 304) or res.status_int < 200:
+            return res
+
+        encoding = choose_encoding(env.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encoding:
+            return res
+
+        length = res.content_length
+        if length is not None:
+            if length < self.min_size:
+                return res
+            compressor = compressobj(encoding, self.level)
+            res.body = compressor.compress(res.body) + compressor.flush()
+        else:
+            res.app_iter = CompressedBody(res.app_iter,
+                                          compressobj(encoding, self.level))
+            res.content_length = None
+        res.headers['Content-Encoding'] = encoding
+        return res
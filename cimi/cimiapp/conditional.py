@@ -0,0 +1,100 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Entity tags and the tenant state used to answer conditional requests.
+# Like cimiutils, this module must not reference any cimi implementation
+# modules.
+
+import hashlib
+import threading
+import time
+
+# seconds taken off the time a listing was read, so that the clocks of
+# the backends may be a little behind ours
+CLOCK_SKEW = 5
+
+
+def make_etag(*parts):
+    """
+    Make a weak entity tag from the parts of a response. The tags are weak
+    because the same tag is sent whatever the content coding of the body.
+    """
+    digest = hashlib.md5()
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        elif not isinstance(part, str):
+            part = repr(part)
+        digest.update(part)
+        digest.update('\0')
+    return 'W/"%s"' % digest.hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an etag with the tags of an If-None-Match header
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    value = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == value:
+            return True
+    return False
+
+
+def changes_since(since):
+    """
+    Format a time for the changes-since parameter of Nova listings
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(since))
+
+
+class Generations(object):
+    """
+    A counter per tenant, bumped for every request which may change the
+    resources of the tenant
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id):
+        return self._counters.get(tenant_id, 0)
+
+    def bump(self, tenant_id):
+        with self._lock:
+            self._counters[tenant_id] = self._counters.get(tenant_id, 0) + 1
+
+
+class Validator(object):
+    """
+    The etag last sent for a collection, the tenant generation it was made
+    in and a time from which on the listing is known to be unchanged
+    """
+    __slots__ = ('etag', 'generation', 'since')
+
+    def __init__(self, etag, generation, since):
+        self.etag = etag
+        self.generation = generation
+        self.since = since
+
+
+GENERATIONS = Generations()
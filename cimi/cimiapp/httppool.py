@@ -0,0 +1,167 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Keep-alive connection pool used by access_resource. Like cimiutils, this
+# module must not reference any cimi implementation modules.
+
+import socket
+import threading
+import time
+
+# the green httplib is a copy of the module, the exceptions its connections
+# raise are not those of the standard one
+from eventlet.green import httplib
+from eventlet.green import select
+
+# the methods which can be sent again when their response was lost
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+
+class ConnectionPool(object):
+    """
+    Per-process pool of idle keep-alive connections keyed by
+    (scheme, host, port).
+
+    At most max_size idle connections are kept for each key, and an idle
+    connection older than idle_timeout seconds is closed instead of being
+    reused. A reused connection which turns out to be stale is replaced by
+    a fresh one and the request is retried once: GET and HEAD requests
+    whatever failed, other requests only when they could not be sent.
+    """
+
+    def __init__(self, max_size=10, idle_timeout=60):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def configure(self, conf):
+        """
+        Pick up the pool settings from the filter configuration
+        """
+        self.max_size = int(conf.get('pool_max_size', self.max_size))
+        self.idle_timeout = float(conf.get('pool_idle_timeout',
+                                           self.idle_timeout))
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port)
+        else:
+            return httplib.HTTPConnection(host, port)
+
+    def _is_stale(self, conn):
+        """
+        An idle keep-alive socket should never be readable, if it is then
+        the peer has either closed it or sent something unexpected.
+        """
+        if conn.sock is None:
+            return True
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return True
+        return bool(readable)
+
+    def get(self, key):
+        """
+        Return a connection for the key and whether it was reused
+        """
+        stale = []
+        conn = None
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                one, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    conn = one
+                    break
+                stale.append(one)
+        for one in stale:
+            one.close()
+
+        if conn and not self._is_stale(conn):
+            self.hits += 1
+            return conn, True
+        elif conn:
+            conn.close()
+
+        self.misses += 1
+        return self._connect(key), False
+
+    def put(self, key, conn):
+        """
+        Give a connection back to the pool, close it if the pool is full
+        """
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_size:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def request(self, key, method, path, body, headers):
+        """
+        Send a request and return the connection and the response. The
+        caller must read the response and then call release.
+        """
+        conn, reused = self.get(key)
+        sent = False
+        try:
+            conn.request(method, path, body, headers)
+            sent = True
+            return conn, conn.getresponse()
+        except (socket.error, httplib.HTTPException):
+            conn.close()
+            # the peer may have acted on a request it got in full, only
+            # idempotent ones are sent again then
+            if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                raise
+
+        # the pooled connection was dropped by the peer, retry once
+        self.retries += 1
+        conn = self._connect(key)
+        try:
+            conn.request(method, path, body, headers)
+            return conn, conn.getresponse()
+        except (socket.error, httplib.HTTPException):
+            conn.close()
+            raise
+
+    def release(self, key, conn, res):
+        """
+        Return the connection to the pool once its response has been read
+        """
+        if res.will_close or not res.isclosed():
+            conn.close()
+        else:
+            self.put(key, conn)
+
+    def stats(self):
+        with self._lock:
+            idle = sum([len(conns) for conns in self._idle.values()])
+        return {'hits': self.hits, 'misses': self.misses,
+                'retries': self.retries, 'idle': idle}
+
+    def clear(self):
+        with self._lock:
+            all_idle = self._idle
+            self._idle = {}
+        for idle in all_idle.values():
+            for conn, last_used in idle:
+                conn.close()
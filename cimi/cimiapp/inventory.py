@@ -0,0 +1,88 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova.openstack.common import log as logging
+from webob import Request
+import json
+
+from cimibase import Controller
+from conditional import changes_since
+from snapshot import ReadError
+
+LOG = logging.getLogger(__name__)
+
+
+class InventoryReader(Controller):
+    """
+    Reads the inventory of a tenant for its snapshot, with the environ of
+    a request the tenant made
+    """
+    def __init__(self, conf, app):
+        super(InventoryReader, self).__init__(conf, app)
+        self.entity_uri = 'Inventory'
+
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers/detail' % (tenant_id)
+
+    def __call__(self, tenant_id, env, since):
+        req = Request(env)
+        return self.bind(req, tenant_id).read(req, since)
+
+    def servers(self, tenant_id, env, since):
+        """
+        Return the servers of the tenant changed since the given time,
+        deleted ones included
+        """
+        req = Request(env)
+        return self.bind(req, tenant_id).read_servers(req, since)
+
+    def volumes(self, tenant_id, env):
+        """
+        Return the volumes of the tenant
+        """
+        req = Request(env)
+        return self.bind(req, tenant_id).read_volumes(req)
+
+    def read_servers(self, req, since):
+        """
+        Return the servers changed since the given time, all of them when
+        since is None. Every page of the Nova listing is read.
+        """
+        params = {}
+        if since is not None:
+            params['changes-since'] = changes_since(since)
+        res, servers, has_more = self._get_nova_list(req, self.os_path,
+            'servers', (1, None), params)
+        if res is not None:
+            raise ReadError(res.status_int)
+        return servers
+
+    def read(self, req, since):
+        """
+        Return the servers changed since the given time, all of them when
+        since is None, the flavor catalog or None and the volumes
+        """
+        servers = self.read_servers(req, since)
+        flavors = self._read_flavors(req)
+        return servers, flavors, self.read_volumes(req)
+
+    def read_volumes(self, req):
+        """
+        Return the volumes from one Cinder volumes/detail listing
+        """
+        status, headers, body, status_code = self._volume_request(req,
+            'GET', '/%s/volumes/detail' % self.tenant_id)
+        if not status:
+            raise ReadError(status_code)
+        return json.loads(body).get('volumes', [])
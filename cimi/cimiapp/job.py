@@ -0,0 +1,153 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+from nova.openstack.common import log as logging
+from webob import Response
+
+from cimibase import Controller, Consts
+from cimibase import make_response_data
+from cimiutils import get_err_response
+from cimiutils import get_paging, get_select, project, carried_query
+from cimifilter import get_filter
+from conditional import changes_since
+from jobs import JOBS
+from responsecache import authorized
+
+LOG = logging.getLogger(__name__)
+
+
+def make_job(tenant_id, job):
+    """
+    Convert a job of the job table into a cimi job
+    """
+    body = {}
+    body['id'] = '/'.join([tenant_id, 'Job', job.id])
+    body['created'] = changes_since(job.created)
+    body['updated'] = changes_since(job.status_changed)
+    body['targetResource'] = {'href': job.target}
+    body['action'] = job.action
+    body['status'] = job.status
+    body['progress'] = job.progress
+    if job.return_code is not None:
+        body['returnCode'] = job.return_code
+    if job.status_message:
+        body['statusMessage'] = job.status_message
+    body['timeOfStatusChange'] = changes_since(job.status_changed)
+    body['isCancellable'] = 'false'
+    return body
+
+
+class JobCtrler(Controller):
+    """
+    Handles job request.
+    """
+    def __init__(self, conf, app):
+        super(JobCtrler, self).__init__(conf, app)
+        self.entity_uri = 'Job'
+        self.metadata = Consts.JOB_METADATA
+
+    # Use GET to handle all container read related operations.
+    def GET(self, req, *parts):
+        """
+        Handle GET job request, answered from the job table. Nova is not
+        asked, only requests authenticated for the tenant get its jobs.
+        """
+
+        if not authorized(req.environ, self.tenant_id):
+            return get_err_response('AccessDenied')
+
+        try:
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        job = JOBS.get(self.tenant_id, parts[0]) if parts else None
+        if job is None:
+            return get_err_response('NotFound')
+
+        body = project(make_job(self.tenant_id, job), select)
+        if self.res_content_type == 'application/xml':
+            response_data = {'Job': body}
+        else:
+            body['resourceURI'] = '/'.join([self.uri_prefix,
+                                            self.entity_uri])
+            response_data = body
+
+        new_content = make_response_data(response_data,
+                                         self.res_content_type,
+                                         self.metadata,
+                                         self.uri_prefix,
+                                         self.pretty)
+        resp = Response()
+        self._fixup_cimi_header(resp)
+        resp.headers['Content-Type'] = self.res_content_type
+        resp.status = 200
+        resp.body = new_content
+        return resp
+
+
+class JobColCtrler(Controller):
+    """
+    Handles job collection request.
+    """
+    def __init__(self, conf, app):
+        super(JobColCtrler, self).__init__(conf, app)
+        self.entity_uri = 'JobCollection'
+        self.metadata = Consts.JOB_COL_METADATA
+
+    def _make_entry(self, job):
+        """
+        Convert one job into a job collection entry
+        """
+        entry = make_job(self.tenant_id, job)
+        if self.res_content_type != 'application/xml':
+            entry['resourceURI'] = '/'.join([self.uri_prefix, 'Job'])
+        return entry
+
+    # Use GET to handle all container read related operations.
+    def GET(self, req, *parts):
+        """
+        Handle GET job collection request, answered from the job table.
+        Only requests authenticated for the tenant get its jobs.
+        """
+
+        if not authorized(req.environ, self.tenant_id):
+            return get_err_response('AccessDenied')
+
+        try:
+            paging = get_paging(req.GET)
+            cimi_filter = get_filter(req.GET)
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        residual = cimi_filter.compile() if cimi_filter else None
+        body = {}
+        body['id'] = '/'.join([self.tenant_id, self.entity_uri])
+        body['jobs'], has_more = self._make_entries(
+            JOBS.jobs(self.tenant_id), self._make_entry, paging, residual,
+            select=select)
+
+        body['count'] = len(body['jobs'])
+        self._add_paging_ops(body, body['id'], paging, has_more,
+                             extra=carried_query(req.GET))
+
+        body['resourceURI'] = '/'.join([self.uri_prefix, self.entity_uri])
+        if self.res_content_type == 'application/xml':
+            response_data = {'Collection': body}
+        else:
+            response_data = body
+
+        return self._collection_response(response_data, self.metadata)
@@ -0,0 +1,334 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# The CIMI jobs of the asynchronous machine and volume operations, completed
+# by a background watcher. Like cimiutils, this module must not reference
+# any cimi implementation modules.
+
+from nova.openstack.common import log as logging
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+import uuid
+
+import eventlet
+from eventlet import tpool
+from eventlet.greenpool import GreenPool
+
+from cimiutils import map_machine_state, map_volume_state
+from conditional import CLOCK_SKEW, GENERATIONS
+from snapshot import ReadError, reader_env
+
+LOG = logging.getLogger(__name__)
+
+# the state of a resource of each kind
+STATE_OF = {'servers': lambda server: map_machine_state(server['status']),
+            'volumes': lambda volume: map_volume_state(volume['status'])}
+
+
+class Job(object):
+    """
+    One asynchronous operation of a tenant on the machine or volume target.
+    kind is servers or volumes and resource_id the backend id of the
+    resource the job watches. The job succeeds once the resource is in one
+    of the states, or is gone when states is empty, and fails when it is in
+    the ERROR state. updated is the Nova updated time of the server before
+    the operation, the server has not moved as long as it is unchanged.
+    """
+    FIELDS = ('id', 'tenant_id', 'action', 'target', 'kind', 'resource_id',
+              'states', 'updated', 'status', 'progress', 'return_code',
+              'status_message', 'created', 'status_changed')
+
+    def __init__(self, job_id, tenant_id, action, target, kind, resource_id,
+                 states, updated=None):
+        self.id = job_id
+        self.tenant_id = tenant_id
+        self.action = action
+        self.target = target
+        self.kind = kind
+        self.resource_id = resource_id
+        self.states = list(states)
+        self.updated = updated
+        self.status = 'RUNNING'
+        self.progress = 0
+        self.return_code = None
+        self.status_message = None
+        self.created = time.time()
+        self.status_changed = self.created
+
+    @property
+    def running(self):
+        return self.status == 'RUNNING'
+
+    def finish(self, status, return_code, message=None):
+        self.status = status
+        self.progress = 100
+        self.return_code = return_code
+        self.status_message = message
+        self.status_changed = time.time()
+
+    def check(self, resource):
+        """
+        Finish the job if the resource as last read, None when the backend
+        does not list it, completes it. Returns whether it did.
+        """
+        if resource is None or resource.get('status') == 'DELETED':
+            if self.states:
+                return False
+            self.finish('SUCCESS', 0)
+            return True
+        if self.updated is not None and \
+           resource.get('updated') == self.updated:
+            return False
+        state = STATE_OF[self.kind](resource)
+        if state in self.states:
+            self.finish('SUCCESS', 0)
+            return True
+        if state == 'ERROR':
+            self.finish('FAILED', 1, 'the resource is in the ERROR state')
+            return True
+        return False
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['id'], data['tenant_id'], data['action'],
+                  data['target'], data['kind'], data['resource_id'],
+                  data['states'], data.get('updated'))
+        for name in cls.FIELDS:
+            setattr(job, name, data.get(name))
+        return job
+
+
+class JobTable(object):
+    """
+    Keeps the jobs of all tenants, at most size of them. When the table is
+    full the oldest finished job is dropped, the oldest job when none is
+    finished. With a file the changed table is written to it once per
+    poll_interval by the watcher, in a native thread, and read again when
+    the middleware starts. Running jobs read from the file are watched
+    again once their tenant starts another job.
+
+    One green thread watches the running jobs every poll_interval seconds:
+    the servers of a tenant are read with one Nova changes-since listing,
+    its volumes with one Cinder listing. Jobs still running after timeout
+    seconds fail. A finished job changed the resources of its tenant, the
+    tenant generation is bumped.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.size = 1000
+        self.path = None
+        self.poll_interval = 2.0
+        self.timeout = 600.0
+        self.servers_reader = None
+        self.volumes_reader = None
+        self.polls = 0
+        self.failures = 0
+        self.succeeded = 0
+        self.failed = 0
+        self._jobs = OrderedDict()
+        self._envs = {}
+        self._read_at = {}
+        self._polling = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def configure(self, conf, servers_reader, volumes_reader):
+        """
+        Pick up the job settings from the filter configuration. The readers
+        take the tenant id and an environ, servers_reader also the time
+        since which servers changed, and raise ReadError.
+        """
+        value = conf.get('jobs_enabled')
+        if value is not None:
+            self.enabled = str(value).lower() in ('true', '1', 'yes', 'on')
+        self.size = int(conf.get('job_table_size', self.size))
+        self.path = conf.get('job_file') or None
+        self.poll_interval = float(conf.get('job_poll_interval',
+                                            self.poll_interval))
+        self.timeout = float(conf.get('job_timeout', self.timeout))
+        self.servers_reader = servers_reader
+        self.volumes_reader = volumes_reader
+        if self.enabled and self.path:
+            self._load()
+
+    def create(self, tenant_id, env, action, target, kind, resource_id,
+               states, updated=None):
+        """
+        Start a job of the tenant, env is the environ of the request which
+        started the operation. Returns the job, None when jobs are off.
+        """
+        if not self.enabled:
+            return None
+        job = Job(uuid.uuid4().hex, tenant_id, action, target, kind,
+                  resource_id, states, updated)
+        with self._lock:
+            self._envs[tenant_id] = reader_env(env)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.size:
+                self._evict()
+            self._dirty = True
+            if self._poller is None:
+                self._poller = eventlet.spawn(self._poll)
+        return job
+
+    def get(self, tenant_id, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.tenant_id != tenant_id:
+            return None
+        return job
+
+    def jobs(self, tenant_id):
+        """
+        Return the jobs of the tenant, oldest first
+        """
+        return [job for job in self._jobs.values()
+                if job.tenant_id == tenant_id]
+
+    def _evict(self):
+        for job_id, job in self._jobs.iteritems():
+            if not job.running:
+                del self._jobs[job_id]
+                return
+        self._jobs.popitem(last=False)
+
+    def _poll(self):
+        pool = GreenPool(4)
+        while True:
+            try:
+                self._expire(time.time())
+                for tenant_id in self._due():
+                    pool.spawn_n(self._refresh, tenant_id)
+                self._save()
+            except Exception:
+                LOG.exception('job watcher failed')
+            eventlet.sleep(self.poll_interval)
+
+    def _due(self):
+        with self._lock:
+            due = set(job.tenant_id for job in self._jobs.values()
+                      if job.running and job.tenant_id in self._envs)
+            due -= self._polling
+            self._polling.update(due)
+        return due
+
+    def _expire(self, now):
+        expired = [job for job in self._jobs.values()
+                   if job.running and now - job.created > self.timeout]
+        for job in expired:
+            job.finish('FAILED', 1, 'timed out')
+        self._finished(expired)
+
+    def _refresh(self, tenant_id):
+        env = self._envs[tenant_id]
+        try:
+            running = [job for job in self._jobs.values()
+                       if job.tenant_id == tenant_id and job.running]
+            done = []
+            servers = [job for job in running if job.kind == 'servers']
+            if servers:
+                started = time.time()
+                since = self._read_at.get(tenant_id) or \
+                    min(job.created for job in servers)
+                listed = dict((server['id'], server) for server in
+                              self.servers_reader(tenant_id, env,
+                                                  since - CLOCK_SKEW))
+                # a server missing from a changes-since listing did not
+                # change, only a deleted one tells it is gone
+                done.extend(job for job in servers
+                            if job.resource_id in listed and
+                            job.check(listed[job.resource_id]))
+                self._read_at[tenant_id] = started
+            volumes = [job for job in running if job.kind == 'volumes']
+            if volumes:
+                listed = dict((volume['id'], volume) for volume in
+                              self.volumes_reader(tenant_id, env))
+                done.extend(job for job in volumes
+                            if job.check(listed.get(job.resource_id)))
+            self.polls += 1
+            self._finished(done)
+        except ReadError as error:
+            self.failures += 1
+            LOG.info('jobs of %s not read: %s', tenant_id, error)
+        except Exception:
+            self.failures += 1
+            LOG.exception('jobs of %s failed', tenant_id)
+        finally:
+            with self._lock:
+                self._polling.discard(tenant_id)
+                if not any(job.running and job.tenant_id == tenant_id
+                           for job in self._jobs.values()):
+                    self._read_at.pop(tenant_id, None)
+
+    def _finished(self, jobs):
+        if not jobs:
+            return
+        for job in jobs:
+            if job.status == 'SUCCESS':
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            GENERATIONS.bump(job.tenant_id)
+        self._dirty = True
+
+    def _save(self):
+        """
+        Write the table to the file when it changed since it was last
+        written, the file is written by a native thread to keep the hub
+        running
+        """
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            self._dirty = False
+            data = [job.to_dict() for job in self._jobs.values()]
+        tpool.execute(self._write, data)
+
+    def _write(self, data):
+        temp = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with open(temp, 'w') as job_file:
+                json.dump(data, job_file)
+            os.rename(temp, self.path)
+        except (IOError, OSError):
+            LOG.exception('jobs not written to %s', self.path)
+
+    def _load(self):
+        try:
+            with open(self.path) as job_file:
+                data = json.load(job_file)
+        except IOError:
+            return
+        except ValueError:
+            LOG.warn('jobs in %s not readable', self.path)
+            return
+        for item in data[-self.size:]:
+            job = Job.from_dict(item)
+            self._jobs[job.id] = job
+
+    def stats(self):
+        running = sum(1 for job in self._jobs.values() if job.running)
+        return {'jobs': len(self._jobs), 'running': running,
+                'succeeded': self.succeeded, 'failed': self.failed,
+                'polls': self.polls, 'failures': self.failures}
+
+
+JOBS = JobTable()
@@ -0,0 +1,70 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Encodes and decodes json with the fastest library installed. Like
+# cimiutils, this module must not reference any cimi implementation modules.
+
+import json
+
+
+def _ujson():
+    import ujson
+    # old releases can not be told to leave the slashes alone
+    ujson.dumps('/', escape_forward_slashes=False)
+    return (lambda obj: ujson.dumps(obj, escape_forward_slashes=False),
+            ujson.loads)
+
+
+def _simplejson():
+    import simplejson
+    return (simplejson.JSONEncoder(separators=(',', ':')).encode,
+            simplejson.loads)
+
+
+def _json():
+    return json.JSONEncoder(separators=(',', ':')).encode, json.loads
+
+
+# the libraries in the order of preference
+LIBRARIES = (('ujson', _ujson), ('simplejson', _simplejson), ('json', _json))
+
+
+class JSONCodec(object):
+    """
+    Compact json encoding and decoding. The library is the first one of
+    LIBRARIES which can be imported, unless one is named in the json_codec
+    option of the filter configuration.
+    """
+
+    def __init__(self, name=None):
+        self.use(name)
+
+    def configure(self, conf):
+        self.use(conf.get('json_codec'))
+
+    def use(self, name=None):
+        for library, load in LIBRARIES:
+            if name and name != library:
+                continue
+            try:
+                self.dumps, self.loads = load()
+            except (ImportError, TypeError):
+                continue
+            self.name = library
+            return
+        self.dumps, self.loads = _json()
+        self.name = 'json'
+
+
+CODEC = JSONCodec()
@@ -17,6 +17,7 @@ from nova.openstack.common import log as logging
 from webob import Request, Response
 import json
 import copy
+import time
 
 from cimibase import Controller, Consts
 from cimibase import CimiXMLSerializer
@@ -24,7 +25,15 @@ from cimibase import make_response_data
 from cimibase import get_request_data
 from cimiutils import concat, get_err_response
 from cimiutils import match_up, sub_path, access_resource
-from cimiutils import remove_member, map_machine_state
+from cimiutils import remove_member, map_machine_state, get_paging
+from cimiutils import carried_query, get_wait
+from cimiutils import MACHINE_STATE_MAP, get_select, get_expand, project
+from cimifilter import get_filter
+from conditional import GENERATIONS
+from scheduler import Scheduler
+from transitions import TRANSITIONS
+from waiters import WAITERS
+from cimifilter import equal_rule, state_rule, since_rule
 from nova.api.openstack.wsgi import XMLDictSerializer, JSONDictSerializer
 
 LOG = logging.getLogger(__name__)
@@ -34,28 +43,89 @@ class MachineCtrler(Controller):
     """
     Handles machine request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineCtrler, self).__init__(conf, app, req, tenant_id,
-                                            *args)
-        self.os_path = '/%s/servers' % (tenant_id)
+    ATTRIBUTE_SOURCES = {'cpu': 'flavor', 'memory': 'flavor',
+                         'volumes': 'volumes'}
+    EXPANDABLE = ('volumes', 'networkInterfaces')
+
+    def __init__(self, conf, app):
+        super(MachineCtrler, self).__init__(conf, app)
         self.entity_uri = 'Machine'
         self.metadata = Consts.MACHINE_METADATA
         self.actions = Consts.MACHINE_ACTIONS
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers' % (tenant_id)
+
+    def _await_server(self, req, server_id, wait):
+        """
+        Read the server with _get_server. When the request waits for a
+        state the server is not in, wait for the shared poller to see it
+        in one of the states or for the timeout, the server last polled
+        is returned then.
+        """
+        res, server = self._get_server(req, server_id)
+        if res is not None or wait is None:
+            return res, server
+        states, timeout = wait
+        if map_machine_state(server['status']) in states:
+            return res, server
+        polled = WAITERS.wait(self.tenant_id, 'servers', server_id,
+                              req.environ, states, timeout)
+        if polled is None:
+            return res, server
+        if polled.get('status') == 'DELETED':
+            return get_err_response('NotFound'), None
+        return res, polled
+
+    def _server_flavor(self, read, req, catalog_call):
+        """
+        Look up the flavor of the server _get_server read once both the
+        server and the flavor catalog are known
+        """
+        catalog = catalog_call.wait()
+        res, server = read
+        if res is not None:
+            return None
+        return self._get_flavor(req, server['flavor']['id'], catalog)
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET Container (List Objects) request
         """
 
-        env = self._fresh_env(req)
-        env['PATH_INFO'] = concat(self.os_path,
-                                  '/', '/'.join(parts))
-        new_req = Request(env)
-        res = new_req.get_response(self.app)
-
-        if res.status_int == 200:
-            data = json.loads(res.body).get('server')
+        try:
+            select = get_select(req.GET)
+            expand = get_expand(req.GET, self.EXPANDABLE)
+            wait = get_wait(req.GET, MACHINE_STATE_MAP, WAITERS.max_timeout)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        # the server, the flavor catalog and the volume listing do not
+        # depend on each other, the flavor lookup follows the server
+        scheduler = self._scheduler()
+        server_call = scheduler.spawn(self._await_server, req,
+                                      '/'.join(parts), wait)
+        flavor_call = None
+        if self._needs('flavor', select):
+            catalog_call = scheduler.spawn(self._get_flavors, req)
+            flavor_call = scheduler.chain(server_call, self._server_flavor,
+                                          req, catalog_call)
+        attached_call = None
+        if 'volumes' in expand and self._needs('volumes', select):
+            attached_call = scheduler.spawn(self._get_attached_volumes, req)
+
+        res, data = server_call.wait()
+        if res is None:
+            attached = None
+            if attached_call is not None:
+                attached = attached_call.wait()
+
+            etag = self._etag(req, *self._machine_etag_parts(data, expand,
+                                                             attached))
+            not_modified = self._not_modified(req, etag)
+            if not_modified:
+                return not_modified
 
             body = {}
             body['id'] = concat(self.tenant_id, '/Machine/',
@@ -74,16 +144,14 @@ class MachineCtrler(Controller):
                 'MachineDiskCollection', parts[0]])}
 
 
-            # Send a request to get the details on flavor
-            env = self._fresh_env(req)
-            env['PATH_INFO'] = '/%s/flavors/%s' % (self.tenant_id,
-                                                   data['flavor']['id'])
-            new_req = Request(env)
-            res = new_req.get_response(self.app)
-            if res.status_int == 200:
-                flavor = json.loads(res.body).get('flavor')
-                match_up(body, flavor, 'cpu', 'vcpus')
-                body['memory'] = int(flavor.get('ram')) * 1000
+            # Get the details on flavor from the flavor catalog
+            if flavor_call is not None:
+                flavor = flavor_call.wait()
+                if flavor:
+                    match_up(body, flavor, 'cpu', 'vcpus')
+                    body['memory'] = int(flavor.get('ram')) * 1000
+
+            self._expand_machine(body, data, expand, attached)
 
             # deal with machine operations
             operations = []
@@ -108,6 +176,7 @@ class MachineCtrler(Controller):
             operations.append(self._create_op(action_name, action_url))
 
             body['operations'] = operations
+            body = project(body, select)
 
             if self.res_content_type == 'application/xml':
                 response_data = {'Machine': body}
@@ -120,40 +189,18 @@ class MachineCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
+            resp.headers['ETag'] = etag
             resp.status = 200
             resp.body = new_content
             return resp
         else:
             return res
 
-    def _run_method(self, req, request_data, method, *parts):
-        """
-        Handle the machine reboot request
-        """
-        data = {}
-        if method == 'reboot':
-            force = request_data.get('force', False)
-            if isinstance(force, str):
-                force = 'HARD' if force.lower() == 'true' else 'SOFT'
-            else:
-                force = 'HARD' if force else 'SOFT'
-            data['reboot'] = {'type': force}
-        else:
-            data[method] = None
-
-        env = self._fresh_env(req)
-        env['PATH_INFO'] = concat(self.os_path, '/', parts[0], '/action')
-        env['CONTENT_TYPE'] = 'application/json'
-        new_req = Request(env)
-        new_req.body = json.dumps(data)
-        res = new_req.get_response(self.app)
-
-        return res
-
     def POST(self, req, *parts):
         """
         Handle Machine operations
@@ -178,13 +225,25 @@ class MachineCtrler(Controller):
             access_path = '/'.join(['/v2', self.tenant_id, 'servers',
                                     parts[0]])
             status, headers, body, status_code = access_resource(env, 'GET',
-                access_path, True, None, None)
+                access_path, True, None, None, backend='nova')
             if status:
                 body = json.loads(body)
                 key = ''.join([body['server']['status'].lower(), '_', action])
                 method = Consts.MACHINE_ACTION_MAPS.get(key)
                 if method:
                     resp = self._run_method(req, request_data, method, *parts)
+                    if resp.status_int == 202:
+                        expected = Consts.MACHINE_ACTION_STATES.get(method)
+                        TRANSITIONS.track(self.tenant_id, parts[0],
+                            req.environ, expected,
+                            body['server'].get('updated'))
+                        # a machine without an end state is deleted
+                        self._start_job(req, resp,
+                            '/'.join([self.uri_prefix, 'action', action]),
+                            concat(self.tenant_id, '/Machine/', parts[0]),
+                            'servers', parts[0],
+                            [expected] if expected else [],
+                            body['server'].get('updated'))
             else:
                 resp = get_err_response('NotFound')
 
@@ -209,14 +268,78 @@ class MachineColCtrler(Controller):
     """
     Handles machine collection request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineColCtrler, self).__init__(conf, app, req, tenant_id,
-                                                     *args)
-        self.os_path = '/%s/servers/detail' % (tenant_id)
+    # $filter comparisons Nova can evaluate. Nova matches the name as a
+    # regular expression, so only plain names are sent and checked again.
+    FILTER_RULES = {'name': equal_rule('name', exact=False,
+                                       pattern=r'^[\w\- ]+$'),
+                    # Nova matches status=ACTIVE against the vm state,
+                    # which also covers REBOOT, PASSWORD and others
+                    'state': state_rule('status', MACHINE_STATE_MAP,
+                                        exact=False),
+                    'updated': since_rule('changes-since')}
+    ATTRIBUTE_SOURCES = {'cpu': 'flavor', 'memory': 'flavor',
+                         'volumes': 'volumes'}
+    EXPANDABLE = ('volumes', 'networkInterfaces')
+
+    def __init__(self, conf, app):
+        super(MachineColCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineCollection'
         self.metadata = Consts.MACHINE_COL_METADATA
-
         self.machine_metadata = Consts.MACHINE_METADATA
+        self.action_metadata = Consts.MACHINE_ACTION_RESULTS_METADATA
+        self.batch_action_concurrency = int(self.conf.get(
+            'batch_action_concurrency', 8))
+
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers/detail' % (tenant_id)
+
+    def _resolve_flavors(self, req, machines, catalog):
+        """
+        Return the flavors of catalog keyed by id, with the flavors of the
+        machines which are missing from it, deleted ones for example, read
+        from Nova. They are all read before any entry is made, entries can
+        be made while the response is sent.
+        """
+        catalog = catalog or ([], {})
+        keyed_flavors = catalog[1]
+        flavor_ids = set(machine['flavor']['id'] for machine in machines)
+        for flavor_id in flavor_ids:
+            if flavor_id not in keyed_flavors:
+                self._get_flavor(req, flavor_id, catalog)
+        return keyed_flavors
+
+    def _make_entry(self, machine, keyed_flavors, expand=(), attached=None):
+        """
+        Convert one Nova server into a machine collection entry
+        """
+        entry = {}
+        if self.res_content_type != 'application/xml':
+            entry['resourceURI'] = '/'.join([self.uri_prefix,
+                                         'Machine'])
+        entry['id'] = concat(self.tenant_id, '/',
+                             'machine/',
+                             machine['id'])
+        entry['name'] = machine['name']
+        #entry['property'] = machine['metadata']
+        entry['created'] = machine['created']
+        entry['updated'] = machine['updated']
+        entry['state'] = map_machine_state(machine['status'])
+        # keyed_flavors is None when the flavor attributes are not wanted
+        if keyed_flavors is not None:
+            flavor = keyed_flavors.get(machine['flavor']['id'])
+            if flavor:
+                entry['cpu'] = flavor['vcpus']
+                entry['memory'] = int(flavor['ram']) * 1000
+
+        entry['volumes'] = {'href': '/'.join([self.tenant_id,
+            'MachineVolumeCollection', machine['id']])}
+        entry['networkInterfaces'] = {'href': '/'.join([self.tenant_id,
+            'NetworkInterfacesCollection', machine['id']])}
+        entry['disks'] = {'href': '/'.join([self.tenant_id,
+            'MachineDiskCollection', machine['id']])}
+        if expand:
+            self._expand_machine(entry, machine, expand, attached)
+        return entry
 
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
@@ -224,57 +347,92 @@ class MachineColCtrler(Controller):
         Handle GET machine request
         """
 
-        new_req = self._fresh_request(req)
-
-        res = new_req.get_response(self.app)
-        if res.status_int == 200:
-            content = json.loads(res.body)
+        try:
+            paging = get_paging(req.GET)
+            cimi_filter = get_filter(req.GET)
+            select = get_select(req.GET)
+            expand = get_expand(req.GET, self.EXPANDABLE)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        # the volume states are not covered by the Nova changes-since
+        # listing, expanded volumes always need a full read. A fresh
+        # inventory snapshot answers without any backend read.
+        snapshot = self._snapshot(req)
+        validated = snapshot is None and 'volumes' not in expand
+        if validated:
+            not_modified = self._check_validator(req, 'servers')
+            if not_modified:
+                return not_modified
+        started = time.time()
+        generation = GENERATIONS.get(self.tenant_id)
+
+        params, residual = {}, None
+        if cimi_filter and snapshot is not None:
+            residual = cimi_filter.compile()
+        elif cimi_filter:
+            params, residual = cimi_filter.pushdown(self.FILTER_RULES)
+
+        # the servers, the flavor catalog and the volume listing are read
+        # at the same time
+        scheduler = self._scheduler()
+        catalog_call = None
+        if self._needs('flavor', select, cimi_filter):
+            catalog_call = scheduler.spawn(self._get_flavors, req)
+        attached_call = None
+        if 'volumes' in expand and \
+           self._needs('volumes', select, cimi_filter):
+            attached_call = scheduler.spawn(self._get_attached_volumes, req)
+
+        if snapshot is not None:
+            # the snapshot is filtered and paged here
+            res, machines, has_more = None, snapshot.server_list, None
+        else:
+            # with a residual filter the page can only be cut out here,
+            # every page is read as a listing ends at osapi_max_limit
+            res, machines, has_more = self._get_nova_list(req,
+                self.os_path, 'servers',
+                paging if paging and residual is None else (1, None),
+                params)
+        if res is None:
+            # the next page starts after the last server Nova listed, which
+            # may be a deleted one dropped below
+            marker = None
+            if snapshot is None and residual is None and machines:
+                marker = machines[-1]['id']
+            if 'changes-since' in params:
+                # changes-since also lists the deleted servers
+                machines = [machine for machine in machines
+                            if machine['status'] != 'DELETED']
             body = {}
             body['id'] = concat(self.tenant_id,
                                 '/', self.entity_uri)
             body['resourceURI'] = '/'.join([self.uri_prefix,
                                             self.entity_uri])
 
-            env = self._fresh_env(req)
-            env['PATH_INFO'] = '/%s/flavors/detail' % (self.tenant_id)
-            new_req = Request(env)
-            res = new_req.get_response(self.app)
-            if res.status_int == 200:
-                flavors = json.loads(res.body).get('flavors')
-            else:
-                flavors = []
-
-            keyed_flavors = {}
-            for flavor in flavors:
-                keyed_flavors[flavor['id']] = flavor
-
-            body['machines'] = []
-            machines = content.get('servers', [])
-            for machine in machines:
-                entry = {}
-                if self.res_content_type != 'application/xml':
-                    entry['resourceURI'] = '/'.join([self.uri_prefix,
-                                                 'Machine'])
-                entry['id'] = concat(self.tenant_id, '/',
-                                     'machine/',
-                                     machine['id'])
-                entry['name'] = machine['name']
-                #entry['property'] = machine['metadata']
-                entry['created'] = machine['created']
-                entry['updated'] = machine['updated']
-                entry['state'] = map_machine_state(machine['status'])
-                flavor = keyed_flavors[machine['flavor']['id']]
-                entry['cpu'] = flavor['vcpus']
-                entry['memory'] = int(flavor['ram']) * 1000
-
-                entry['volumes'] = {'href': '/'.join([self.tenant_id,
-                    'MachineVolumeCollection', machine['id']])}
-                entry['networkInterfaces'] = {'href': '/'.join([self.tenant_id,
-                    'NetworkInterfacesCollection', machine['id']])}
-                entry['disks'] = {'href': '/'.join([self.tenant_id,
-                    'MachineDiskCollection', machine['id']])}
-
-                body['machines'].append(entry)
+            keyed_flavors = None
+            if catalog_call is not None:
+                keyed_flavors = self._resolve_flavors(req, machines,
+                                                      catalog_call.wait())
+
+            # the volumes of all machines come from one Cinder listing
+            attached = None
+            if attached_call is not None:
+                attached = attached_call.wait()
+
+            etag = self._etag(req, *[self._machine_etag_parts(machine,
+                                         expand, attached)
+                                     for machine in machines])
+            if validated:
+                self._remember_validator(req, etag, generation, started)
+            not_modified = self._not_modified(req, etag)
+            if not_modified:
+                return not_modified
+
+            body['machines'], has_more = self._make_entries(machines,
+                lambda machine: self._make_entry(machine, keyed_flavors,
+                                                 expand, attached),
+                paging, residual, has_more, select)
 
             body['count'] = len(body['machines'])
             # deal with machine operations
@@ -283,6 +441,8 @@ class MachineColCtrler(Controller):
                                               '/'.join([self.tenant_id,
                                                        'machineCollection'])))
             body['operations'] = operations
+            self._add_paging_ops(body, body['id'], paging, has_more,
+                                 marker, carried_query(req.GET))
 
             if self.res_content_type == 'application/xml':
                 body['resourceURI'] = '/'.join([self.uri_prefix,
@@ -291,32 +451,183 @@ class MachineColCtrler(Controller):
             else:
                 response_data = body
 
-            new_content = make_response_data(response_data,
-                                             self.res_content_type,
-                                             self.metadata,
-                                             self.uri_prefix)
-            resp = Response()
-            self._fixup_cimi_header(resp)
-            resp.headers['Content-Type'] = self.res_content_type
-            resp.status = 200
-            resp.body = new_content
-
-            return resp
+            return self._collection_response(response_data, self.metadata,
+                                             etag)
         else:
             return res
 
+    def _machine_ids(self, machines):
+        """
+        Return the server ids of the machines an action names, as a list
+        of hrefs or ids, or as the dict the xml deserializer makes of them.
+        None when they can not be read.
+        """
+        if isinstance(machines, dict):
+            machines = machines.values()
+        if not isinstance(machines, list):
+            return None
+        ids = []
+        for machine in machines:
+            if isinstance(machine, list):
+                ids.extend(self._machine_ids(machine) or [])
+                continue
+            if isinstance(machine, dict):
+                machine = machine.get('href')
+            if not isinstance(machine, basestring) or not machine:
+                return None
+            ids.append(machine.strip('/').split('/')[-1])
+        return ids
+
+    def _unique(self, ids):
+        """
+        Drop the repeated ids, a machine named twice gets the action once
+        """
+        seen = set()
+        unique = []
+        for server_id in ids:
+            if server_id not in seen:
+                seen.add(server_id)
+                unique.append(server_id)
+        return unique
+
+    def _batch_action(self, req, request_data):
+        """
+        Run a machine action on many machines: the machines listed in the
+        request, or the ones matching the $filter of the request. All their
+        states come from one Nova listing, the Nova actions are sent at
+        the same time. The response holds the outcome for each machine.
+        """
+        action = request_data.get('action')
+        if action not in Consts.MACHINE_ACTIONS:
+            return get_err_response('NotImplemented')
+        action = action.split('/')[-1]
+
+        try:
+            cimi_filter = get_filter(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+        ids = None
+        if request_data.get('machines') is not None:
+            ids = self._machine_ids(request_data.get('machines'))
+            if ids is None:
+                return get_err_response('MalformedBody')
+            ids = self._unique(ids)
+        elif not cimi_filter:
+            # an action on every machine has to be asked for explicitly
+            return get_err_response('BadRequest')
+
+        params, residual = {}, None
+        if cimi_filter:
+            params, residual = cimi_filter.pushdown(self.FILTER_RULES)
+        # every page is read, an unpaged listing ends at osapi_max_limit
+        res, servers, has_more = self._get_nova_list(req, self.os_path,
+            'servers', (1, None), params)
+        if res is not None:
+            return res
+        servers = [server for server in servers
+                   if server['status'] != 'DELETED']
+        if residual is not None:
+            keyed_flavors = None
+            if self._needs('flavor', (), cimi_filter):
+                keyed_flavors = self._resolve_flavors(req, servers,
+                                                      self._get_flavors(req))
+            servers = [server for server in servers
+                       if residual(self._make_entry(server, keyed_flavors))]
+        if ids is not None:
+            keyed = dict((server['id'], server) for server in servers)
+            targets = [(server_id, keyed.get(server_id))
+                       for server_id in ids]
+        else:
+            targets = [(server['id'], server) for server in servers]
+
+        scheduler = Scheduler(self.batch_action_concurrency)
+        calls = []
+        for server_id, server in targets:
+            method = None
+            if server is not None:
+                key = ''.join([server['status'].lower(), '_', action])
+                method = Consts.MACHINE_ACTION_MAPS.get(key)
+            call = None
+            if method:
+                call = scheduler.spawn(self._run_method, req, request_data,
+                                       method, server_id)
+            calls.append((server_id, server, method, call))
+
+        results = []
+        accepted = False
+        for server_id, server, method, call in calls:
+            result = {'machine': {'href': concat(self.tenant_id,
+                                                 '/Machine/', server_id)}}
+            if server is None:
+                result['status'] = 404
+                result['statusMessage'] = 'machine not found'
+            elif call is None:
+                result['status'] = 409
+                result['statusMessage'] = 'action not allowed in state %s' \
+                    % map_machine_state(server['status'])
+            else:
+                res = call.wait()
+                result['status'] = res.status_int
+                if res.status_int == 202:
+                    accepted = True
+                    expected = Consts.MACHINE_ACTION_STATES.get(method)
+                    TRANSITIONS.track(self.tenant_id, server_id,
+                                      req.environ, expected,
+                                      server.get('updated'))
+                    job = self._start_job(req, res,
+                        '/'.join([self.uri_prefix, 'action', action]),
+                        result['machine']['href'], 'servers', server_id,
+                        [expected] if expected else [],
+                        server.get('updated'))
+                    if job is not None:
+                        result['job'] = {'href': concat(self.tenant_id,
+                                                        '/Job/', job.id)}
+            results.append(result)
+
+        body = {}
+        body['id'] = concat(self.tenant_id, '/', self.entity_uri)
+        body['action'] = '/'.join([self.uri_prefix, 'action', action])
+        body['count'] = len(results)
+        body['results'] = results
+        body['resourceURI'] = '/'.join([self.uri_prefix,
+                                        'MachineActionResults'])
+        if self.res_content_type == 'application/xml':
+            response_data = {'Collection': body}
+        else:
+            response_data = body
+
+        new_content = make_response_data(response_data,
+                                         self.res_content_type,
+                                         self.action_metadata,
+                                         self.uri_prefix,
+                                         self.pretty)
+        resp = Response()
+        self._fixup_cimi_header(resp)
+        resp.headers['Content-Type'] = self.res_content_type
+        resp.status = 202 if accepted else 200
+        resp.body = new_content
+        return resp
+
     # Use GET to handle all container read related operations.
     def POST(self, req, *parts):
         """
-        Handle POST machine request which will create a machine
+        Handle POST machine request which will create a machine, or run a
+        machine action on many machines
         """
 
         try:
-            request_data = get_request_data(req.body, self.req_content_type)
+            request_data = get_request_data(req.body, self.req_content_type,
+                                            {'plurals': {'machines':
+                                                         'machine'}})
         except Exception as error:
             return get_err_response('MalformedBody')
 
         if request_data:
+            action = request_data.get('body').get('Action') or \
+                request_data.get('body')
+            if action and action.get('action'):
+                return self._batch_action(req, action)
+
             data = request_data.get('body').get('MachineCreate')
             if not data:
                 data = request_data.get('body')
@@ -357,6 +668,8 @@ class MachineColCtrler(Controller):
                     # to query machine
                     resp_data = json.loads(resp.body)
                     id = resp_data.get('server').get('id')
+                    TRANSITIONS.track(self.tenant_id, id, req.environ,
+                                      'STARTED')
                     env = self._fresh_env(req)
                     env['PATH_INFO'] = concat(self.request_prefix,
                                               '/', self.tenant_id,
@@ -369,9 +682,14 @@ class MachineColCtrler(Controller):
                         '/'.join([self.request_prefix, self.tenant_id,
                                   'Machine', id])
                     resp.status = 201
+                    self._start_job(req, resp, 'add',
+                                    concat(self.tenant_id, '/Machine/', id),
+                                    'servers', id, ['STARTED'])
                 elif resp.status_int == 202:
                     resp_body_data = json.loads(resp.body).get('server')
                     id = resp_body_data.get('id')
+                    TRANSITIONS.track(self.tenant_id, id, req.environ,
+                                      'STARTED')
                     resp_data = {}
                     resp_data['resourceURI'] = '/'.join([self.uri_prefix,
                                             'Machine'])
@@ -388,7 +706,8 @@ class MachineColCtrler(Controller):
                     new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.machine_metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
                     resp = Response()
                     self._fixup_cimi_header(resp)
                     resp.headers['Content-Type'] = self.res_content_type
@@ -397,6 +716,9 @@ class MachineColCtrler(Controller):
                                   'Machine', id])
                     resp.status = 202
                     resp.body = new_content
+                    self._start_job(req, resp, 'add',
+                                    concat(self.tenant_id, '/Machine/', id),
+                                    'servers', id, ['STARTED'])
                 return resp
             else:
                 return get_err_response('BadRequest')
@@ -14,13 +14,13 @@
 
 
 from nova.openstack.common import log as logging
-from webob import Request, Response
-import json
-import copy
+from webob import Response
 
 from cimibase import Controller, Consts
 from cimibase import make_response_data
-from cimiutils import concat, match_up, remove_member
+from cimiutils import get_err_response, match_up, remove_member
+from cimiutils import get_paging, get_select, project, carried_query
+from cimifilter import get_filter
 
 LOG = logging.getLogger(__name__)
 
@@ -29,39 +29,41 @@ class MachineConfigCtrler(Controller):
     """
     Handles machine image request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineConfigCtrler, self).__init__(conf, app, req, tenant_id,
-                                                  *args)
-        self.os_path = '/%s/flavors' % (tenant_id)
-        self.config_id = args[0] if len(args) > 0 else ''
+    def __init__(self, conf, app):
+        super(MachineConfigCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineConfiguration'
         self.metadata = Consts.MACHINECONFIG_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/flavors' % (tenant_id)
+        self.config_id = args[0] if len(args) > 0 else ''
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET Container (List Objects) request
         """
 
-        env = self._fresh_env(req)
-        env['PATH_INFO'] = concat(self.os_path,
-                                  '/', '/'.join(parts))
-
-        new_req = Request(env)
-        res = new_req.get_response(self.app)
-        if res.status_int == 200:
-            flavor = json.loads(res.body).get('flavor')
-            if flavor:
-                body = {}
-                body['resourceURI'] = '/'.join([self.uri_prefix,
-                                                self.entity_uri])
-                body['id'] = '/'.join([self.tenant_id, self.entity_uri,
-                                       self.config_id])
-                match_up(body, flavor, 'name', 'name')
-                match_up(body, flavor, 'cpu', 'vcpus')
-                body['memory'] = int(flavor.get('ram')) * 1000
-                body['disks'] = [{'capacity': int(flavor.get('disk')) * 1000,
-                                  'format': 'UNKNOWN'}]
+        try:
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        res, flavor = self._find_flavor(req, self.config_id)
+        if res is not None:
+            return res
+        if flavor:
+            body = {}
+            body['resourceURI'] = '/'.join([self.uri_prefix,
+                                            self.entity_uri])
+            body['id'] = '/'.join([self.tenant_id, self.entity_uri,
+                                   self.config_id])
+            match_up(body, flavor, 'name', 'name')
+            match_up(body, flavor, 'cpu', 'vcpus')
+            body['memory'] = int(flavor.get('ram')) * 1000
+            body['disks'] = [{'capacity': int(flavor.get('disk')) * 1000,
+                              'format': 'UNKNOWN'}]
+            body = project(body, select)
 
             if self.res_content_type == 'application/xml':
                 response_data = {self.entity_uri: body}
@@ -72,7 +74,8 @@ class MachineConfigCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
@@ -80,85 +83,76 @@ class MachineConfigCtrler(Controller):
             resp.body = new_content
             return resp
         else:
-            return res
-
-        return res
+            return get_err_response('NotFound')
 
 
 class MachineConfigColCtrler(Controller):
     """
     Handles machine image collection request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineConfigColCtrler, self).__init__(conf, app, req, tenant_id,
-                                                     *args)
-        self.os_path = '/%s/flavors/detail' % (tenant_id)
+    def __init__(self, conf, app):
+        super(MachineConfigColCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineConfigurationCollection'
-
         self.metadata = Consts.MACHINECONFIG_COL_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/flavors/detail' % (tenant_id)
+
+    def _make_entry(self, flavor):
+        """
+        Convert one Nova flavor into a machine configuration collection entry
+        """
+        entry = {}
+        if self.res_content_type != 'application/xml':
+            entry['resourceURI'] = '/'.join([self.uri_prefix,
+                'MachineConfiguration'])
+        entry['id'] = '/'.join([self.tenant_id,
+                                'MachineConfiguration',
+                                flavor['id']])
+        entry['name'] = flavor['name']
+        entry['cpu'] = flavor['vcpus']
+        entry['memory'] = int(flavor['ram']) * 1000
+        entry['disks'] = [{'capacity': int(flavor['disk']) * 1000,
+                           'format':'UNKNOWN'}]
+        return entry
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET Container (List Objects) request
         """
 
-        env = copy.copy(req.environ)
-
-        env['SCRIPT_NAME'] = self.os_version
-        env['PATH_INFO'] = self.os_path
-        # we will always use json format to get Nova information
-        env['HTTP_ACCEPT'] = 'application/json'
-
-        # need to remove this header, otherwise, it will always take the
-        # original request accept content type
-        if env.has_key('nova.best_content_type'):
-            env.pop('nova.best_content_type')
-        new_req = Request(env)
-
-        res = new_req.get_response(self.app)
-        if res.status_int == 200:
-            content = json.loads(res.body)
+        try:
+            paging = get_paging(req.GET)
+            cimi_filter = get_filter(req.GET)
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        # flavors come from the flavor cache, so the filter and the page
+        # are both applied here
+        residual = cimi_filter.compile() if cimi_filter else None
+        res, catalog = self._get_catalog(req)
+        if res is not None:
+            return res
+        if catalog:
             body = {}
             body['id'] = '/'.join([self.tenant_id, self.entity_uri])
-            body['machineConfigurations'] = []
-            flavors = content.get('flavors', [])
-            for flavor in flavors:
-                entry = {}
-                if self.res_content_type != 'application/xml':
-                    entry['resourceURI'] = '/'.join([self.uri_prefix,
-                        'MachineConfiguration'])
-                entry['id'] = '/'.join([self.tenant_id,
-                                        'MachineConfiguration',
-                                        flavor['id']])
-                entry['name'] = flavor['name']
-                entry['cpu'] = flavor['vcpus']
-                entry['memory'] = int(flavor['ram']) * 1000
-                entry['disks'] = [{'capacity': int(flavor['disk']) * 1000,
-                                   'format':'UNKNOWN'}]
-
-                body['machineConfigurations'].append(entry)
+            body['machineConfigurations'], has_more = self._make_entries(
+                catalog[0], self._make_entry, paging, residual,
+                select=select)
 
             body['count'] = len(body['machineConfigurations'])
+            self._add_paging_ops(body, body['id'], paging, has_more,
+                                 extra=carried_query(req.GET))
 
+            body['resourceURI'] = '/'.join([self.uri_prefix,
+                                            self.entity_uri])
             if self.res_content_type == 'application/xml':
-                body['resourceURI'] = '/'.join([self.uri_prefix,
-                                                self.entity_uri])
                 response_data = {'Collection': body}
             else:
-                body['resourceURI'] = '/'.join([self.uri_prefix,
-                                                self.entity_uri])
                 response_data = body
 
-            new_content = make_response_data(response_data,
-                                             self.res_content_type,
-                                             self.metadata,
-                                             self.uri_prefix)
-            resp = Response()
-            self._fixup_cimi_header(resp)
-            resp.headers['Content-Type'] = self.res_content_type
-            resp.status = 200
-            resp.body = new_content
-            return resp
+            return self._collection_response(response_data, self.metadata)
         else:
-            return res
+            return get_err_response('NotFound')
@@ -16,12 +16,15 @@
 from nova.openstack.common import log as logging
 from webob import Request, Response
 import json
-import copy
+import time
 
 from cimibase import Controller, Consts
 from cimibase import make_response_data
-from cimiutils import concat, match_up, remove_member
-from cimiutils import map_image_state
+from cimiutils import concat, match_up
+from cimiutils import map_image_state, get_err_response, get_paging
+from cimiutils import get_select, project, carried_query
+from cimifilter import get_filter, equal_rule, since_rule
+from conditional import GENERATIONS
 
 LOG = logging.getLogger(__name__)
 
@@ -30,20 +33,26 @@ class MachineImageCtrler(Controller):
     """
     Handles machine image request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineImageCtrler, self).__init__(conf, app, req, tenant_id,
-                                                 *args)
-        self.os_path = '/%s/images' % (tenant_id)
-        self.image_id = args[0] if len(args) > 0 else ''
+    def __init__(self, conf, app):
+        super(MachineImageCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineImage'
         self.metadata = Consts.MACHINEIMAGE_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/images' % (tenant_id)
+        self.image_id = args[0] if len(args) > 0 else ''
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET Container (List Objects) request
         """
 
+        try:
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
         env = self._fresh_env(req)
         env['PATH_INFO'] = '/'.join([self.os_path, self.image_id])
 
@@ -51,7 +60,13 @@ class MachineImageCtrler(Controller):
         res = new_req.get_response(self.app)
         if res.status_int == 200:
             image = json.loads(res.body).get('image')
+            etag = None
             if image:
+                etag = self._etag(req, image['id'], image.get('updated'),
+                                  image.get('status'))
+                not_modified = self._not_modified(req, etag)
+                if not_modified:
+                    return not_modified
                 body = {}
                 body['type'] = 'IMAGE'
                 body['id'] = '/'.join([self.tenant_id, self.entity_uri,
@@ -61,6 +76,7 @@ class MachineImageCtrler(Controller):
                 match_up(body, image, 'updated', 'updated')
                 body['state'] = map_image_state(image['status'])
                 body['imageLocation'] = body['id']
+                body = project(body, select)
 
             if self.res_content_type == 'application/xml':
                 response_data = {self.entity_uri: body}
@@ -72,10 +88,13 @@ class MachineImageCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
+            if etag:
+                resp.headers['ETag'] = etag
             resp.status = 200
             resp.body = new_content
             return resp
@@ -89,76 +108,93 @@ class MachineImageColCtrler(Controller):
     """
     Handles machine image collection request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineImageColCtrler, self).__init__(conf, app, req, tenant_id,
-                                                    *args)
-        self.os_path = '/%s/images/detail' % (tenant_id)
+    # $filter comparisons the Nova image listing can evaluate
+    FILTER_RULES = {'name': equal_rule('name'),
+                    'updated': since_rule('changes-since')}
+
+    def __init__(self, conf, app):
+        super(MachineImageColCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineImageCollection'
         self.metadata = Consts.MACHINEIMAGE_COL_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/images/detail' % (tenant_id)
+
+    def _make_entry(self, image):
+        """
+        Convert one Nova image into a machine image collection entry
+        """
+        entry = {}
+        if self.res_content_type != 'application/xml':
+            entry['resourceURI'] = '/'.join([self.uri_prefix,
+                                             'MachineImage'])
+        entry['id'] = '/'.join([self.tenant_id,
+                             'MachineImage',
+                             image['id']])
+        entry['type'] = 'IMAGE'
+        entry['name'] = image['name']
+        entry['created'] = image['created']
+        entry['updated'] = image['updated']
+        entry['state'] = map_image_state(image['status'])
+        entry['imageLocation'] = entry['id']
+        return entry
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET Container (List Objects) request
         """
 
-        env = copy.copy(req.environ)
-
-        env['SCRIPT_NAME'] = self.os_version
-        env['PATH_INFO'] = self.os_path
-        # we will always use json format to get Nova information
-        env['HTTP_ACCEPT'] = 'application/json'
-
-        # need to remove this header, otherwise, it will always take the
-        # original request accept content type
-        if env.has_key('nova.best_content_type'):
-            env.pop('nova.best_content_type')
-        new_req = Request(env)
+        try:
+            paging = get_paging(req.GET)
+            cimi_filter = get_filter(req.GET)
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        not_modified = self._check_validator(req, 'images')
+        if not_modified:
+            return not_modified
+        started = time.time()
+        generation = GENERATIONS.get(self.tenant_id)
+
+        params, residual = {}, None
+        if cimi_filter:
+            params, residual = cimi_filter.pushdown(self.FILTER_RULES)
+
+        # with a residual filter the page can only be cut out here, every
+        # page is read as a listing ends at osapi_max_limit
+        res, images, has_more = self._get_nova_list(req, self.os_path,
+            'images', paging if paging and residual is None else (1, None),
+            params)
+        if res is None:
+            etag = self._etag(req, *[(image['id'], image.get('updated'),
+                                      image.get('status'))
+                                     for image in images])
+            self._remember_validator(req, etag, generation, started)
+            not_modified = self._not_modified(req, etag)
+            if not_modified:
+                return not_modified
 
-        res = new_req.get_response(self.app)
-        if res.status_int == 200:
-            content = json.loads(res.body)
             body = {}
             body['id'] = '/'.join([self.tenant_id, self.entity_uri])
-            body['machineImages'] = []
-            images = content.get('images', [])
-            for image in images:
-                entry = {}
-                entry['resourceURI'] = '/'.join([self.uri_prefix,
-                                                 'MachineImage'])
-                entry['id'] = '/'.join([self.tenant_id,
-                                     'MachineImage',
-                                     image['id']])
-                entry['type'] = 'IMAGE'
-                entry['name'] = image['name']
-                entry['created'] = image['created']
-                entry['updated'] = image['updated']
-                entry['state'] = map_image_state(image['status'])
-                entry['imageLocation'] = entry['id']
-
-                body['machineImages'].append(entry)
+            body['machineImages'], has_more = self._make_entries(images,
+                self._make_entry, paging, residual, has_more, select)
 
             body['count'] = len(body['machineImages'])
+            marker = None
+            if residual is None and images:
+                marker = images[-1]['id']
+            self._add_paging_ops(body, body['id'], paging, has_more,
+                                 marker, carried_query(req.GET))
+            body['resourceURI'] = '/'.join([self.uri_prefix,
+                                            self.entity_uri])
             if self.res_content_type == 'application/xml':
-                remove_member(body, 'resourceURI')
-                body['resourceURI'] = '/'.join([self.uri_prefix,
-                                                self.entity_uri])
                 response_data = {'Collection': body}
             else:
-                body['resourceURI'] = '/'.join([self.uri_prefix,
-                                                self.entity_uri])
                 response_data = body
 
-            new_content = make_response_data(response_data,
-                                             self.res_content_type,
-                                             self.metadata,
-                                             self.uri_prefix)
-
-            resp = Response()
-            self._fixup_cimi_header(resp)
-            resp.headers['Content-Type'] = self.res_content_type
-            resp.status = 200
-            resp.body = new_content
-            return resp
+            return self._collection_response(response_data, self.metadata,
+                                             etag)
         else:
             return res
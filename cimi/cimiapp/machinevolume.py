@@ -23,7 +23,8 @@ from cimibase import make_response_data
 from cimibase import get_request_data
 from cimiutils import concat, get_err_response
 from cimiutils import match_up, sub_path
-from cimiutils import remove_member, access_resource, map_volume_state
+from cimiutils import map_volume_state
+from cimiutils import get_paging, get_select, project, carried_query
 from nova.api.openstack.wsgi import XMLDictSerializer, JSONDictSerializer
 
 LOG = logging.getLogger(__name__)
@@ -33,27 +34,39 @@ class MachineVolumeCtrler(Controller):
     """
     Handles machineVolume request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineVolumeCtrler, self).__init__(conf, app, req, tenant_id,
-                                            *args)
-        self.os_path = '/%s/servers' % (tenant_id)
-        self.entity_uri = 'MachineVolume'
+    ATTRIBUTE_SOURCES = {'state': 'volume'}
 
+    def __init__(self, conf, app):
+        super(MachineVolumeCtrler, self).__init__(conf, app)
+        self.entity_uri = 'MachineVolume'
         self.metadata = Consts.MACHINEVOLUME_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers' % (tenant_id)
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET Container (List Objects) request
         """
 
-        env = self._fresh_env(req)
-        env['PATH_INFO'] = concat(self.os_path, '/',
-                                  parts[0], '/os-volume_attachments/',
-                                  parts[1])
-        new_req = Request(env)
-        res = new_req.get_response(self.app)
+        try:
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
 
+        # Nova uses the volume id as the attachment id, so the volume is
+        # read at the same time as the attachment
+        scheduler = self._scheduler()
+        attachment_call = scheduler.spawn(self._nova_request, req,
+            concat(self.os_path, '/', parts[0], '/os-volume_attachments/',
+                   parts[1]))
+        volume_call = None
+        if self._needs('volume', select):
+            volume_call = scheduler.spawn(self._volume_request, req, 'GET',
+                '/'.join(['', self.tenant_id, 'volumes', parts[1]]))
+
+        res = attachment_call.wait()
         if res.status_int == 200:
             data = json.loads(res.body).get('volumeAttachment')
 
@@ -72,23 +85,19 @@ class MachineVolumeCtrler(Controller):
             body['operations'] = operations
 
             # Try to get the volume state
-            env = self._fresh_env(req)
-            env['SERVER_PORT'] = self.conf.get('volume_endpoint_port')
-            env['SCRIPT_NAME'] = '/v1'
-            env['HTTP_HOST'] = '%s:%s' % \
-                (self.conf.get('volume_endpoint_host'),
-                 self.conf.get('volume_endpoint_port'))
-            env['CONTENT_LENGTH'] = 0
-
-            volume_path = '/'.join(['/v1', self.tenant_id, 'volumes',
-                                    data['volumeId']])
-            status, headers, volume_body, status_code = \
-                access_resource(env, 'GET',
-                                volume_path, True, None, None)
-
-            if status:
-                volume_data = json.loads(volume_body).get('volume')
-                body['state'] = map_volume_state(volume_data['status'])
+            if volume_call is not None:
+                status, headers, volume_body, status_code = \
+                    volume_call.wait()
+                if data['volumeId'] != parts[1]:
+                    # not the volume read above, read the attached one
+                    status, headers, volume_body, status_code = \
+                        self._volume_request(req, 'GET', '/'.join(['',
+                            self.tenant_id, 'volumes', data['volumeId']]))
+
+                if status:
+                    volume_data = json.loads(volume_body).get('volume')
+                    body['state'] = map_volume_state(volume_data['status'])
+            body = project(body, select)
 
             if self.res_content_type == 'application/xml':
                 response_data = {'MachineVolume': body}
@@ -100,7 +109,8 @@ class MachineVolumeCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
@@ -133,21 +143,34 @@ class MachineVolumeColCtrler(Controller):
     """
     Handles machineVolume collection request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(MachineVolumeColCtrler, self).__init__(conf, app, req, tenant_id,
-                                                     *args)
-        self.os_path = '/%s/servers' % (tenant_id)
+    def __init__(self, conf, app):
+        super(MachineVolumeColCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineVolumeCollection'
-
         self.metadata = Consts.MACHINEVOLUME_COL_METADATA
         self.machine_volume_metadata = Consts.MACHINEVOLUME_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers' % (tenant_id)
+
+    def _make_entry(self, data):
+        """
+        Convert one Nova volume attachment into a machine volume entry
+        """
+        return self._machine_volume_entry(data['serverId'], data['id'],
+                                          data['device'], data['volumeId'])
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET machineVolumeCollection request
         """
 
+        try:
+            paging = get_paging(req.GET)
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
         env = self._fresh_env(req)
 
         env['PATH_INFO'] = concat(self.os_path, '/',
@@ -160,54 +183,28 @@ class MachineVolumeColCtrler(Controller):
             body = {}
             body['id'] = concat(self.tenant_id,
                                 '/', self.entity_uri, '/', parts[0])
-            body['resourceURI'] = concat(self.uri_prefix, '/',
-                                            self.entity_uri)
-
-            body['machineVolumes'] = []
-            volumeAttachments = content.get('volumeAttachments', [])
-            for data in volumeAttachments:
-                entry = {}
-                if self.res_content_type == 'application/json':
-                    entry['resourceURI'] = concat(self.uri_prefix,
-                                            '/MachineVolume')
-                entry['id'] = concat(self.tenant_id, '/',
-                                     'machineVolume/',
-                                     data['serverId'], '/',
-                                     data['id'])
-                entry['initialLocation'] = data['device']
-                entry['volume'] = {'href': concat(self.tenant_id,
-                    '/Volume/', data['volumeId'])}
 
-                operations = []
-                operations.append(self._create_op('edit', entry['id']))
-                operations.append(self._create_op('delete', entry['id']))
-                entry['operations'] = operations
-
-                body['machineVolumes'].append(entry)
+            # attachments can not be paged by Nova, cut the page out here
+            body['machineVolumes'], has_more = self._make_entries(
+                content.get('volumeAttachments', []), self._make_entry,
+                paging, select=select)
 
             body['count'] = len(body['machineVolumes'])
             # deal with machinevolume operations
             operations = []
             operations.append(self._create_op('add', body['id']))
             body['operations'] = operations
+            self._add_paging_ops(body, body['id'], paging, has_more,
+                                 extra=carried_query(req.GET))
 
             if self.res_content_type == 'application/xml':
                 response_data = {'Collection': body}
-                remove_member(response_data, 'resourceURI')
             else:
+                body['resourceURI'] = concat(self.uri_prefix, '/',
+                                             self.entity_uri)
                 response_data = body
 
-            new_content = make_response_data(response_data,
-                                             self.res_content_type,
-                                             self.metadata,
-                                             self.uri_prefix)
-            resp = Response()
-            self._fixup_cimi_header(resp)
-            resp.headers['Content-Type'] = self.res_content_type
-            resp.status = 200
-            resp.body = new_content
-
-            return resp
+            return self._collection_response(response_data, self.metadata)
         else:
             return res
 
@@ -281,13 +278,16 @@ class MachineVolumeColCtrler(Controller):
                     new_content = make_response_data(response_data,
                                                  self.res_content_type,
                                                  self.machine_volume_metadata,
-                                                 self.uri_prefix)
+                                                 self.uri_prefix,
+                                                 self.pretty)
                     resp = Response()
                     self._fixup_cimi_header(resp)
                     resp.headers['Content-Type'] = self.res_content_type
                     resp.headers['Location'] = location
                     resp.status = 201
                     resp.body = new_content
+                    self._start_job(req, resp, 'add', body['id'], 'volumes',
+                                    volume_id, ['INUSE'])
                     return resp
                 else:
                     return res
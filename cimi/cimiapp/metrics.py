@@ -0,0 +1,261 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Request and backend metrics of the cimi middleware, exposed in the
+# Prometheus text format. Like cimiutils, this module must not reference
+# any cimi implementation modules.
+
+from bisect import bisect_left
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def format_labels(names, values, extra=''):
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').
+                          replace('"', '\\"').replace('\n', '\\n'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(pairs)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Counter(object):
+    """
+    A counter for each combination of label values
+    """
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, out):
+        out.append('# HELP %s %s' % (self.name, self.help))
+        out.append('# TYPE %s counter' % self.name)
+        with self._lock:
+            values = self.values.items()
+        for labels, value in sorted(values):
+            out.append('%s%s %s' % (self.name,
+                                    format_labels(self.labels, labels),
+                                    format_value(value)))
+
+
+class Histogram(object):
+    """
+    A histogram for each combination of label values, the buckets are the
+    upper bounds of the observed values
+    """
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            item = self.values.get(labels)
+            if item is None:
+                # one count per bucket, the last one is +Inf
+                item = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.values[labels] = item
+            item[0][index] += 1
+            item[1] += value
+            item[2] += 1
+
+    def render(self, out):
+        out.append('# HELP %s %s' % (self.name, self.help))
+        out.append('# TYPE %s histogram' % self.name)
+        with self._lock:
+            values = [(labels, list(item[0]), item[1], item[2])
+                      for labels, item in self.values.items()]
+        for labels, counts, total, count in sorted(values):
+            cumulative = 0
+            bounds = [format_value(bound) for bound in self.buckets]
+            for bound, bucket in zip(bounds + ['+Inf'], counts):
+                cumulative += bucket
+                out.append('%s_bucket%s %d' % (self.name,
+                    format_labels(self.labels, labels, 'le="%s"' % bound),
+                    cumulative))
+            out.append('%s_sum%s %s' % (self.name,
+                                        format_labels(self.labels, labels),
+                                        format_value(total)))
+            out.append('%s_count%s %d' % (self.name,
+                                          format_labels(self.labels, labels),
+                                          count))
+
+
+class Metrics(object):
+    """
+    The metrics of the process. Besides its own counters and histograms,
+    the statistics of other components, such as the connection pool and the
+    caches, are collected through stats functions when the metrics are
+    rendered.
+    """
+
+    def __init__(self):
+        self.requests = Counter('cimi_requests_total',
+            'CIMI requests by controller, method and status.',
+            ('controller', 'method', 'status'))
+        self.request_duration = Histogram('cimi_request_duration_seconds',
+            'Time to handle a CIMI request, including sending the body.',
+            ('controller', 'method'))
+        self.response_size = Histogram('cimi_response_size_bytes',
+            'Size of the CIMI response bodies.', ('controller',),
+            SIZE_BUCKETS)
+        self.backend_requests = Counter('cimi_backend_requests_total',
+            'Subrequests sent to the backends by method and status.',
+            ('backend', 'method', 'status'))
+        self.backend_duration = Histogram('cimi_backend_duration_seconds',
+            'Time spent in backend subrequests.', ('backend', 'method'))
+        self.enabled = True
+        self.allow_unauthenticated = False
+        self._stats = {}
+
+    def configure(self, conf):
+        value = conf.get('metrics_enabled')
+        if value is not None:
+            self.enabled = str(value).lower() in ('true', '1', 'yes', 'on')
+        value = conf.get('metrics_allow_unauthenticated', 'false')
+        self.allow_unauthenticated = str(value).lower() in ('true', '1',
+                                                            'yes', 'on')
+
+    def allowed(self, env):
+        """
+        Check that the request may read the metrics, they cover every
+        tenant so only admins may unless anyone was allowed to
+        """
+        if self.allow_unauthenticated:
+            return True
+        context = env.get('nova.context')
+        return bool(getattr(context, 'is_admin', False))
+
+    def add_stats(self, prefix, help, stats):
+        """
+        Export the dict returned by stats as <prefix>_<key> gauges
+        """
+        self._stats[prefix] = (help, stats)
+
+    def request_done(self, controller, method, status, duration, size):
+        if not self.enabled:
+            return
+        self.requests.inc((controller, method, status))
+        self.request_duration.observe((controller, method), duration)
+        self.response_size.observe((controller,), size)
+
+    def backend_done(self, backend, method, status, duration):
+        if not self.enabled:
+            return
+        self.backend_requests.inc((backend, method, status))
+        self.backend_duration.observe((backend, method), duration)
+
+    def render(self):
+        out = []
+        for metric in (self.requests, self.request_duration,
+                       self.response_size, self.backend_requests,
+                       self.backend_duration):
+            metric.render(out)
+        for prefix, (help, stats) in sorted(self._stats.items()):
+            for key, value in sorted(stats().items()):
+                name = '%s_%s' % (prefix, key)
+                out.append('# HELP %s %s' % (name, help))
+                out.append('# TYPE %s gauge' % name)
+                out.append('%s %s' % (name, format_value(value)))
+        out.append('')
+        return '\n'.join(out)
+
+
+class MeteredBody(object):
+    """
+    Wraps a WSGI response body to count its bytes, done is called with
+    the size once the server closes the body
+    """
+
+    def __init__(self, body, done):
+        self.body = body
+        self.done = done
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            done, self.done = self.done, None
+            if done:
+                done(self.size)
+
+
+class MeteredApp(object):
+    """
+    Wraps the application behind the middleware, so that every in-process
+    subrequest sent to it is counted and timed
+    """
+
+    def __init__(self, app, metrics, backend='nova'):
+        self.app = app
+        self.metrics = metrics
+        self.backend = backend
+
+    def __call__(self, env, start_response):
+        if not self.metrics.enabled:
+            return self.app(env, start_response)
+
+        status = ['000']
+
+        def metered_start_response(value, headers, exc_info=None):
+            status[0] = value.split(' ', 1)[0]
+            if exc_info is None:
+                return start_response(value, headers)
+            return start_response(value, headers, exc_info)
+
+        start = time.time()
+        try:
+            return self.app(env, metered_start_response)
+        finally:
+            self.metrics.backend_done(self.backend,
+                                      env.get('REQUEST_METHOD', 'GET'),
+                                      status[0], time.time() - start)
+
+
+METRICS = Metrics()
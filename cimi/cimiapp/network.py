@@ -14,8 +14,7 @@
 
 
 from nova.openstack.common import log as logging
-from webob import Request, Response
-import json
+from webob import Response
 import copy
 
 from cimibase import Controller, Consts
@@ -23,7 +22,7 @@ from cimibase import CimiXMLSerializer
 from cimibase import make_response_data
 from cimibase import get_request_data
 from cimiutils import concat, get_err_response
-from cimiutils import match_up, sub_path
+from cimiutils import sub_path
 from nova.api.openstack.wsgi import XMLDictSerializer, JSONDictSerializer
 
 LOG = logging.getLogger(__name__)
@@ -33,45 +32,25 @@ class NetworkInterfaceCtrler(Controller):
     """
     Handles machine request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(NetworkInterfaceCtrler, self).__init__(conf, app, req,
-                                tenant_id, *args)
-        self.os_path = '/%s/servers' % (tenant_id)
+    def __init__(self, conf, app):
+        super(NetworkInterfaceCtrler, self).__init__(conf, app)
         self.metadata = Consts.NETWORK_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers' % (tenant_id)
+
 
 class NetworkInterfaceColCtrler(Controller):
     """
     Handles machine collection request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(NetworkInterfaceColCtrler, self).__init__(conf,
-            app, req, tenant_id, *args)
-        self.os_path = '/%s/servers' % (tenant_id)
+    def __init__(self, conf, app):
+        super(NetworkInterfaceColCtrler, self).__init__(conf, app)
         self.entity_uri = 'MachineNetworkInterfacesCollection'
         self.metadata = Consts.NETWORK_COL_METADATA
 
-    def _get_entry(self, data, id):
-
-        def _make_entry(key, source_key, entries):
-            adds = {}
-            match_up(adds, data, 'addr', source_key)
-            if adds.get('addr'):
-                entry = {}
-                name = 'MachineNetworkInterfacesCollectionEntry'
-                entry['id'] = concat(self.tenant_id, '/', name,
-                                     '/', id, '/', key)
-                entry['resourceURI'] = concat(self.uri_prefix,
-                    '/', name,)
-                name = 'MachineNetworkInterfaceAddressesCollection'
-                entry['addresses'] = {'href': concat(self.tenant_id,
-                    '/', name, '/', id, '/', key)}
-                entries.append(entry)
-
-        entries = []
-        _make_entry('private', 'addresses/private', entries)
-        _make_entry('public',  'addresses/public', entries)
-        return entries
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/servers' % (tenant_id)
 
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
@@ -79,21 +58,14 @@ class NetworkInterfaceColCtrler(Controller):
         Handle GET machine request
         """
 
-        env = self._fresh_env(req)
-        env['PATH_INFO'] = concat(self.os_path, '/', parts[0])
-
-        new_req = Request(env)
-        res = new_req.get_response(self.app)
-
-        if res.status_int == 200:
-            data = json.loads(res.body).get('server')
-
+        res, data = self._get_server(req, parts[0])
+        if res is None:
             body = {}
             body['id'] = concat(self.tenant_id,
                                 '/networkInterfacesCollection/',
                                 parts[0])
             body['resourceURI'] = concat(self.uri_prefix, '/', self.entity_uri)
-            body['entries'] = self._get_entry(data, parts[0])
+            body['entries'] = self._interface_entries(data, parts[0])
 
             if self.res_content_type == 'application/xml':
                 response_data = {'Collection': body}
@@ -103,7 +75,8 @@ class NetworkInterfaceColCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
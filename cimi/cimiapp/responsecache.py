@@ -0,0 +1,148 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Tenant scoped cache of the cimi GET responses. Like cimiutils, this module
+# must not reference any cimi implementation modules.
+
+from webob import Response
+
+from cache import LRUCache
+from conditional import GENERATIONS, etag_matches
+
+# headers which are set again when a cached response is sent
+SKIPPED_HEADERS = ('content-length', 'content-encoding', 'vary')
+
+
+def authorized(env, tenant_id):
+    """
+    Check that the request was authenticated for the tenant of its path,
+    only such requests may be answered from the cache
+    """
+    context = env.get('nova.context')
+    if context is None:
+        return False
+    return getattr(context, 'project_id', None) == tenant_id
+
+
+class CachingBody(object):
+    """
+    Collects the chunks of a streamed response body as they are sent, done
+    is called with the whole body once it was sent completely
+    """
+
+    def __init__(self, body, done, limit):
+        self.body = body
+        self.done = done
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            if self.chunks is not None:
+                self.size += len(chunk)
+                if self.size > self.limit:
+                    self.chunks = None
+                else:
+                    self.chunks.append(chunk)
+            yield chunk
+        if self.chunks is not None:
+            done, self.done = self.done, None
+            done(''.join(self.chunks))
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+class ResponseCache(object):
+    """
+    Keeps the successful GET responses of each tenant for a few seconds.
+
+    The cache is bounded by the size of the bodies it holds. The keys hold
+    the tenant generation, so a write request of the tenant makes all of
+    its entries stale at once; they are evicted as any unused entry.
+    """
+
+    def __init__(self, max_size=16777216, ttl=5):
+        self.enabled = True
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def configure(self, conf):
+        value = conf.get('response_cache_enabled')
+        if value is not None:
+            self.enabled = str(value).lower() in ('true', '1', 'yes', 'on')
+        self.cache.configure(conf, 'response_cache')
+
+    def key(self, env, tenant_id, content_type, pretty):
+        """
+        The key of a response, it holds the current generation of the
+        tenant so that the entries read before a write are never used again
+        """
+        return (tenant_id, GENERATIONS.get(tenant_id),
+                env.get('PATH_INFO', ''), content_type, pretty,
+                env.get('QUERY_STRING', ''))
+
+    def get(self, env, key):
+        """
+        Return the cached response for the key, None when there is no
+        fresh one
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        status, headers, body = entry
+
+        res = Response()
+        res.status = status
+        res.headerlist = list(headers)
+        etag = res.headers.get('ETag')
+        if etag and etag_matches(env.get('HTTP_IF_NONE_MATCH'), etag):
+            res.status = 304
+            res.body = ''
+        else:
+            res.body = body
+        return res
+
+    def store(self, res, key):
+        """
+        Keep the response under the key when it is cacheable. Streamed
+        bodies are kept once they have been sent. Returns the response to
+        send.
+        """
+        if res.status_int != 200:
+            return res
+        headers = [(name, value) for name, value in res.headerlist
+                   if name.lower() not in SKIPPED_HEADERS]
+        status = res.status
+
+        def done(body):
+            self.cache.put(key, (status, headers, body), len(body))
+
+        if res.content_length is not None:
+            done(res.body)
+        else:
+            res.app_iter = CachingBody(res.app_iter, done,
+                                       self.cache.max_size)
+        return res
+
+    def stats(self):
+        stats = self.cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['hits']) / lookups if lookups \
+            else 0.0
+        return stats
+
+
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,63 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Runs the independent backend calls of a request concurrently. Like
+# cimiutils, this module must not reference any cimi implementation modules.
+
+import sys
+
+from eventlet import GreenPool
+
+
+class Call(object):
+    """
+    A call which ran right away, it behaves like a finished green thread
+    """
+
+    def __init__(self, func, args, kwargs):
+        self.error = None
+        try:
+            self.result = func(*args, **kwargs)
+        except Exception:
+            self.error = sys.exc_info()
+
+    def wait(self):
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.result
+
+
+class Scheduler(object):
+    """
+    Runs the backend calls of one request in a green pool of at most size
+    green threads. spawn returns an object whose wait method gives the
+    result of the call, or raises its exception. With a size of 1 or less
+    every call runs right away in the calling thread.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.pool = GreenPool(size) if size > 1 else None
+
+    def spawn(self, func, *args, **kwargs):
+        if self.pool is None:
+            return Call(func, args, kwargs)
+        return self.pool.spawn(func, *args, **kwargs)
+
+    def chain(self, call, func, *args):
+        """
+        Run func with the result of call as its first argument as soon as
+        the result is known, without waiting in the calling thread
+        """
+        return self.spawn(lambda: func(call.wait(), *args))
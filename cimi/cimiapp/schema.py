@@ -0,0 +1,111 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Compiles the metadata of a cimi resource into the serializers of its
+# responses. Like cimiutils, this module must not reference any cimi
+# implementation modules.
+
+import json
+import threading
+
+from xmlwriter import XMLWriter, is_sequence
+from jsoncodec import CODEC
+
+
+class JSONSerializer(object):
+    """
+    Writes the json documents of a resource. The members which hold lazily
+    produced entries are encoded one entry at a time. The output is compact
+    and encoded by the codec, unless an indent is given, then it is
+    indented the way json.dumps does it.
+    """
+
+    def __init__(self, codec=None, indent=None):
+        if indent:
+            self.encode = json.JSONEncoder(indent=indent).encode
+            self.colon = ': '
+            self.member_newl = '\n' + ' ' * indent
+            self.entry_newl = '\n' + ' ' * (indent * 2)
+            self.close_newl = '\n'
+        else:
+            self.codec = codec
+            self.encode = self.encode_compact
+            self.colon = ':'
+            self.member_newl = self.entry_newl = self.close_newl = ''
+
+    def encode_compact(self, obj):
+        return self.codec.dumps(obj)
+
+    def iter_document(self, data):
+        encode = self.encode
+        streams = []
+        if isinstance(data, dict):
+            streams = [k for k, v in data.items()
+                       if is_sequence(v) and not isinstance(v, (list, tuple))]
+        if not streams:
+            yield encode(data)
+            return
+
+        members = [(k, v) for k, v in data.items() if k not in streams]
+        colon = self.colon
+        member_newl = self.member_newl
+        entry_newl = self.entry_newl
+        yield '{'
+        separator = member_newl
+        for k, v in members:
+            yield '%s%s%s%s' % (separator, encode(k), colon,
+                                encode(v).replace('\n', member_newl))
+            separator = ',' + member_newl
+        for k in streams:
+            yield '%s%s%s[' % (separator, encode(k), colon)
+            item_separator = entry_newl
+            for entry in data[k]:
+                yield '%s%s' % (item_separator,
+                                encode(entry).replace('\n', entry_newl))
+                item_separator = ',' + entry_newl
+            yield '%s]' % member_newl
+            separator = ',' + member_newl
+        yield '%s}' % self.close_newl
+
+    def to_string(self, data):
+        return ''.join(self.iter_document(data))
+
+
+JSON_SERIALIZER = JSONSerializer(CODEC)
+PRETTY_JSON_SERIALIZER = JSONSerializer(indent=2)
+
+# the compiled serializers of each metadata, keyed by the id of the
+# metadata and the namespace. The metadata is kept in the value so that
+# its id is never reused while the entry exists.
+_COMPILED = {}
+_LOCK = threading.Lock()
+
+
+def get_serializers(metadata, xmlns=None, pretty=False):
+    """
+    Give the serializers of a resource by content type, they are compiled
+    the first time the metadata is seen. Only json has a compact form, the
+    xml documents are always indented.
+    """
+    key = (id(metadata), xmlns)
+    compiled = _COMPILED.get(key)
+    if compiled is None or compiled[0] is not metadata:
+        xml_serializer = XMLWriter(metadata, xmlns, pretty=True)
+        compact = {'application/xml': xml_serializer,
+                   'application/json': JSON_SERIALIZER}
+        indented = {'application/xml': xml_serializer,
+                    'application/json': PRETTY_JSON_SERIALIZER}
+        with _LOCK:
+            _COMPILED[key] = compiled = (metadata, compact, indented)
+    return compiled[2] if pretty else compiled[1]
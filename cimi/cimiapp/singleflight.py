@@ -0,0 +1,120 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Coalesces identical backend GET requests which run at the same time. Like
+# cimiutils, this module must not reference any cimi implementation modules.
+
+import sys
+import threading
+
+from eventlet.event import Event
+
+
+class SingleFlight(object):
+    """
+    Runs one call per key at a time. A call made while another one with
+    the same key is in flight does not run, it waits for the running call
+    and gets its result, or its exception.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.leaders = 0
+        self.followers = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def configure(self, conf):
+        value = conf.get('coalesce_requests')
+        if value is not None:
+            self.enabled = str(value).lower() in ('true', '1', 'yes', 'on')
+
+    def do(self, key, func, *args):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Event()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            return flight.wait()
+
+        # the flight lands whatever way the call ends, even when its green
+        # thread is killed, so that the key is never left in flight
+        try:
+            try:
+                result = func(*args)
+            finally:
+                self._land(key)
+        except BaseException:
+            error = sys.exc_info()
+            flight.send_exception(*error)
+            raise error[0], error[1], error[2]
+        flight.send(result)
+        return result
+
+    def _land(self, key):
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def stats(self):
+        return {'leaders': self.leaders, 'followers': self.followers,
+                'in_flight': len(self._flights)}
+
+
+class CoalescedApp(object):
+    """
+    Wraps the application behind the middleware, so that identical GET
+    subrequests made at the same time with the same auth token reach it
+    once. The response is read in full and replayed to every caller.
+    """
+
+    def __init__(self, app, flights):
+        self.app = app
+        self.flights = flights
+
+    def __call__(self, env, start_response):
+        token = env.get('HTTP_X_AUTH_TOKEN')
+        if (not self.flights.enabled or not token or
+            env.get('REQUEST_METHOD', 'GET') != 'GET'):
+            return self.app(env, start_response)
+
+        key = ('app', token, env.get('SCRIPT_NAME', ''),
+               env.get('PATH_INFO', ''), env.get('QUERY_STRING', ''),
+               env.get('HTTP_ACCEPT', ''))
+        status, headers, body = self.flights.do(key, self._call, env)
+        start_response(status, list(headers))
+        return [body]
+
+    def _call(self, env):
+        captured = []
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            captured[:] = [status, list(headers)]
+            return chunks.append
+
+        result = self.app(env, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return captured[0], captured[1], ''.join(chunks)
+
+
+FLIGHTS = SingleFlight()
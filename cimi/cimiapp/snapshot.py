@@ -0,0 +1,277 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Snapshots of the Nova and Cinder inventory of the tenants in use, kept
+# fresh in the background. Like cimiutils, this module must not reference
+# any cimi implementation modules.
+
+from nova.openstack.common import log as logging
+from StringIO import StringIO
+import threading
+import time
+
+import eventlet
+from eventlet.greenpool import GreenPool
+
+from conditional import CLOCK_SKEW, GENERATIONS
+
+LOG = logging.getLogger(__name__)
+
+# environ keys of the request a snapshot reader must not carry along
+DROPPED_KEYS = ('cimi.timings', 'HTTP_IF_NONE_MATCH',
+                'HTTP_IF_MODIFIED_SINCE', 'HTTP_ACCEPT_ENCODING')
+
+
+class ReadError(Exception):
+    """
+    A backend listing could not be read, status is its HTTP status
+    """
+
+    def __init__(self, status):
+        super(ReadError, self).__init__('status %s' % status)
+        self.status = status
+
+
+def reader_env(env):
+    """
+    Copy the environ of a request for the reads of its tenant snapshot, the
+    request specific parts are left out
+    """
+    env = dict((key, value) for key, value in env.items()
+               if key not in DROPPED_KEYS and not key.startswith('webob.'))
+    env['REQUEST_METHOD'] = 'GET'
+    env['QUERY_STRING'] = ''
+    env['CONTENT_LENGTH'] = '0'
+    env['wsgi.input'] = StringIO('')
+    return env
+
+
+def server_order(server):
+    # Nova lists the newest servers first
+    return server.get('created') or '', server['id']
+
+
+class TenantSnapshot(object):
+    """
+    The servers, flavor catalog and volumes of one tenant as last read.
+
+    A refresh replaces the members at once, so a request holding the
+    snapshot sees either the old or the new inventory. read_at is the time
+    the last complete refresh started, generation the tenant generation at
+    that time.
+    """
+
+    def __init__(self, tenant_id, env):
+        self.tenant_id = tenant_id
+        self.env = env
+        self.used = time.time()
+        self.added = self.used
+        self.servers = {}
+        self.server_list = []
+        self.flavors = None
+        self.volumes = {}
+        self.volume_list = []
+        self.read_at = None
+        self.generation = None
+        self.attempted = 0.0
+        self.refreshing = False
+
+    def update(self, servers, full, flavors, volumes, started, generation):
+        """
+        Take in what a refresh read. servers is the complete listing when
+        full is set, otherwise the servers changed since the previous
+        refresh, deleted ones included.
+        """
+        keyed = {} if full else dict(self.servers)
+        for server in servers:
+            if server.get('status') == 'DELETED':
+                keyed.pop(server['id'], None)
+            else:
+                keyed[server['id']] = server
+        self.server_list = sorted(keyed.values(), key=server_order,
+                                  reverse=True)
+        self.servers = keyed
+        if flavors is not None:
+            self.flavors = flavors
+        self.volume_list = volumes
+        self.volumes = dict((volume['id'], volume) for volume in volumes)
+        self.read_at = started
+        self.generation = generation
+
+
+class Snapshots(object):
+    """
+    The inventory snapshots of the active tenants, those which made a
+    request authenticated for them in the last idle_timeout seconds. A
+    green thread refreshes each of them every interval seconds, with the
+    credentials of the last request of the tenant, and as soon as possible
+    after a write request of the tenant went through the middleware.
+
+    The servers are read incrementally with the Nova changes-since
+    parameter, the Cinder volume listing is read in full. A snapshot
+    answers reads as long as it was read less than max_staleness seconds
+    ago and no write of its tenant went through since.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.interval = 5.0
+        self.max_staleness = 15.0
+        self.idle_timeout = 300.0
+        self.max_tenants = 100
+        self.concurrency = 4
+        self.reader = None
+        self.refreshes = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+        self._tenants = {}
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def configure(self, conf, reader):
+        """
+        Pick up the snapshot settings from the filter configuration.
+        reader(tenant_id, env, since) returns the servers changed since
+        the given time, all of them when since is None, the flavor catalog
+        or None and the volumes, it raises ReadError.
+        """
+        value = conf.get('snapshot_enabled')
+        if value is not None:
+            self.enabled = str(value).lower() in ('true', '1', 'yes', 'on')
+        self.interval = float(conf.get('snapshot_interval', self.interval))
+        self.max_staleness = float(conf.get('snapshot_max_staleness',
+                                            3 * self.interval))
+        self.idle_timeout = float(conf.get('snapshot_idle_timeout',
+                                           self.idle_timeout))
+        self.max_tenants = int(conf.get('snapshot_max_tenants',
+                                        self.max_tenants))
+        self.concurrency = int(conf.get('snapshot_concurrency',
+                                        self.concurrency))
+        self.reader = reader
+
+    def touch(self, tenant_id, env):
+        """
+        Mark the tenant as active. env is the environ of a request
+        authenticated for the tenant, its credentials are used for the
+        next reads of the tenant snapshot.
+        """
+        if not self.enabled:
+            return
+        env = reader_env(env)
+        with self._lock:
+            snapshot = self._tenants.get(tenant_id)
+            if snapshot is None:
+                if len(self._tenants) >= self.max_tenants:
+                    oldest = min(self._tenants.values(),
+                                 key=lambda item: item.used)
+                    del self._tenants[oldest.tenant_id]
+                snapshot = TenantSnapshot(tenant_id, env)
+                self._tenants[tenant_id] = snapshot
+            else:
+                snapshot.env = env
+                snapshot.used = time.time()
+            if self._poller is None:
+                self._poller = eventlet.spawn(self._poll)
+
+    def fresh(self, tenant_id):
+        """
+        Return the snapshot of the tenant when reads may be answered from
+        it, otherwise None
+        """
+        if not self.enabled:
+            return None
+        snapshot = self._tenants.get(tenant_id)
+        if (snapshot is None or snapshot.read_at is None or
+            time.time() - snapshot.read_at > self.max_staleness or
+            snapshot.generation != GENERATIONS.get(tenant_id)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return snapshot
+
+    def _due(self, now):
+        """
+        Drop the idle tenants and return the snapshots to refresh
+        """
+        due = []
+        with self._lock:
+            for tenant_id, snapshot in self._tenants.items():
+                if now - snapshot.used > self.idle_timeout:
+                    del self._tenants[tenant_id]
+                elif not snapshot.refreshing and (
+                     now - snapshot.attempted >= self.interval or
+                     snapshot.generation != GENERATIONS.get(tenant_id)):
+                    snapshot.refreshing = True
+                    due.append(snapshot)
+        return due
+
+    def _poll(self):
+        pool = GreenPool(self.concurrency)
+        while True:
+            try:
+                for snapshot in self._due(time.time()):
+                    pool.spawn_n(self._refresh, snapshot)
+            except Exception:
+                LOG.exception('inventory snapshot poller failed')
+            eventlet.sleep(min(self.interval, 1.0))
+
+    def _refresh(self, snapshot):
+        started = snapshot.attempted = time.time()
+        generation = GENERATIONS.get(snapshot.tenant_id)
+        full = snapshot.read_at is None
+        since = None if full else snapshot.read_at - CLOCK_SKEW
+        try:
+            servers, flavors, volumes = self.reader(snapshot.tenant_id,
+                                                    snapshot.env, since)
+            snapshot.update(servers, full, flavors, volumes, started,
+                            generation)
+            self.refreshes += 1
+        except ReadError as error:
+            self.failures += 1
+            LOG.info('inventory snapshot of %s not read: %s',
+                     snapshot.tenant_id, error)
+            if error.status in (401, 403):
+                # the credentials expired, wait for the next request
+                with self._lock:
+                    if self._tenants.get(snapshot.tenant_id) is snapshot:
+                        del self._tenants[snapshot.tenant_id]
+        except Exception:
+            self.failures += 1
+            LOG.exception('inventory snapshot of %s failed',
+                          snapshot.tenant_id)
+        finally:
+            snapshot.refreshing = False
+
+    def lags(self):
+        """
+        The largest number of seconds since a snapshot was last read
+        completely, or since its tenant became active when it never was,
+        and the number of snapshots older than max_staleness, which are
+        not used to answer reads
+        """
+        now = time.time()
+        lags = [now - (snapshot.read_at or snapshot.added)
+                for snapshot in self._tenants.values()]
+        return {'max_seconds': max(lags or [0.0]),
+                'stale': len([lag for lag in lags
+                              if lag > self.max_staleness])}
+
+    def stats(self):
+        return {'tenants': len(self._tenants), 'refreshes': self.refreshes,
+                'failures': self.failures, 'hits': self.hits,
+                'misses': self.misses}
+
+
+SNAPSHOTS = Snapshots()
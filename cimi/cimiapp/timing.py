@@ -0,0 +1,218 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Timing spans of a request, sent in a Server-Timing header and written to
+# the slow request log. Like cimiutils, this module must not reference any
+# cimi implementation modules.
+
+from nova.openstack.common import log as logging
+from eventlet import corolocal
+import time
+
+LOG = logging.getLogger(__name__)
+
+# the environ key of the timings, the subrequest environs are copies of
+# the request one so the backend calls find them there
+ENV_KEY = 'cimi.timings'
+
+BACKENDS = ('nova', 'cinder')
+
+# the timings of the request the green thread handles, serialization has
+# no environ to find them in
+_LOCAL = corolocal.local()
+
+
+def current():
+    return getattr(_LOCAL, 'timings', None)
+
+
+def activate(timings):
+    _LOCAL.timings = timings
+
+
+class Timings(object):
+    """
+    The spans of one request, as (name, description, start, end). The
+    spans of backend calls running at the same time overlap.
+    """
+
+    def __init__(self, send_header=False):
+        self.start = time.time()
+        self.send_header = send_header
+        self.spans = []
+
+    def add(self, name, start, end=None, desc=None):
+        if end is None:
+            end = time.time()
+        self.spans.append((name, desc, start, end))
+
+    def _busy(self, names, start, end):
+        """
+        The time between start and end during which a span of one of the
+        names was running
+        """
+        intervals = sorted((max(span[2], start), min(span[3], end))
+                           for span in self.spans if span[0] in names)
+        busy, reached = 0.0, start
+        for low, high in intervals:
+            low = max(low, reached)
+            if high > low:
+                busy += high - low
+                reached = high
+        return busy
+
+    def summary(self):
+        """
+        The spans as (name, description, seconds) and, once the handler
+        ran, map: the handler time spent neither waiting for the backends
+        nor serializing
+        """
+        entries = [(name, desc, end - start)
+                   for name, desc, start, end in self.spans]
+        for name, desc, start, end in self.spans:
+            if name == 'handler':
+                spent = end - start - self._busy(BACKENDS, start, end) - \
+                    self._busy(('serialize',), start, end)
+                entries.append(('map', None, max(spent, 0.0)))
+        entries.append(('total', None, time.time() - self.start))
+        return entries
+
+    def header(self):
+        """
+        The value of the Server-Timing header, in milliseconds
+        """
+        metrics = []
+        for name, desc, spent in self.summary():
+            metric = name
+            if desc:
+                metric += ';desc="%s"' % desc.replace('\\', '\\\\').\
+                    replace('"', '\\"')
+            metrics.append('%s;dur=%.2f' % (metric, spent * 1000))
+        return ', '.join(metrics)
+
+    def breakdown(self):
+        """
+        The spans for the slow request log
+        """
+        return ' '.join('%s%s=%.1fms' % (name, '(%s)' % desc if desc else '',
+                                        spent * 1000)
+                        for name, desc, spent in self.summary())
+
+
+class timed(object):
+    """
+    Add a span for the with block to the timings, nothing is done when
+    timings is None
+    """
+
+    def __init__(self, timings, name, desc=None):
+        self.timings = timings
+        self.name = name
+        self.desc = desc
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, self.start, desc=self.desc)
+
+
+def timed_iter(body, timings, name='serialize'):
+    """
+    Hand out the chunks of body, the time taken to make them is added to
+    the timings as one span once the body is done
+    """
+    spent = 0.0
+    chunks = iter(body)
+    while True:
+        start = time.time()
+        try:
+            chunk = chunks.next()
+        except StopIteration:
+            spent += time.time() - start
+            break
+        spent += time.time() - start
+        yield chunk
+    timings.add(name, time.time() - spent, desc='streamed')
+
+
+class TimedApp(object):
+    """
+    Wraps the application behind the middleware, so that each subrequest
+    sent to it adds a span to the timings of its request
+    """
+
+    def __init__(self, app, backend='nova'):
+        self.app = app
+        self.backend = backend
+
+    def __call__(self, env, start_response):
+        timings = env.get(ENV_KEY)
+        if timings is None:
+            return self.app(env, start_response)
+        with timed(timings, self.backend, '%s %s%s' % (
+                env.get('REQUEST_METHOD', 'GET'), env.get('SCRIPT_NAME', ''),
+                env.get('PATH_INFO', ''))):
+            return self.app(env, start_response)
+
+
+class ServerTiming(object):
+    """
+    Decides which requests are timed. The Server-Timing header is sent for
+    every request when server_timing is set, otherwise for the requests
+    carrying the server_timing_header. Requests taking longer than
+    slow_request_threshold seconds are logged with their spans.
+    """
+
+    def __init__(self, conf):
+        self.always = str(conf.get('server_timing', 'false')).lower() in \
+            ('true', '1', 'yes', 'on')
+        header = conf.get('server_timing_header', 'X-CIMI-Timing')
+        self.header_key = 'HTTP_' + header.upper().replace('-', '_') \
+            if header else None
+        self.threshold = float(conf.get('slow_request_threshold') or 0)
+
+    def start(self, env):
+        """
+        Return the timings of the request, None when it is not timed
+        """
+        send_header = self.always or (self.header_key is not None and
+            str(env.get(self.header_key, '')).lower() in
+            ('true', '1', 'yes', 'on'))
+        if not send_header and self.threshold <= 0:
+            return None
+        timings = Timings(send_header)
+        env[ENV_KEY] = timings
+        return timings
+
+    def finish(self, timings, res):
+        """
+        Add the Server-Timing header when it was asked for
+        """
+        if timings is not None and timings.send_header:
+            res.headers['Server-Timing'] = timings.header()
+        return res
+
+    def slow(self, timings):
+        return timings is not None and self.threshold > 0
+
+    def log_slow(self, timings, env, method, status, duration):
+        if duration < self.threshold:
+            return
+        path = env.get('SCRIPT_NAME', '') + env.get('PATH_INFO', '')
+        if env.get('QUERY_STRING'):
+            path = '?'.join([path, env['QUERY_STRING']])
+        LOG.warning('slow request %s %s %s %.1fms: %s', method, path, status,
+                    duration * 1000, timings.breakdown())
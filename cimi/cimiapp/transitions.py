@@ -0,0 +1,259 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Tracks the machines which are in a transitional state after a request
+# of the middleware, polling Nova for them in the background. Like
+# cimiutils, this module must not reference any cimi implementation
+# modules.
+
+from nova.openstack.common import log as logging
+import threading
+import time
+
+import eventlet
+from eventlet.greenpool import GreenPool
+
+from cimiutils import map_machine_state
+from conditional import CLOCK_SKEW, GENERATIONS
+from snapshot import ReadError, reader_env
+
+LOG = logging.getLogger(__name__)
+
+# the cimi machine states a machine only passes through
+TRANSITIONAL_STATES = ('CREATING', 'STARTING', 'STOPPING', 'PAUSING',
+                       'SUSPENDING', 'DELETING', 'RESTORING', 'CAPTURING')
+
+
+class TrackedMachine(object):
+    """
+    A machine expected to reach the state expected, None when any state
+    which is not transitional will do. updated is the Nova updated time of
+    the server before the request, the server has not moved as long as it
+    is unchanged.
+    """
+
+    def __init__(self, expected, updated):
+        self.expected = expected
+        self.updated = updated
+        self.added = time.time()
+        self.server = None
+
+    def settled(self, server):
+        if server.get('status') == 'DELETED':
+            return True
+        if self.updated is not None and server.get('updated') == self.updated:
+            return False
+        state = map_machine_state(server.get('status'))
+        if state == 'ERROR':
+            return True
+        if self.expected is not None:
+            return state == self.expected
+        return state not in TRANSITIONAL_STATES
+
+
+class TenantTransitions(object):
+    """
+    The tracked machines of one tenant, polled together. delay is the time
+    to the next poll, it doubles after every poll. read_at is the time the
+    last poll started and generation the tenant generation at that time.
+    """
+
+    def __init__(self, tenant_id, env, delay):
+        self.tenant_id = tenant_id
+        self.env = env
+        self.machines = {}
+        self.delay = delay
+        self.next_poll = time.time() + delay
+        self.read_at = None
+        self.generation = None
+        self.polling = False
+
+
+class TransitionTracker(object):
+    """
+    Keeps the machines a create or an action request put in motion until
+    they settle, and answers reads of them in the meantime.
+
+    All tracked machines of a tenant are read with one Nova changes-since
+    listing. The first poll follows poll_min seconds after a machine is
+    tracked, each poll doubles the delay up to poll_max. A machine which
+    did not settle after timeout seconds is dropped. A tracked machine
+    answers reads once it was polled, as long as no other write of its
+    tenant went through the middleware since the poll.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.poll_min = 0.5
+        self.poll_max = 8.0
+        self.timeout = 600.0
+        self.max_machines = 10000
+        self.reader = None
+        self.polls = 0
+        self.failures = 0
+        self.settled = 0
+        self.timeouts = 0
+        self.hits = 0
+        self._tenants = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def configure(self, conf, reader):
+        """
+        Pick up the tracker settings from the filter configuration.
+        reader(tenant_id, env, since) returns the servers changed since the
+        given time, deleted ones included, it raises ReadError.
+        """
+        value = conf.get('transition_tracking')
+        if value is not None:
+            self.enabled = str(value).lower() in ('true', '1', 'yes', 'on')
+        self.poll_min = float(conf.get('transition_poll_min', self.poll_min))
+        self.poll_max = float(conf.get('transition_poll_max', self.poll_max))
+        self.timeout = float(conf.get('transition_timeout', self.timeout))
+        self.max_machines = int(conf.get('transition_max_machines',
+                                         self.max_machines))
+        self.reader = reader
+
+    def track(self, tenant_id, server_id, env, expected=None, updated=None):
+        """
+        Track a machine a request of the tenant put in motion, env is the
+        environ of the request. See TrackedMachine for expected and
+        updated.
+        """
+        if not self.enabled:
+            return
+        env = reader_env(env)
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            new = tenant is None or server_id not in tenant.machines
+            if new and self._count >= self.max_machines:
+                return
+            if tenant is None:
+                tenant = TenantTransitions(tenant_id, env, self.poll_min)
+                self._tenants[tenant_id] = tenant
+            tenant.env = env
+            if new:
+                self._count += 1
+            tenant.machines[server_id] = TrackedMachine(expected, updated)
+            # the machine moves now, poll soon
+            tenant.delay = self.poll_min
+            tenant.next_poll = min(tenant.next_poll,
+                                   time.time() + self.poll_min)
+            if self._poller is None:
+                self._poller = eventlet.spawn(self._poll)
+
+    def server(self, tenant_id, server_id):
+        """
+        Return the server of a tracked machine as last polled, None when
+        the machine is not tracked or may have changed since
+        """
+        if not self.enabled:
+            return None
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None or \
+           tenant.generation != GENERATIONS.get(tenant_id):
+            return None
+        machine = tenant.machines.get(server_id)
+        if machine is None or machine.server is None:
+            return None
+        self.hits += 1
+        return machine.server
+
+    def _due(self, now):
+        due = []
+        with self._lock:
+            for tenant in self._tenants.values():
+                if not tenant.polling and tenant.next_poll <= now:
+                    tenant.polling = True
+                    due.append(tenant)
+        return due
+
+    def _poll(self):
+        pool = GreenPool(4)
+        while True:
+            try:
+                for tenant in self._due(time.time()):
+                    pool.spawn_n(self._refresh, tenant)
+            except Exception:
+                LOG.exception('transition tracker poller failed')
+            eventlet.sleep(self.poll_min)
+
+    def _refresh(self, tenant):
+        started = time.time()
+        generation = GENERATIONS.get(tenant.tenant_id)
+        if tenant.read_at is not None:
+            since = tenant.read_at
+        else:
+            since = min(machine.added
+                        for machine in tenant.machines.values())
+        try:
+            servers = self.reader(tenant.tenant_id, tenant.env,
+                                  since - CLOCK_SKEW)
+            self.polls += 1
+            self._update(tenant, servers, started, generation)
+        except ReadError as error:
+            self.failures += 1
+            LOG.info('transitions of %s not read: %s', tenant.tenant_id,
+                     error)
+            if error.status in (401, 403):
+                self._drop(tenant, list(tenant.machines))
+        except Exception:
+            self.failures += 1
+            LOG.exception('transitions of %s failed', tenant.tenant_id)
+        finally:
+            expired = [server_id for server_id, machine
+                       in tenant.machines.items()
+                       if started - machine.added > self.timeout]
+            self.timeouts += len(expired)
+            self._drop(tenant, expired)
+            tenant.delay = min(tenant.delay * 2, self.poll_max)
+            tenant.next_poll = time.time() + tenant.delay
+            tenant.polling = False
+
+    def _update(self, tenant, servers, started, generation):
+        """
+        Take in the servers a poll read and drop the tracked machines
+        which settled
+        """
+        done = []
+        for server in servers:
+            machine = tenant.machines.get(server['id'])
+            if machine is None:
+                continue
+            if machine.settled(server):
+                self.settled += 1
+                done.append(server['id'])
+            else:
+                machine.server = server
+        tenant.read_at = started
+        tenant.generation = generation
+        self._drop(tenant, done)
+
+    def _drop(self, tenant, server_ids):
+        with self._lock:
+            for server_id in server_ids:
+                if tenant.machines.pop(server_id, None) is not None:
+                    self._count -= 1
+            if not tenant.machines and \
+               self._tenants.get(tenant.tenant_id) is tenant:
+                del self._tenants[tenant.tenant_id]
+
+    def stats(self):
+        return {'tracked': self._count, 'polls': self.polls,
+                'failures': self.failures, 'settled': self.settled,
+                'timeouts': self.timeouts, 'hits': self.hits}
+
+
+TRANSITIONS = TransitionTracker()
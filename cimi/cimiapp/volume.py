@@ -15,6 +15,7 @@
 
 from nova.openstack.common import log as logging
 from webob import Request, Response
+from urllib import urlencode
 import json
 import copy
 
@@ -24,6 +25,10 @@ from cimibase import make_response_data
 from cimibase import get_request_data
 from cimiutils import concat, get_err_response, map_volume_state
 from cimiutils import match_up, sub_path, access_resource, has_extra
+from cimiutils import get_paging, get_select, project, VOLUME_STATE_MAP
+from cimiutils import carried_query, get_wait
+from cimifilter import get_filter, equal_rule, state_rule
+from waiters import WAITERS
 from nova.api.openstack.wsgi import XMLDictSerializer, JSONDictSerializer
 
 LOG = logging.getLogger(__name__)
@@ -33,34 +38,62 @@ class VolumeCtrler(Controller):
     """
     Handles machine request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(VolumeCtrler, self).__init__(conf, app, req, tenant_id,
-                                            *args)
-        self.os_path = '/%s/volumes/%s' % (tenant_id, args[0])
+    def __init__(self, conf, app):
+        super(VolumeCtrler, self).__init__(conf, app)
         self.entity_uri = 'Volume'
         self.metadata = Consts.VOLUME_METADATA
         self.actions = {concat(self.uri_prefix, '/action/restart'): 'reboot',
                         concat(self.uri_prefix, '/action/stop'): 'delete'}
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/volumes/%s' % (tenant_id, args[0])
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET Container (List Objects) request
         """
 
-        env = self._fresh_env(req)
-        env['SERVER_PORT'] = self.conf.get('volume_endpoint_port')
-        env['SCRIPT_NAME'] = '/v1'
-        env['HTTP_HOST'] = '%s:%s' % \
-            (self.conf.get('volume_endpoint_host'),
-             self.conf.get('volume_endpoint_port'))
-        env['CONTENT_LENGTH'] = 0
-
-        status, headers, body, status_code = access_resource(env, 'GET',
-            '/v1' + self.os_path, True, None, None)
+        try:
+            select = get_select(req.GET)
+            wait = get_wait(req.GET, VOLUME_STATE_MAP, WAITERS.max_timeout)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        snapshot = self._snapshot(req)
+        data = snapshot.volumes.get(parts[0]) if snapshot else None
+        if data is not None:
+            status, status_code = True, 200
+        else:
+            env = self._fresh_env(req)
+            env['SERVER_PORT'] = self.conf.get('volume_endpoint_port')
+            env['SCRIPT_NAME'] = '/v1'
+            env['HTTP_HOST'] = '%s:%s' % \
+                (self.conf.get('volume_endpoint_host'),
+                 self.conf.get('volume_endpoint_port'))
+            env['CONTENT_LENGTH'] = 0
+
+            status, headers, body, status_code = access_resource(env, 'GET',
+                '/v1' + self.os_path, True, None, None)
+            if status:
+                data = json.loads(body).get('volume')
+
+        # wait for the shared poller to see the volume in one of the
+        # states asked for, Cinder lists no deleted volumes
+        if status and wait is not None and \
+           map_volume_state(data['status']) not in wait[0]:
+            polled = WAITERS.wait(self.tenant_id, 'volumes', parts[0],
+                                  req.environ, *wait)
+            if polled is not None:
+                data = polled
 
         if status:
-            data = json.loads(body).get('volume')
+            # Cinder gives no updated time, the etag covers the whole
+            # volume, whether it was read or taken from the snapshot
+            etag = self._etag(req, json.dumps(data, sort_keys=True))
+            not_modified = self._not_modified(req, etag)
+            if not_modified:
+                return not_modified
 
             body = {}
             body['id'] = '/'.join([self.tenant_id, 'Volume', parts[0]])
@@ -78,7 +111,7 @@ class VolumeCtrler(Controller):
                 '/'.join([self.tenant_id, 'volume',
                           parts[0]])))
             body['operations'] = operations
-
+            body = project(body, select)
 
             if self.res_content_type == 'application/xml':
                 response_data = {'Volume': body}
@@ -90,10 +123,12 @@ class VolumeCtrler(Controller):
             new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
             resp = Response()
             self._fixup_cimi_header(resp)
             resp.headers['Content-Type'] = self.res_content_type
+            resp.headers['ETag'] = etag
             resp.status = status_code
             resp.body = new_content
             return resp
@@ -127,58 +162,88 @@ class VolumeColCtrler(Controller):
     """
     Handles machine collection request.
     """
-    def __init__(self, conf, app, req, tenant_id, *args):
-        super(VolumeColCtrler, self).__init__(conf, app, req, tenant_id,
-                                                     *args)
-        self.os_path = '/%s/volumes/detail' % (tenant_id)
+    # $filter comparisons Cinder can evaluate, it compares the status as is
+    FILTER_RULES = {'name': equal_rule('display_name'),
+                    'state': state_rule('status', VOLUME_STATE_MAP)}
+
+    def __init__(self, conf, app):
+        super(VolumeColCtrler, self).__init__(conf, app)
         self.entity_uri = 'VolumeCollection'
         self.metadata = Consts.VOLUME_COL_METADATA
         self.volume_metadata = Consts.VOLUME_METADATA
 
+    def _bind(self, tenant_id, *args):
+        self.os_path = '/%s/volumes/detail' % (tenant_id)
+
+    def _make_entry(self, volume):
+        """
+        Convert one Cinder volume into a volume collection entry
+        """
+        entry = {}
+        if self.res_content_type != 'application/xml':
+            entry['resourceURI'] = '/'.join([self.uri_prefix,
+                                         'Volume'])
+        entry['id'] = '/'.join([self.tenant_id, 'Volume',
+                                volume['id']])
+        entry['name'] = volume['display_name']
+        entry['description'] = volume['display_description']
+        entry['created'] = volume['created_at']
+        entry['state'] = map_volume_state(volume['status'])
+        entry['capacity'] = int(volume['size']) * 1000000
+        entry['bootable'] = 'false'
+        entry['type'] = 'http://schemas.dmtf.org/cimi/1/mapped'
+        return entry
+
     # Use GET to handle all container read related operations.
     def GET(self, req, *parts):
         """
         Handle GET machine request
         """
 
-        env = self._fresh_env(req)
-        env['SERVER_PORT'] = self.conf.get('volume_endpoint_port')
-        env['SCRIPT_NAME'] = '/v1'
-        env['HTTP_HOST'] = '%s:%s' % (self.conf.get('volume_endpoint_host'),
-                                    self.conf.get('volume_endpoint_port'))
-
-        status, headers, body, status_code = access_resource(env, 'GET',
-                                               '/v1/' + self.os_path,
-                                               True, None)
+        try:
+            paging = get_paging(req.GET)
+            cimi_filter = get_filter(req.GET)
+            select = get_select(req.GET)
+        except ValueError:
+            return get_err_response('BadRequest')
+
+        snapshot = self._snapshot(req)
+        params, residual = {}, None
+        if cimi_filter and snapshot is not None:
+            residual = cimi_filter.compile()
+        elif cimi_filter:
+            params, residual = cimi_filter.pushdown(self.FILTER_RULES)
+
+        # Cinder takes limit and marker too, but the residual filter and the
+        # etag below work on the whole listing: it is read whole and the
+        # page is cut out here
+        if snapshot is not None:
+            status, volumes = True, snapshot.volume_list
+        else:
+            status, headers, body, status_code = self._volume_request(req,
+                'GET', self.os_path, urlencode(params))
+            if status:
+                volumes = json.loads(body).get('volumes', [])
         if status:
-            content = json.loads(body)
+            # Cinder can not tell what changed since a time, the listing is
+            # always read and its etag covers the whole listing
+            etag = self._etag(req, json.dumps(volumes, sort_keys=True))
+            not_modified = self._not_modified(req, etag)
+            if not_modified:
+                return not_modified
             body = {}
             body['resourceURI'] = '/'.join([self.uri_prefix,
                                             self.entity_uri])
             body['id'] = '/'.join([self.tenant_id, self.entity_uri])
-            body['volumes'] = []
-            volumes = content.get('volumes', [])
-            for volume in volumes:
-                entry = {}
-                if self.res_content_type != 'application/xml':
-                    entry['resourceURI'] = '/'.join([self.uri_prefix,
-                                                 'Volume'])
-                entry['id'] = '/'.join([self.tenant_id, 'Volume',
-                                        volume['id']])
-                entry['name'] = volume['display_name']
-                entry['description'] = volume['display_description']
-                entry['created'] = volume['created_at']
-                entry['state'] = map_volume_state(volume['status'])
-                entry['capacity'] = int(volume['size']) * 1000000
-                entry['bootable'] = 'false'
-                entry['type'] = 'http://schemas.dmtf.org/cimi/1/mapped'
-
-                body['volumes'].append(entry)
-            
+            body['volumes'], has_more = self._make_entries(volumes,
+                self._make_entry, paging, residual, select=select)
+
             operations = []
             operations.append(self._create_op('add',
                 '/'.join([self.tenant_id, 'volumeCollection'])))
             body['operations'] = operations
+            self._add_paging_ops(body, body['id'], paging, has_more,
+                                 extra=carried_query(req.GET))
 
             body['count'] = len(body['volumes'])
             if self.res_content_type == 'application/xml':
@@ -186,17 +251,8 @@ class VolumeColCtrler(Controller):
             else:
                 response_data = body
 
-            new_content = make_response_data(response_data,
-                                             self.res_content_type,
-                                             self.metadata,
-                                             self.uri_prefix)
-            resp = Response()
-            self._fixup_cimi_header(resp)
-            resp.headers['Content-Type'] = self.res_content_type
-            resp.status = 200
-            resp.body = new_content
-
-            return resp
+            return self._collection_response(response_data, self.metadata,
+                                             etag)
         else:
             resp = Response()
             resp.status = 404
@@ -279,7 +335,8 @@ class VolumeColCtrler(Controller):
                     new_content = make_response_data(response_data,
                                              self.res_content_type,
                                              self.volume_metadata,
-                                             self.uri_prefix)
+                                             self.uri_prefix,
+                                             self.pretty)
                     resp = Response()
                     self._fixup_cimi_header(resp)
                     resp.headers['Content-Type'] = self.res_content_type
@@ -288,6 +345,8 @@ class VolumeColCtrler(Controller):
                                   location])
                     resp.status = 201
                     resp.body = new_content
+                    self._start_job(req, resp, 'add', location, 'volumes',
+                                    data.get('id'), ['AVAILABLE'])
                     return resp
                 else:
                     return get_err_response('BadRequest')
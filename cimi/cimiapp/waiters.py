@@ -0,0 +1,201 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Requests waiting for a machine or a volume to reach a state, woken by a
+# shared poller. Like cimiutils, this module must not reference any cimi
+# implementation modules.
+
+from nova.openstack.common import log as logging
+import threading
+import time
+
+import eventlet
+from eventlet.event import Event
+from eventlet.greenpool import GreenPool
+
+from cimiutils import map_machine_state, map_volume_state
+from conditional import CLOCK_SKEW
+from snapshot import ReadError, reader_env
+
+LOG = logging.getLogger(__name__)
+
+# the state of a resource of each kind
+STATE_OF = {'servers': lambda server: map_machine_state(server['status']),
+            'volumes': lambda volume: map_volume_state(volume['status'])}
+
+
+class Waiter(object):
+    """
+    One request waiting for a resource to be in one of the states, resource
+    is the resource as last polled
+    """
+
+    def __init__(self, states):
+        self.states = states
+        self.event = Event()
+        self.added = time.time()
+        self.resource = None
+
+
+class TenantWaiters(object):
+    """
+    The waiting requests of one tenant, keyed by kind and resource id.
+    read_at is the time the last Nova read of the tenant started.
+    """
+
+    def __init__(self, tenant_id, env):
+        self.tenant_id = tenant_id
+        self.env = env
+        self.waiters = {}
+        self.read_at = None
+        self.polling = False
+
+
+class StateWaiters(object):
+    """
+    Holds the requests waiting for a machine or a volume to reach a state.
+    One green thread polls every interval seconds for all tenants with
+    waiting requests: the servers of a tenant with one Nova changes-since
+    listing, its volumes with one Cinder listing. The requests whose
+    resource reached one of their states are woken with the resource.
+    """
+
+    def __init__(self):
+        self.interval = 1.0
+        self.max_timeout = 60.0
+        self.servers_reader = None
+        self.volumes_reader = None
+        self.polls = 0
+        self.failures = 0
+        self.woken = 0
+        self.timeouts = 0
+        self._tenants = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def configure(self, conf, servers_reader, volumes_reader):
+        """
+        Pick up the settings from the filter configuration. The readers
+        take the tenant id and an environ, servers_reader also the time
+        since which servers changed, and raise ReadError.
+        """
+        self.interval = float(conf.get('wait_poll_interval', self.interval))
+        self.max_timeout = float(conf.get('wait_max_timeout',
+                                          self.max_timeout))
+        self.servers_reader = servers_reader
+        self.volumes_reader = volumes_reader
+
+    def wait(self, tenant_id, kind, resource_id, env, states, timeout):
+        """
+        Wait at most timeout seconds for the servers or volumes resource to
+        be in one of the states, env is the environ of the waiting request.
+        Returns the resource as last polled, None when it was not polled.
+        """
+        waiter = Waiter(states)
+        key = (kind, resource_id)
+        env = reader_env(env)
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is None:
+                tenant = TenantWaiters(tenant_id, env)
+                self._tenants[tenant_id] = tenant
+            else:
+                # the tenant is polled with the credentials of its latest
+                # request, those of the first may have expired
+                tenant.env = env
+            tenant.waiters.setdefault(key, []).append(waiter)
+            self._count += 1
+            if self._poller is None:
+                self._poller = eventlet.spawn(self._poll)
+        try:
+            with eventlet.Timeout(timeout, False):
+                return waiter.event.wait()
+            self.timeouts += 1
+            return waiter.resource
+        finally:
+            with self._lock:
+                waiters = tenant.waiters.get(key, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                    self._count -= 1
+                if not waiters:
+                    tenant.waiters.pop(key, None)
+                if not tenant.waiters and \
+                   self._tenants.get(tenant_id) is tenant:
+                    del self._tenants[tenant_id]
+
+    def _poll(self):
+        pool = GreenPool(4)
+        while True:
+            try:
+                with self._lock:
+                    due = [tenant for tenant in self._tenants.values()
+                           if not tenant.polling]
+                    for tenant in due:
+                        tenant.polling = True
+                for tenant in due:
+                    pool.spawn_n(self._refresh, tenant)
+            except Exception:
+                LOG.exception('state waiter poller failed')
+            eventlet.sleep(self.interval)
+
+    def _refresh(self, tenant):
+        try:
+            kinds = set(kind for kind, resource_id in tenant.waiters.keys())
+            if 'servers' in kinds:
+                started = time.time()
+                since = tenant.read_at
+                if since is None:
+                    since = min(waiter.added
+                                for (kind, resource_id), waiters
+                                in tenant.waiters.items()
+                                for waiter in waiters) - CLOCK_SKEW
+                self._wake(tenant, 'servers', self.servers_reader(
+                    tenant.tenant_id, tenant.env, since))
+                tenant.read_at = started - CLOCK_SKEW
+            if 'volumes' in kinds:
+                self._wake(tenant, 'volumes', self.volumes_reader(
+                    tenant.tenant_id, tenant.env))
+            self.polls += 1
+        except ReadError as error:
+            self.failures += 1
+            LOG.info('waited resources of %s not read: %s',
+                     tenant.tenant_id, error)
+        except Exception:
+            self.failures += 1
+            LOG.exception('waited resources of %s failed', tenant.tenant_id)
+        finally:
+            tenant.polling = False
+
+    def _wake(self, tenant, kind, resources):
+        state_of = STATE_OF[kind]
+        for resource in resources:
+            waiters = tenant.waiters.get((kind, resource['id']))
+            if not waiters:
+                continue
+            state = state_of(resource)
+            for waiter in list(waiters):
+                waiter.resource = resource
+                if state in waiter.states and not waiter.event.ready():
+                    self.woken += 1
+                    waiter.event.send(resource)
+
+    def stats(self):
+        return {'waiting': self._count, 'polls': self.polls,
+                'failures': self.failures, 'woken': self.woken,
+                'timeouts': self.timeouts}
+
+
+WAITERS = StateWaiters()
@@ -0,0 +1,242 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Streaming XML writer for cimi responses. Like cimiutils, this module must
+# not reference any cimi implementation modules.
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# the writer hands out the document in chunks of at least this many bytes
+CHUNK_SIZE = 8192
+
+
+def escape(value):
+    """
+    Convert a value to an escaped utf-8 string, the same characters are
+    escaped as minidom does for both text and attribute values.
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif not isinstance(value, str):
+        value = str(value)
+    return value.replace('&', '&amp;').replace('<', '&lt;').\
+        replace('"', '&quot;').replace('>', '&gt;')
+
+
+def is_sequence(data):
+    """
+    Lists, tuples and lazily produced lists of entries are all written as
+    repeated elements
+    """
+    return not isinstance(data, dict) and hasattr(data, '__iter__')
+
+
+def has_content(data):
+    """
+    Check if a value produces at least one element. Only lists can be
+    empty since their items are added to the parent element.
+    """
+    if isinstance(data, (list, tuple)):
+        for item in data:
+            if has_content(item):
+                return True
+        return False
+    elif is_sequence(data):
+        # lazily produced entries are never lists themselves
+        return len(data) > 0
+    return True
+
+
+class NodeRules(object):
+    """
+    The metadata rules of one element name, looked up once per writer
+    """
+    __slots__ = ('attrs', 'sequence', 'in_sequence', 'singular')
+
+    def __init__(self, nodename, metadata):
+        # attrs may be a plain string, its members are then tested as
+        # substrings, the same way the nova serializers do it
+        self.attrs = metadata.get('attributes', {}).get(nodename, {})
+        self.sequence = list(metadata.get('sequence', {}).get(nodename, []))
+        self.in_sequence = frozenset(self.sequence)
+        singular = metadata.get('plurals', {}).get(nodename, None)
+        if singular is None:
+            if nodename.endswith('s'):
+                singular = nodename[:-1]
+            else:
+                singular = 'item'
+        self.singular = singular
+
+
+class XMLWriter(object):
+    """
+    Writes a python object as xml without building a dom tree.
+
+    The metadata carries the same 'attributes', 'plurals' and 'sequence'
+    rules used by the nova xml serializers, and the elements come out in the
+    same order as the minidom based serializer produced them. The rules of
+    every element named in the metadata are looked up when the writer is
+    created, so one writer can be kept and used for many documents. When
+    pretty is set, the output is indented the way minidom toprettyxml does
+    it. The data is never changed.
+    """
+
+    def __init__(self, metadata, xmlns=None, pretty=False):
+        self.metadata = metadata
+        plurals = metadata.get('plurals', {})
+        names = set(metadata.get('attributes', {}))
+        names.update(plurals)
+        names.update(plurals.values())
+        names.update(metadata.get('sequence', {}))
+        self.rules = dict((name, NodeRules(name, metadata))
+                          for name in names)
+        self.xmlns = xmlns
+        if pretty:
+            self.indents = ['  ' * depth for depth in range(16)]
+            self.newl = '\n'
+        else:
+            self.indents = [''] * 16
+            self.newl = ''
+
+    def indent(self, depth):
+        if depth < len(self.indents):
+            return self.indents[depth]
+        return self.indents[1] * depth
+
+    def node_rules(self, nodename):
+        rules = self.rules.get(nodename)
+        if rules is None:
+            # element names come from the code, there are only a few
+            rules = self.rules[nodename] = NodeRules(nodename, self.metadata)
+        return rules
+
+    def singular(self, nodename):
+        return self.node_rules(nodename).singular
+
+    def split(self, nodename, data):
+        """
+        Split the members of a dict into attributes and child elements.
+        Members named in the sequence come first, in the sequence order,
+        then the rest in the dict order. The dict is not changed.
+        """
+        rules = self.node_rules(nodename)
+        attrs = rules.attrs
+        attributes = {}
+        children = []
+        for k in rules.sequence:
+            if k in data:
+                if k in attrs:
+                    attributes[k] = data[k]
+                else:
+                    children.append((k, data[k]))
+        in_sequence = rules.in_sequence
+        for k, v in data.items():
+            if k in in_sequence:
+                continue
+            if k in attrs:
+                attributes[k] = v
+            else:
+                children.append((k, v))
+        return attributes, children
+
+    def start_tag(self, out, nodename, attributes, depth, empty):
+        tag = [self.indent(depth), '<', nodename]
+        for name in sorted(attributes):
+            tag.append(' %s="%s"' % (name, escape(attributes[name])))
+        tag.append(empty and '/>' or '>')
+        tag.append(self.newl)
+        out.append(''.join(tag))
+
+    def end_tag(self, out, nodename, depth):
+        out.append('%s</%s>%s' % (self.indent(depth), nodename, self.newl))
+
+    def write(self, out, nodename, data, depth=0):
+        """
+        Append the xml of one member to the out list
+        """
+        if isinstance(data, dict):
+            attributes, children = self.split(nodename, data)
+            if self.xmlns and depth == 0:
+                attributes['xmlns'] = self.xmlns
+            empty = True
+            for k, v in children:
+                if has_content(v):
+                    empty = False
+                    break
+            self.start_tag(out, nodename, attributes, depth, empty)
+            if not empty:
+                for k, v in children:
+                    self.write(out, k, v, depth + 1)
+                self.end_tag(out, nodename, depth)
+        elif is_sequence(data):
+            singular = self.singular(nodename)
+            for item in data:
+                self.write(out, singular, item, depth)
+        elif self.xmlns and depth == 0:
+            out.append('%s<%s xmlns="%s">%s</%s>%s' % (self.indent(depth),
+                nodename, escape(self.xmlns), escape(data), nodename,
+                self.newl))
+        else:
+            out.append('%s<%s>%s</%s>%s' % (self.indent(depth), nodename,
+                                            escape(data), nodename,
+                                            self.newl))
+
+    def iter_document(self, data):
+        """
+        Yield the xml document for data, which should contain a single key
+        being the xml root. The members of the root element are written one
+        list item at a time so that a large collection never sits in memory
+        as a whole.
+        """
+        nodename = data.keys()[0]
+        value = data[nodename]
+
+        out = [XML_HEADER]
+        if not isinstance(value, dict):
+            self.write(out, nodename, value)
+            yield ''.join(out)
+            return
+
+        attributes, children = self.split(nodename, value)
+        if self.xmlns:
+            attributes['xmlns'] = self.xmlns
+        empty = True
+        for k, v in children:
+            if has_content(v):
+                empty = False
+                break
+        self.start_tag(out, nodename, attributes, 0, empty)
+        if empty:
+            yield ''.join(out)
+            return
+
+        size = 0
+        for k, v in children:
+            if is_sequence(v):
+                singular = self.singular(k)
+                for item in v:
+                    mark = len(out)
+                    self.write(out, singular, item, 1)
+                    size += sum([len(part) for part in out[mark:]])
+                    if size >= CHUNK_SIZE:
+                        yield ''.join(out)
+                        out = []
+                        size = 0
+            else:
+                self.write(out, k, v, 1)
+        self.end_tag(out, nodename, 0)
+        yield ''.join(out)
+
+    def to_string(self, data):
+        return ''.join(self.iter_document(data))
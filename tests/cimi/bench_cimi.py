@@ -0,0 +1,299 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Benchmark the cimi controllers without any running service.
+
+The middleware is put in front of the fake Nova WSGI application of
+fakecloud, as it is in the Nova pipeline, and the requests it sends over
+HTTP, to Cinder and to Nova, go to the same fakes served by a local eventlet
+server. The fakes hold one generated tenant, the latency, errors and payload
+of their endpoints are set with the fakecloud options. Every read of every
+controller is measured in JSON and in XML: throughput, latency percentiles
+and the memory the process grew by. Each case runs in a forked process so
+that its memory is its own.
+
+    python tests/cimi/bench_cimi.py --machines 500 --output run.json
+    python tests/cimi/bench_cimi.py --only Machine --compare run.json
+    python tests/cimi/bench_cimi.py --latency cinder:*=lognormal:20:0.8
+"""
+
+from optparse import OptionParser
+import json
+import os
+import resource
+import sys
+import time
+
+TESTS = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, os.path.join(TESTS, '..'))
+sys.path.insert(0, TESTS)
+
+import eventlet
+from webob import Request
+
+from cimi import filter_factory
+from fakecloud import FakeBackends, FakeCinder, FakeNova, serve
+from fakecloud.server import add_options, make_behaviours, make_tenant
+
+TENANT = 'bench'
+TOKEN = 'bench-token'
+
+# every read of the middleware, %(...)s are filled from the tenant samples
+CASES = [('CloudEntryPoint', 'cloudEntryPoint'),
+         ('MachineCollection', 'machineCollection'),
+         ('MachineCollection expanded', 'machineCollection?$expand=*'),
+         ('Machine', 'machine/%(server)s'),
+         ('MachineConfigurationCollection',
+          'machineConfigurationCollection'),
+         ('MachineConfiguration', 'machineConfiguration/%(flavor)s'),
+         ('MachineImageCollection', 'machineImageCollection'),
+         ('MachineImage', 'machineImage/%(image)s'),
+         ('NetworkInterfacesCollection',
+          'networkInterfacesCollection/%(server)s'),
+         ('MachineNetworkInterfaceAddressesCollection',
+          'machineNetworkInterfaceAddressesCollection/%(server)s/private'),
+         ('MachineNetworkInterfaceAddress',
+          'machineNetworkInterfaceAddress/%(server)s/private/%(ip)s'),
+         ('VolumeCollection', 'volumeCollection'),
+         ('Volume', 'volume/%(volume)s'),
+         ('MachineVolumeCollection',
+          'machineVolumeCollection/%(attached_server)s'),
+         ('MachineVolume',
+          'machineVolume/%(attached_server)s/%(attached_volume)s')]
+
+FORMATS = {'json': 'application/json', 'xml': 'application/xml'}
+
+
+class FakeContext(object):
+    """
+    The part of the nova request context the middleware looks at
+    """
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+
+
+def make_middleware(nova, port, options):
+    conf = {'volume_endpoint': 'http://127.0.0.1:%d/v1' % port,
+            'response_cache_enabled': str(options.cache).lower(),
+            'stream_collections': str(not options.buffered).lower()}
+    return filter_factory({}, **conf)(nova)
+
+
+def make_env(port, path, accept):
+    env = Request.blank(path, base_url='http://127.0.0.1:%d/cimiv1' %
+                        port).environ
+    env['HTTP_ACCEPT'] = accept
+    env['HTTP_X_AUTH_TOKEN'] = TOKEN
+    env['nova.context'] = FakeContext(TENANT)
+    return env
+
+
+def rss_kb():
+    """
+    The resident size of the process in KB, None where /proc is missing
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(round(fraction * len(values) + 0.5)) - 1)
+    return values[max(idx, 0)]
+
+
+def measure(tenant, name, path, fmt, options):
+    """
+    Run one case: start the backends and the middleware, send the warm up
+    requests, then the measured ones with the given concurrency
+    """
+    behaviours = make_behaviours(options)
+    nova = FakeNova([tenant], behaviours)
+    port = serve(FakeBackends(nova, FakeCinder([tenant], behaviours)))
+    app = make_middleware(nova, port, options)
+    accept = FORMATS[fmt]
+    latencies = []
+    counts = {'errors': 0, 'bytes': 0}
+
+    def one(idx):
+        env = make_env(port, '/%s/%s' % (TENANT, path % tenant.sample(idx)),
+                       accept)
+        status = []
+        start = time.time()
+        try:
+            body = app(env, lambda value, headers, exc_info=None:
+                       status.append(value))
+            try:
+                for chunk in body:
+                    counts['bytes'] += len(chunk)
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+        except Exception:
+            # the fault wrapper of the Nova pipeline would send a 500
+            del status[:]
+        latencies.append(time.time() - start)
+        if not status or not status[0].startswith('200'):
+            counts['errors'] += 1
+
+    for idx in range(options.warmup):
+        one(idx)
+    del latencies[:]
+    counts.update(errors=0, bytes=0)
+
+    baseline = rss_kb()
+    pool = eventlet.GreenPool(options.concurrency)
+    start = time.time()
+    for idx in range(options.requests):
+        pool.spawn_n(one, idx)
+    pool.waitall()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'name': name, 'format': fmt, 'path': path,
+            'requests': options.requests,
+            'concurrency': options.concurrency,
+            'errors': counts['errors'],
+            'throughput': options.requests / elapsed if elapsed else 0.0,
+            'response_bytes': counts['bytes'] / max(options.requests, 1),
+            'latency_ms': {
+                'mean': 1000 * sum(latencies) / max(len(latencies), 1),
+                'p50': 1000 * percentile(latencies, 0.50),
+                'p90': 1000 * percentile(latencies, 0.90),
+                'p99': 1000 * percentile(latencies, 0.99),
+                'max': 1000 * (latencies[-1] if latencies else 0.0)},
+            'peak_rss_kb': peak,
+            'rss_growth_kb': max(0, peak - baseline) if baseline else None}
+
+
+def run_case(tenant, name, path, fmt, options):
+    """
+    Measure the case in a child process so that the memory it reports is
+    its own and no state is shared with the other cases
+    """
+    if options.no_fork or not hasattr(os, 'fork'):
+        return measure(tenant, name, path, fmt, options)
+    reader, writer = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(reader)
+        code = 0
+        try:
+            try:
+                result = measure(tenant, name, path, fmt, options)
+            except Exception as error:
+                result = {'name': name, 'format': fmt, 'error': repr(error)}
+                code = 1
+            with os.fdopen(writer, 'w') as out:
+                out.write(json.dumps(result))
+        finally:
+            os._exit(code)
+    os.close(writer)
+    with os.fdopen(reader) as data:
+        result = json.loads(data.read() or 'null')
+    os.waitpid(pid, 0)
+    return result or {'name': name, 'format': fmt, 'error': 'no result'}
+
+
+def key_of(result):
+    return '%s [%s]' % (result['name'], result['format'])
+
+
+def report(results, previous=None):
+    print '%-50s %10s %9s %9s %9s %10s %6s' % ('case', 'req/s', 'p50 ms',
+        'p90 ms', 'p99 ms', 'grew KB', 'errors')
+    for result in results:
+        if 'error' in result:
+            print '%-50s failed: %s' % (key_of(result), result['error'])
+            continue
+        latency = result['latency_ms']
+        print '%-50s %10.1f %9.2f %9.2f %9.2f %10s %6d' % (key_of(result),
+            result['throughput'], latency['p50'], latency['p90'],
+            latency['p99'], result['rss_growth_kb'], result['errors'])
+        old = (previous or {}).get(key_of(result))
+        if old and 'error' not in old:
+            print '%-50s %+9.1f%% %+8.1f%% %+8.1f%% %+8.1f%%' % ('',
+                change(old['throughput'], result['throughput']),
+                change(old['latency_ms']['p50'], latency['p50']),
+                change(old['latency_ms']['p90'], latency['p90']),
+                change(old['latency_ms']['p99'], latency['p99']))
+
+
+def change(old, new):
+    return 100.0 * (new - old) / old if old else 0.0
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    add_options(parser)
+    parser.add_option('--requests', type='int', default=200,
+                      help='measured requests per case')
+    parser.add_option('--warmup', type='int', default=20)
+    parser.add_option('--concurrency', type='int', default=1)
+    parser.add_option('--format', action='append', dest='formats',
+                      choices=sorted(FORMATS.keys()),
+                      help='json or xml, both by default')
+    parser.add_option('--only', action='append',
+                      help='run the cases whose name starts with this')
+    parser.add_option('--cache', action='store_true', default=False,
+                      help='keep the response cache enabled')
+    parser.add_option('--buffered', action='store_true', default=False,
+                      help='send collections with a Content-Length')
+    parser.add_option('--no-fork', action='store_true', default=False,
+                      help='run every case in this process')
+    parser.add_option('--output', help='save the results to this file')
+    parser.add_option('--compare', help='results of an earlier run')
+    options, args = parser.parse_args()
+
+    tenant = make_tenant(TENANT, options)
+    previous = None
+    if options.compare:
+        with open(options.compare) as data:
+            previous = dict((key_of(result), result)
+                            for result in json.load(data)['results'])
+
+    results = []
+    for name, path in CASES:
+        if options.only and not [prefix for prefix in options.only
+                                 if name.startswith(prefix)]:
+            continue
+        for fmt in options.formats or sorted(FORMATS.keys()):
+            results.append(run_case(tenant, name, path, fmt, options))
+
+    report(results, previous)
+    if options.output:
+        run = {'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+               'python': sys.version.split()[0],
+               'options': dict((name, getattr(options, name))
+                               for name in ('machines', 'volumes', 'flavors',
+                                            'images', 'attachments',
+                                            'requests', 'warmup',
+                                            'concurrency', 'cache',
+                                            'buffered', 'seed')),
+               'behaviours': make_behaviours(options).to_dict(),
+               'results': results}
+        with open(options.output, 'w') as out:
+            json.dump(run, out, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Compare the streaming xml writer with the minidom based serializer it
+replaced, using MachineCollection documents of 100, 1000 and 10000 entries.
+
+    python tests/cimi/bench_serializer.py
+"""
+
+from xml.dom import minidom
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+from xmlwriter import XMLWriter
+
+CIMI_NS = 'http://schemas.dmtf.org/cimi/1'
+
+MACHINE_SEQUENCE = ['id', 'name', 'description', 'created', 'updated',
+                    'property', 'state', 'cpu', 'memory', 'disks', 'volumes',
+                    'networkInterfaces', 'credentials', 'operations']
+
+MACHINE_COL_METADATA = {'attributes':
+    {'Collection': 'resourceURI', 'Entry': 'resourceURI',
+     'disks': 'href', 'networkInterfaces': 'href', 'volumes': 'href',
+     'machine': 'href', 'operation': ['rel', 'href']},
+    'plurals': {'machines': 'Machine', 'operations': 'operation'},
+    'sequence': {'Collection': ['id', 'count', 'machines', 'operation'],
+                 'Machine': MACHINE_SEQUENCE}}
+
+
+def dom_serialize(metadata, xmlns, data):
+    """
+    The minidom based serializer, as CimiXMLSerializer used to do it
+    """
+
+    def to_xml_node(doc, nodename, data, parentnode=None):
+        if isinstance(data, list):
+            singular = metadata.get('plurals', {}).get(nodename, None)
+            if singular is None:
+                if nodename.endswith('s'):
+                    singular = nodename[:-1]
+                else:
+                    singular = 'item'
+            for item in data:
+                node = to_xml_node(doc, singular, item, parentnode)
+                if parentnode:
+                    parentnode.appendChild(node)
+            result = None
+        elif isinstance(data, dict):
+            result = doc.createElement(nodename)
+            if xmlns and parentnode is None:
+                result.setAttribute('xmlns', xmlns)
+            attrs = metadata.get('attributes', {}).get(nodename, {})
+            sequence = metadata.get('sequence', {}).get(nodename, {})
+            for k in sequence:
+                if k in data:
+                    v = data.get(k)
+                    if k in attrs:
+                        result.setAttribute(k, str(v))
+                    else:
+                        node = to_xml_node(doc, k, v, result)
+                        if node:
+                            result.appendChild(node)
+                    data.pop(k)
+            for k, v in data.items():
+                if k in attrs:
+                    result.setAttribute(k, str(v))
+                else:
+                    node = to_xml_node(doc, k, v, result)
+                    if node:
+                        result.appendChild(node)
+        else:
+            result = doc.createElement(nodename)
+            if xmlns and parentnode is None:
+                result.setAttribute('xmlns', xmlns)
+            result.appendChild(doc.createTextNode(str(data)))
+        return result
+
+    root_key = data.keys()[0]
+    doc = minidom.Document()
+    node = to_xml_node(doc, root_key, data[root_key])
+    node.setAttribute('xmlns', xmlns)
+    header = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    return header + node.toprettyxml(indent='  ')
+
+
+def make_collection(count):
+    machines = []
+    for idx in range(count):
+        machine_id = 'a5f3c1de-%04d-4c8e-9f0a-%012d' % (idx % 10000, idx)
+        machines.append({
+            'id': 'tenant/machine/%s' % machine_id,
+            'name': 'server-%d' % idx,
+            'created': '2012-10-01T12:00:00Z',
+            'updated': '2012-10-02T08:30:00Z',
+            'state': 'STARTED',
+            'cpu': 2,
+            'memory': 4096000,
+            'volumes': {'href': 'tenant/MachineVolumeCollection/' +
+                        machine_id},
+            'networkInterfaces': {'href':
+                'tenant/NetworkInterfacesCollection/' + machine_id},
+            'disks': {'href': 'tenant/MachineDiskCollection/' +
+                      machine_id}})
+    return {'Collection': {
+        'id': 'tenant/MachineCollection',
+        'resourceURI': CIMI_NS + '/MachineCollection',
+        'count': count,
+        'machines': machines,
+        'operations': [{'rel': 'add', 'href': 'tenant/machineCollection'}]}}
+
+
+def timed(func, data, rounds):
+    best = None
+    for idx in range(rounds):
+        # the dom serializer consumes its input, always give it a copy
+        one = copy.deepcopy(data)
+        start = time.time()
+        result = func(one)
+        spent = time.time() - start
+        if best is None or spent < best:
+            best = spent
+    return best, result
+
+
+def main():
+    writer = XMLWriter(MACHINE_COL_METADATA, CIMI_NS, pretty=True)
+    print '%8s %12s %12s %9s' % ('entries', 'minidom (s)', 'stream (s)',
+                                 'speedup')
+    for count in (100, 1000, 10000):
+        data = make_collection(count)
+        rounds = 5 if count < 10000 else 2
+        dom_time, expected = timed(
+            lambda one: dom_serialize(MACHINE_COL_METADATA, CIMI_NS, one),
+            data, rounds)
+        stream_time, result = timed(writer.to_string, data, rounds)
+        if result != expected:
+            raise Exception('streaming output differs at %d entries' % count)
+        print '%8d %12.4f %12.4f %8.1fx' % (count, dom_time, stream_time,
+                                           dom_time / stream_time)
+
+
+if __name__ == '__main__':
+    main()
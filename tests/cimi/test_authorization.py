@@ -0,0 +1,202 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Checks that what the middleware keeps in memory for a tenant is only
+# served to requests authenticated for that tenant. The controllers run in
+# front of a stub Nova which, like Nova, rejects requests for a project
+# other than the one of their context.
+
+import json
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+from webob import Request, Response
+
+from cimibase import FLAVOR_CACHE
+from conditional import GENERATIONS
+from job import JobColCtrler, JobCtrler
+from jobs import JOBS
+from machineconfig import MachineConfigColCtrler
+from network import NetworkInterfaceColCtrler
+from snapshot import SNAPSHOTS, TenantSnapshot
+from transitions import TRANSITIONS
+
+CONF = {'request_prefix': '/cimiv1', 'os_version': '/v2',
+        'stream_collections': 'false'}
+TENANT = 'tenant-a'
+OTHER = 'tenant-b'
+
+FLAVORS = [{'id': '1', 'name': 'm1.tiny', 'vcpus': 1, 'ram': 512,
+            'disk': 1}]
+SERVER = {'id': 'server-1', 'name': 'web', 'status': 'ACTIVE',
+          'created': '2012-10-01T12:00:00Z',
+          'updated': '2012-10-01T12:00:00Z',
+          'flavor': {'id': '1'},
+          'addresses': {'private': [{'addr': '10.0.0.2', 'version': 4}]}}
+
+
+class Context(object):
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+
+
+class StubNova(object):
+    """
+    Answers the Nova reads the controllers make and counts them
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, env, start_response):
+        path = env['PATH_INFO']
+        self.calls.append(path)
+        tenant_id = path.strip('/').split('/')[0]
+        if env['nova.context'].project_id != tenant_id:
+            res = Response(status=403)
+        elif path.endswith('/flavors/detail'):
+            res = Response(body=json.dumps({'flavors': FLAVORS}))
+        else:
+            res = Response(status=404)
+        return res(env, start_response)
+
+
+def make_request(tenant_id, path, project_id):
+    return Request.blank('/cimiv1/%s/%s' % (tenant_id, path),
+                         environ={'nova.context': Context(project_id)},
+                         headers={'Accept': 'application/json'})
+
+
+class AuthorizationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.nova = StubNova()
+        FLAVOR_CACHE.clear()
+
+    def tearDown(self):
+        FLAVOR_CACHE.clear()
+        SNAPSHOTS.enabled = False
+        SNAPSHOTS._tenants.clear()
+        TRANSITIONS.enabled = False
+        TRANSITIONS._tenants.clear()
+        TRANSITIONS._count = 0
+        JOBS.enabled = False
+        JOBS._jobs.clear()
+
+    def add_snapshot(self, tenant_id, servers):
+        """
+        Make a fresh inventory snapshot of the tenant, as the poller would
+        """
+        SNAPSHOTS.enabled = True
+        snapshot = TenantSnapshot(tenant_id, {})
+        snapshot.update(servers, True, None, [], time.time(),
+                        GENERATIONS.get(tenant_id))
+        SNAPSHOTS._tenants[tenant_id] = snapshot
+
+    def add_transition(self, tenant_id, server):
+        """
+        Track a machine of the tenant and take in a poll of it
+        """
+        TRANSITIONS.enabled = True
+        TRANSITIONS.track(tenant_id, server['id'], {}, 'STOPPED')
+        TRANSITIONS._update(TRANSITIONS._tenants[tenant_id], [server],
+                            time.time(), GENERATIONS.get(tenant_id))
+
+    def add_job(self, tenant_id):
+        """
+        Start a job of the tenant, without its watcher
+        """
+        JOBS.enabled = True
+        JOBS._poller = JOBS._poller or object()
+        return JOBS.create(tenant_id, {}, 'stop', tenant_id + '/Machine/a',
+                           'servers', 'a', ['STOPPED'])
+
+    def get(self, controller, tenant_id, path, project_id, *parts):
+        req = make_request(tenant_id, path, project_id)
+        ctrler = controller(CONF, self.nova).bind(req, tenant_id, *parts)
+        return ctrler.GET(req, *parts)
+
+    def test_flavor_cache_is_used_by_its_tenant(self):
+        for i in range(2):
+            res = self.get(MachineConfigColCtrler, TENANT,
+                           'MachineConfigurationCollection', TENANT)
+            self.assertEqual(res.status_int, 200)
+        self.assertEqual(len(self.nova.calls), 1)
+
+    def test_flavor_cache_is_not_served_to_other_tenants(self):
+        res = self.get(MachineConfigColCtrler, TENANT,
+                       'MachineConfigurationCollection', TENANT)
+        self.assertEqual(res.status_int, 200)
+
+        res = self.get(MachineConfigColCtrler, TENANT,
+                       'MachineConfigurationCollection', OTHER)
+        self.assertEqual(res.status_int, 403)
+        self.assertEqual(len(self.nova.calls), 2)
+
+    def test_snapshot_is_used_by_its_tenant(self):
+        self.add_snapshot(TENANT, [SERVER])
+        res = self.get(NetworkInterfaceColCtrler, TENANT,
+                       'NetworkInterfacesCollection/server-1', TENANT,
+                       'server-1')
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(len(json.loads(res.body)['entries']), 1)
+        self.assertEqual(self.nova.calls, [])
+
+    def test_snapshot_is_not_served_to_other_tenants(self):
+        self.add_snapshot(TENANT, [SERVER])
+        res = self.get(NetworkInterfaceColCtrler, TENANT,
+                       'NetworkInterfacesCollection/server-1', OTHER,
+                       'server-1')
+        self.assertEqual(res.status_int, 403)
+        self.assertEqual(self.nova.calls, ['/%s/servers/server-1' % TENANT])
+
+    def test_tracked_machine_is_used_by_its_tenant(self):
+        self.add_transition(TENANT, SERVER)
+        res = self.get(NetworkInterfaceColCtrler, TENANT,
+                       'NetworkInterfacesCollection/server-1', TENANT,
+                       'server-1')
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(self.nova.calls, [])
+
+    def test_tracked_machine_is_not_served_to_other_tenants(self):
+        self.add_transition(TENANT, SERVER)
+        res = self.get(NetworkInterfaceColCtrler, TENANT,
+                       'NetworkInterfacesCollection/server-1', OTHER,
+                       'server-1')
+        self.assertEqual(res.status_int, 403)
+        self.assertEqual(self.nova.calls, ['/%s/servers/server-1' % TENANT])
+
+    def test_jobs_are_served_to_their_tenant(self):
+        job = self.add_job(TENANT)
+        res = self.get(JobCtrler, TENANT, 'Job/' + job.id, TENANT, job.id)
+        self.assertEqual(res.status_int, 200)
+        res = self.get(JobColCtrler, TENANT, 'JobCollection', TENANT)
+        self.assertEqual(json.loads(res.body)['count'], 1)
+
+    def test_jobs_are_not_served_to_other_tenants(self):
+        job = self.add_job(TENANT)
+        res = self.get(JobCtrler, TENANT, 'Job/' + job.id, OTHER, job.id)
+        self.assertEqual(res.status_int, 403)
+        res = self.get(JobColCtrler, TENANT, 'JobCollection', OTHER)
+        self.assertEqual(res.status_int, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,6 +16,8 @@ from test_utils import get_config
 from lxml import etree
 import unittest
 import json
+import urllib
+import zlib
 
 from nova.tests.integrated.api.client import TestOpenStackClient
 
@@ -442,6 +444,235 @@ class CIMITestCase(unittest.TestCase):
                          '%s/Machine' % (self.ns),
                          'resourceURI is not corret')
 
+    def test_get_machines_paged_json(self):
+        uri = '%s/%s/machineCollection?$first=1&$last=1' % (self.baseURI,
+                                                             self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read machines page failed')
+        root = json.loads(res.read())
+        self.assertTrue(len(root.get('machines', [])) <= 1,
+                        'page should hold at most one machine')
+        self.assertEqual(root.get('count'), len(root.get('machines', [])),
+                         'count should match the page')
+        for op in root.get('operations', []):
+            if op.get('rel') == 'next':
+                self.assertIn('$first=2&$last=2', op.get('href'),
+                              'next should point to the second page')
+
+    def test_get_machines_bad_paging(self):
+        uri = '%s/%s/machineCollection?$first=0' % (self.baseURI,
+                                                     self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 400, 'Invalid paging should fail')
+
+    def test_get_machines_filtered_json(self):
+        uri = '%s/%s/machineCollection?%s' % (self.baseURI, self.tenant,
+            urllib.urlencode({'$filter': "state='STARTED' and cpu>=1"}))
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read filtered machines failed')
+        root = json.loads(res.read())
+        for machine in root.get('machines', []):
+            self.assertEqual(machine.get('state'), 'STARTED',
+                             'only started machines should be listed')
+
+    def test_get_machines_bad_filter(self):
+        uri = '%s/%s/machineCollection?%s' % (self.baseURI, self.tenant,
+            urllib.urlencode({'$filter': "state='STARTED' and"}))
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 400, 'Invalid filter should fail')
+
+    def test_get_machines_selected_json(self):
+        uri = '%s/%s/machineCollection?$select=name' % (self.baseURI,
+                                                        self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read selected machines failed')
+        root = json.loads(res.read())
+        for machine in root.get('machines', []):
+            self.assertTrue(machine.get('id'), 'id should always be kept')
+            self.assertFalse('cpu' in machine, 'cpu was not selected')
+
+    def test_get_machines_expanded_json(self):
+        uri = '%s/%s/machineCollection?$expand=volumes,networkInterfaces' % \
+            (self.baseURI, self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read expanded machines failed')
+        root = json.loads(res.read())
+        for machine in root.get('machines', []):
+            self.assertTrue('machineVolumes' in machine.get('volumes', {}),
+                            'volumes should be expanded')
+            self.assertTrue('entries' in machine.get('networkInterfaces',
+                                                     {}),
+                            'network interfaces should be expanded')
+
+    def test_get_machines_compact_json(self):
+        uri = '%s/%s/machineCollection' % (self.baseURI, self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read machines failed')
+        body = res.read()
+        self.assertFalse('\n' in body, 'json should be compact')
+
+        headers['Accept'] = 'application/json; pretty=true'
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read pretty machines failed')
+        pretty = res.read()
+        self.assertTrue('\n' in pretty, 'json should be indented')
+        self.assertEqual(json.loads(pretty).get('count'),
+                         json.loads(body).get('count'))
+
+    def test_get_machines_gzip(self):
+        uri = '%s/%s/machineCollection' % (self.baseURI, self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/xml',
+                   'Accept-Encoding': 'gzip'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read gzipped machines failed')
+        self.assertEqual(res.getheader('Content-Encoding'), 'gzip')
+        body = zlib.decompress(res.read(), 16 + zlib.MAX_WBITS)
+        root = etree.fromstring(body)
+        self.assertEqual(root.tag, '{%s}Collection' % self.ns)
+
+    def test_get_machines_not_modified(self):
+        uri = '%s/%s/machineCollection' % (self.baseURI, self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read machines failed')
+        res.read()
+        etag = res.getheader('ETag')
+        self.assertTrue(etag, 'machines should have an etag')
+
+        headers['If-None-Match'] = etag
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 304, 'machines should not be modified')
+        self.assertEqual(res.getheader('ETag'), etag)
+
+    def test_get_volumes_after_create(self):
+        uri = '%s/%s/volumeCollection' % (self.baseURI, self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read volumes failed')
+        count = json.loads(res.read()).get('count')
+
+        # the cached collection is dropped by the create
+        self._create_volume()
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read volumes failed')
+        self.assertEqual(json.loads(res.read()).get('count'), count + 1)
+
+    def test_get_machine_coalesced(self):
+        uri = '%s/%s/machine/%s' % (self.baseURI, self.tenant, self.server_id)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read machine failed')
+
+        uri = '%s/_metrics' % (self.baseURI)
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read metrics failed')
+        self.assertIn('cimi_coalesced_requests_leaders', res.read(),
+                      'coalesced requests should be counted')
+
+    def test_get_machine_server_timing(self):
+        uri = '%s/%s/machine/%s' % (self.baseURI, self.tenant, self.server_id)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json',
+                   'X-CIMI-Timing': 'true'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read machine failed')
+        timing = res.getheader('Server-Timing', '')
+        self.assertIn('nova;', timing, 'nova calls should be timed')
+        self.assertIn('total;dur=', timing, 'the total should be timed')
+
+    def test_get_machine_snapshot_metrics(self):
+        uri = '%s/%s/machine/%s' % (self.baseURI, self.tenant, self.server_id)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read machine failed')
+
+        uri = '%s/_metrics' % (self.baseURI)
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read metrics failed')
+        self.assertIn('cimi_snapshot_tenants', res.read(),
+                      'snapshot statistics should be listed')
+
+    def test_get_transition_metrics(self):
+        uri = '%s/_metrics' % (self.baseURI)
+        headers = {'X-Auth-Token': self.token}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read metrics failed')
+        self.assertIn('cimi_transitions_tracked', res.read(),
+                      'tracked machines should be counted')
+
+    def test_get_machine_wait(self):
+        uri = '%s/%s/machine/%s' % (self.baseURI, self.tenant, self.server_id)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read machine failed')
+        state = json.loads(res.read())['state']
+
+        res = self.client.request('%s?waitFor=%s&timeout=5' % (uri, state),
+                                  method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Wait for machine failed')
+        self.assertEqual(json.loads(res.read())['state'], state)
+
+        res = self.client.request('%s?waitFor=BOGUS' % uri,
+                                  method='GET', headers=headers)
+        self.assertEqual(res.status, 400, 'Unknown state should fail')
+
+    def test_get_job_collection(self):
+        uri = '%s/%s/jobCollection' % (self.baseURI, self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read job collection failed')
+        body = json.loads(res.read())
+        self.assertEqual(body['count'], len(body.get('jobs', [])))
+
+        uri = '%s/%s/job/%s' % (self.baseURI, self.tenant, 'nosuchjob')
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 404, 'Unknown job should not be found')
+
+    def test_machine_collection_action(self):
+        body = {'resourceURI': 'http://schemas.dmtf.org/cimi/1/Action',
+                'action': 'http://schemas.dmtf.org/cimi/1/action/stop',
+                'machines': [{'href': '%s/Machine/nosuchmachine' %
+                              self.tenant}]}
+        uri = '%s/%s/machineCollection' % (self.baseURI, self.tenant)
+        headers = {'X-Auth-Token': self.token,
+                   'Content-Type': 'application/json',
+                   'Accept': 'application/json'}
+        res = self.client.request(uri, method='POST', headers=headers,
+                                  body=json.dumps(body))
+        self.assertEqual(res.status, 200, 'Collection action failed')
+        body = json.loads(res.read())
+        self.assertEqual(body['count'], 1)
+        self.assertEqual(body['results'][0]['status'], 404)
+
+    def test_get_metrics(self):
+        uri = '%s/_metrics' % (self.baseURI)
+        headers = {'X-Auth-Token': self.token}
+        res = self.client.request(uri, method='GET', headers=headers)
+        self.assertEqual(res.status, 200, 'Read metrics failed')
+        self.assertIn('cimi_requests_total', res.read(),
+                      'request counts should be listed')
+
     def test_invalid_controller(self):
         uri = '%s/%s/xxxxx' % (self.baseURI, self.tenant)
         headers = {'X-Auth-Token': self.token,
@@ -0,0 +1,174 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+import eventlet
+from eventlet.green import httplib
+
+from httppool import ConnectionPool
+
+
+class KeepAliveServer(object):
+    """
+    A local HTTP/1.1 server answering every request with 200 and keeping
+    the connection open. The requests seen are kept as (connection number,
+    method). When drop is set, a connection which already answered a
+    request closes after reading the next one, without any response, the
+    way a peer does when its keep-alive timeout hits.
+    """
+
+    def __init__(self):
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.requests = []
+        self.connections = 0
+        self.drop = False
+        self.close_after_response = False
+        self.thread = eventlet.spawn(self._serve)
+
+    def stop(self):
+        self.thread.kill()
+        self.sock.close()
+
+    def _serve(self):
+        while True:
+            client, addr = self.sock.accept()
+            self.connections += 1
+            eventlet.spawn(self._handle, client, self.connections)
+
+    def _read_request(self, reader):
+        line = reader.readline()
+        if not line:
+            return None
+        length = 0
+        while True:
+            header = reader.readline()
+            if header in ('\r\n', '\n', ''):
+                break
+            name, value = header.split(':', 1)
+            if name.lower() == 'content-length':
+                length = int(value)
+        if length:
+            reader.read(length)
+        return line.split()[0]
+
+    def _handle(self, client, number):
+        reader = client.makefile('rb')
+        answered = 0
+        try:
+            while True:
+                method = self._read_request(reader)
+                if method is None:
+                    return
+                self.requests.append((number, method))
+                if self.drop and answered:
+                    return
+                client.sendall('HTTP/1.1 200 OK\r\nContent-Length: 2\r\n'
+                               '\r\nok')
+                answered += 1
+                if self.close_after_response:
+                    return
+        finally:
+            reader.close()
+            client.close()
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = KeepAliveServer()
+        self.key = ('http', '127.0.0.1', self.server.port)
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.stop()
+
+    def send(self, method='GET'):
+        conn, res = self.pool.request(self.key, method, '/v1/volumes',
+                                      'body' if method == 'POST' else None,
+                                      {})
+        body = res.read()
+        self.pool.release(self.key, conn, res)
+        return res.status, body
+
+    def test_connection_is_reused(self):
+        self.assertEqual(self.send(), (200, 'ok'))
+        self.assertEqual(self.send('POST'), (200, 'ok'))
+        self.assertEqual(self.server.connections, 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['idle']),
+                         (1, 1, 1))
+
+    def test_idle_connection_times_out(self):
+        self.pool.idle_timeout = 0
+        self.send()
+        self.send()
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.pool.stats()['hits'], 0)
+
+    def test_pool_keeps_at_most_max_size(self):
+        self.pool.max_size = 1
+        first, reused = self.pool.get(self.key)
+        second, reused = self.pool.get(self.key)
+        first.connect()
+        second.connect()
+        self.pool.put(self.key, first)
+        self.pool.put(self.key, second)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+        self.assertTrue(second.sock is None)
+
+    def test_closed_socket_is_not_reused(self):
+        self.server.close_after_response = True
+        self.send()
+        # let the server close its end of the idle connection
+        eventlet.sleep(0.01)
+        self.assertEqual(self.send(), (200, 'ok'))
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.pool.stats()['retries'], 0)
+
+    def test_get_is_sent_again_on_a_dropped_connection(self):
+        self.send()
+        self.server.drop = True
+        self.assertEqual(self.send(), (200, 'ok'))
+        self.assertEqual(self.server.requests,
+                         [(1, 'GET'), (1, 'GET'), (2, 'GET')])
+        self.assertEqual(self.pool.stats()['retries'], 1)
+
+    def test_post_is_not_sent_again_on_a_dropped_connection(self):
+        self.send()
+        self.server.drop = True
+        self.assertRaises((socket.error, httplib.HTTPException),
+                          self.send, 'POST')
+        self.assertEqual(self.server.requests, [(1, 'GET'), (1, 'POST')])
+        self.assertEqual(self.pool.stats()['retries'], 0)
+
+    def test_fresh_connection_is_not_retried(self):
+        self.server.drop = True
+        self.server.close_after_response = True
+        self.send()
+        self.server.stop()
+        self.assertRaises(socket.error, self.send)
+        self.assertEqual(self.pool.stats()['retries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
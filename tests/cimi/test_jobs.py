@@ -0,0 +1,172 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+from conditional import GENERATIONS
+from jobs import Job, JobTable
+
+TENANT = 'tenant-j'
+STOP = 'http://schemas.dmtf.org/cimi/1/action/stop'
+
+
+def server(server_id, status, updated='2012-10-01T12:00:05Z'):
+    return {'id': server_id, 'status': status, 'updated': updated}
+
+
+class JobTestCase(unittest.TestCase):
+
+    def job(self, kind='servers', states=('STOPPED',), updated=None):
+        return Job('1', TENANT, STOP, TENANT + '/Machine/a', kind, 'a',
+                   states, updated)
+
+    def test_reaching_the_state_succeeds(self):
+        job = self.job()
+        self.assertFalse(job.check(server('a', 'ACTIVE')))
+        self.assertTrue(job.running)
+        self.assertTrue(job.check(server('a', 'SHUTOFF')))
+        self.assertEqual((job.status, job.progress, job.return_code),
+                         ('SUCCESS', 100, 0))
+
+    def test_error_state_fails(self):
+        job = self.job()
+        self.assertTrue(job.check(server('a', 'ERROR')))
+        self.assertEqual((job.status, job.return_code), ('FAILED', 1))
+
+    def test_unchanged_server_has_not_moved(self):
+        job = self.job(updated='2012-10-01T12:00:00Z')
+        self.assertFalse(job.check(server('a', 'SHUTOFF',
+                                          '2012-10-01T12:00:00Z')))
+        self.assertTrue(job.check(server('a', 'SHUTOFF')))
+
+    def test_gone_resource(self):
+        self.assertFalse(self.job().check(None))
+        job = self.job(kind='volumes', states=())
+        self.assertFalse(job.check({'status': 'deleting'}))
+        self.assertTrue(job.check(None))
+        self.assertEqual(job.status, 'SUCCESS')
+
+    def test_dict_round_trip(self):
+        job = self.job(updated='2012-10-01T12:00:00Z')
+        job.finish('FAILED', 1, 'timed out')
+        copied = Job.from_dict(job.to_dict())
+        self.assertEqual(copied.to_dict(), job.to_dict())
+
+
+class JobTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+        self.volumes = []
+        self.directory = tempfile.mkdtemp()
+        self.table = self.make_table()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_table(self, **conf):
+        table = JobTable()
+        conf.setdefault('jobs_enabled', 'true')
+        table.configure(conf, lambda tenant_id, env, since: self.servers,
+                        lambda tenant_id, env: self.volumes)
+        # keep the watcher green thread from starting
+        table._poller = object()
+        return table
+
+    def create(self, table, resource_id, tenant_id=TENANT):
+        return table.create(tenant_id, {}, STOP,
+                            tenant_id + '/Machine/' + resource_id,
+                            'servers', resource_id, ['STOPPED'])
+
+    def test_jobs_are_kept_per_tenant(self):
+        job = self.create(self.table, 'a')
+        self.create(self.table, 'b', 'tenant-k')
+        self.assertTrue(self.table.get(TENANT, job.id) is job)
+        self.assertTrue(self.table.get('tenant-k', job.id) is None)
+        self.assertEqual(self.table.jobs(TENANT), [job])
+
+    def test_disabled_table_makes_no_jobs(self):
+        table = self.make_table(jobs_enabled='false')
+        self.assertTrue(self.create(table, 'a') is None)
+
+    def test_finished_jobs_are_evicted_first(self):
+        table = self.make_table(job_table_size='2')
+        first = self.create(table, 'a')
+        second = self.create(table, 'b')
+        second.finish('SUCCESS', 0)
+        third = self.create(table, 'c')
+        self.assertEqual(table.jobs(TENANT), [first, third])
+        fourth = self.create(table, 'd')
+        self.assertEqual(table.jobs(TENANT), [third, fourth])
+
+    def test_refresh_finishes_jobs(self):
+        job = self.create(self.table, 'a')
+        other = self.create(self.table, 'b')
+        generation = GENERATIONS.get(TENANT)
+        self.servers = [server('a', 'SHUTOFF'), server('b', 'ACTIVE')]
+        self.assertEqual(self.table._due(), set([TENANT]))
+        self.table._refresh(TENANT)
+        self.assertEqual(job.status, 'SUCCESS')
+        self.assertTrue(other.running)
+        self.assertEqual(GENERATIONS.get(TENANT), generation + 1)
+        self.assertEqual(self.table.stats()['succeeded'], 1)
+
+    def test_running_jobs_time_out(self):
+        job = self.create(self.table, 'a')
+        self.table._expire(job.created + self.table.timeout + 1)
+        self.assertEqual((job.status, job.status_message),
+                         ('FAILED', 'timed out'))
+
+    def test_table_is_saved_and_loaded(self):
+        path = os.path.join(self.directory, 'jobs.json')
+        table = self.make_table(job_file=path, job_table_size='2')
+        jobs = [self.create(table, name) for name in 'abc']
+        jobs[0].finish('SUCCESS', 0)
+        table._finished([jobs[0]])
+        # the table is written by the watcher, not by the requests
+        self.assertFalse(os.path.exists(path))
+        table._save()
+        loaded = self.make_table(job_file=path, job_table_size='2')
+        self.assertEqual([job.to_dict() for job in loaded.jobs(TENANT)],
+                         [job.to_dict() for job in jobs[1:]])
+        # running jobs read back are watched once the tenant is seen again
+        self.assertEqual(loaded._due(), set())
+
+    def test_changes_are_written_once(self):
+        path = os.path.join(self.directory, 'jobs.json')
+        table = self.make_table(job_file=path)
+        writes = []
+        table._write = writes.append
+        for name in 'abc':
+            self.create(table, name)
+        table._save()
+        table._save()
+        self.assertEqual([len(data) for data in writes], [3])
+
+    def test_unreadable_file_is_ignored(self):
+        path = os.path.join(self.directory, 'jobs.json')
+        with open(path, 'w') as job_file:
+            job_file.write('not json')
+        self.assertEqual(self.make_table(job_file=path).jobs(TENANT), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
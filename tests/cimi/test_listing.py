@@ -0,0 +1,144 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Checks that the collections list everything Nova holds when Nova, like
+# with osapi_max_limit, returns a listing over several pages.
+
+import json
+import os
+import sys
+import unittest
+import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+from webob import Request, Response
+
+from cimibase import FLAVOR_CACHE
+from machine import MachineColCtrler
+from machineimage import MachineImageColCtrler
+
+CONF = {'request_prefix': '/cimiv1', 'os_version': '/v2',
+        'stream_collections': 'false'}
+TENANT = 'tenant-a'
+MAX_LIMIT = 3
+
+FLAVORS = [{'id': '1', 'name': 'm1.tiny', 'vcpus': 1, 'ram': 512,
+            'disk': 1}]
+SERVERS = [{'id': 'server-%02d' % i, 'name': 'web', 'status': 'ACTIVE',
+            'created': '2012-10-01T12:00:00Z',
+            'updated': '2012-10-01T12:00:00Z',
+            'flavor': {'id': '1'}, 'addresses': {}}
+           for i in range(8)]
+IMAGES = [{'id': 'image-%02d' % i, 'name': 'image-%02d' % i,
+           'status': 'ACTIVE', 'created': '2012-10-01T12:00:00Z',
+           'updated': '2012-10-01T12:00:00Z'}
+          for i in range(8)]
+
+
+class Context(object):
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+
+
+class PagingNova(object):
+    """
+    Answers the Nova listings at most MAX_LIMIT items at a time, with a
+    next link when more items follow, and counts the reads
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, env, start_response):
+        path = env['PATH_INFO']
+        self.calls.append(path)
+        if path.endswith('/flavors/detail'):
+            res = Response(body=json.dumps({'flavors': FLAVORS}))
+        elif path.endswith('/servers/detail'):
+            res = self._listing(env, 'servers', SERVERS)
+        elif path.endswith('/images/detail'):
+            res = self._listing(env, 'images', IMAGES)
+        else:
+            res = Response(status=404)
+        return res(env, start_response)
+
+    def _listing(self, env, key, items):
+        query = dict(urlparse.parse_qsl(env.get('QUERY_STRING', '')))
+        start = 0
+        if 'marker' in query:
+            start = [item['id'] for item in items].index(query['marker']) + 1
+        limit = min(int(query.get('limit', MAX_LIMIT)), MAX_LIMIT)
+        page = items[start:start + limit]
+        body = {key: page}
+        if start + limit < len(items):
+            body[key + '_links'] = [{'rel': 'next',
+                                     'href': '?marker=' + page[-1]['id']}]
+        return Response(body=json.dumps(body))
+
+
+class ListingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.nova = PagingNova()
+        FLAVOR_CACHE.clear()
+
+    def tearDown(self):
+        FLAVOR_CACHE.clear()
+
+    def get(self, controller, path, query):
+        req = Request.blank('/cimiv1/%s/%s?%s' % (TENANT, path, query),
+                            environ={'nova.context': Context(TENANT)},
+                            headers={'Accept': 'application/json'})
+        ctrler = controller(CONF, self.nova).bind(req, TENANT)
+        res = ctrler.GET(req)
+        self.assertEqual(res.status_int, 200)
+        return json.loads(res.body)
+
+    def listings(self, key):
+        return len([call for call in self.nova.calls
+                    if call.endswith('/%s/detail' % key)])
+
+    def test_machines_are_read_from_every_page(self):
+        body = self.get(MachineColCtrler, 'MachineCollection', '')
+        self.assertEqual(body['count'], len(SERVERS))
+        self.assertEqual(self.listings('servers'), 3)
+
+    def test_residual_filter_sees_every_page(self):
+        # Nova matches the name as a pattern, the exact match is checked
+        # here over every page
+        body = self.get(MachineColCtrler, 'MachineCollection',
+                        "$filter=name='web'&$first=2&$last=7")
+        self.assertEqual([entry['id'] for entry in body['machines']],
+                         ['%s/machine/%s' % (TENANT, server['id'])
+                          for server in SERVERS[1:7]])
+        self.assertEqual(self.listings('servers'), 3)
+
+    def test_page_is_pushed_down(self):
+        body = self.get(MachineColCtrler, 'MachineCollection',
+                        '$first=1&$last=2')
+        self.assertEqual(body['count'], 2)
+        self.assertEqual(self.listings('servers'), 1)
+
+    def test_images_are_read_from_every_page(self):
+        body = self.get(MachineImageColCtrler, 'MachineImageCollection',
+                        "$filter=state='AVAILABLE'")
+        self.assertEqual(body['count'], len(IMAGES))
+        self.assertEqual(self.listings('images'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
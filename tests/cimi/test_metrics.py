@@ -0,0 +1,77 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Checks that the metrics, which cover every tenant, are only served to
+# admins unless anyone was allowed to read them.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..'))
+
+from webob import Request, Response
+
+from cimi import filter_factory
+from cimi.cimiapp.metrics import METRICS
+
+
+class Context(object):
+
+    def __init__(self, project_id, is_admin=False):
+        self.project_id = project_id
+        self.is_admin = is_admin
+
+
+def backend(env, start_response):
+    return Response(status=404)(env, start_response)
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        METRICS.configure({'metrics_enabled': 'true',
+                           'metrics_allow_unauthenticated': 'false'})
+
+    def get(self, context, **conf):
+        app = filter_factory({}, **conf)(backend)
+        req = Request.blank('/_metrics', base_url='http://localhost/cimiv1')
+        if context is not None:
+            req.environ['nova.context'] = context
+        return req.get_response(app)
+
+    def test_admin_reads_metrics(self):
+        res = self.get(Context('admin', is_admin=True))
+        self.assertEqual(res.status_int, 200)
+        self.assertIn('cimi_connection_pool_hits', res.body)
+
+    def test_user_is_denied_metrics(self):
+        res = self.get(Context('tenant-a'))
+        self.assertEqual(res.status_int, 403)
+        self.assertNotIn('cimi_', res.body)
+
+    def test_unauthenticated_request_is_denied_metrics(self):
+        res = self.get(None)
+        self.assertEqual(res.status_int, 403)
+
+    def test_anyone_reads_metrics_when_allowed(self):
+        res = self.get(None, metrics_allow_unauthenticated='true')
+        self.assertEqual(res.status_int, 200)
+        res = self.get(Context('tenant-a'))
+        self.assertEqual(res.status_int, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,349 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from xml.dom import minidom
+import copy
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+from cimibase import Consts, EntryStream
+from schema import get_serializers
+
+NS = Consts.CIMI_NS
+TENANT = 'f2a1b7d6e0c94c3f8a5e4b2d1c0f9e8d'
+SERVER = '5d6c1c3a-8a87-4b3e-9a8f-1a2b3c4d5e6f'
+VOLUME = '0b8e3f5a-2c4d-4e6f-8a1b-3c5d7e9f1a2b'
+
+
+def op(rel, href):
+    return {'rel': rel, 'href': href}
+
+
+def machine():
+    machine_id = '/'.join([TENANT, 'Machine', SERVER])
+    return {'resourceURI': NS + '/Machine',
+            'id': machine_id,
+            'name': 'web <1> & "db"',
+            'created': '2012-10-01T12:00:00Z',
+            'updated': '2012-10-02T08:30:00Z',
+            'state': 'STARTED',
+            'cpu': 2,
+            'memory': 4096000,
+            'property': {'key': 'role', 'value': u'caf\xe9'},
+            'disks': [{'capacity': 20000000}],
+            'volumes': {'count': 1, 'machineVolumes': [
+                {'id': '/'.join([TENANT, 'MachineVolume', SERVER, VOLUME]),
+                 'initialLocation': '/dev/vdb',
+                 'volume': {'href': '/'.join([TENANT, 'Volume', VOLUME])},
+                 'state': 'CREATING'}]},
+            'networkInterfaces': {'href': '/'.join([TENANT,
+                'NetworkInterfacesCollection', SERVER])},
+            'operations': [op('edit', machine_id),
+                           op('delete', machine_id),
+                           op(NS + '/action/stop', machine_id)]}
+
+
+def collection(name, entries, entry_uri):
+    col_id = '/'.join([TENANT, name])
+    return {'resourceURI': NS + '/' + name,
+            'id': col_id,
+            'count': len(entries),
+            entry_uri: entries,
+            'operations': [op('add', col_id),
+                           op('next', col_id + '?$first=2&$last=3')]}
+
+
+def volume():
+    volume_id = '/'.join([TENANT, 'Volume', VOLUME])
+    return {'resourceURI': NS + '/Volume',
+            'id': volume_id,
+            'name': 'data',
+            'description': 'a volume',
+            'created': '2012-10-01T12:00:00Z',
+            'state': 'AVAILABLE',
+            'type': NS + '/volume/DATA',
+            'capacity': 10000000,
+            'bootable': False,
+            'operations': [op('delete', volume_id)]}
+
+
+def machine_config():
+    return {'resourceURI': NS + '/MachineConfiguration',
+            'id': '/'.join([TENANT, 'MachineConfiguration', '1']),
+            'name': 'm1.tiny',
+            'cpu': 1,
+            'memory': 512000,
+            'disks': [{'capacity': 1000, 'format': 'UNKNOWN'}]}
+
+
+def machine_image():
+    image_id = '/'.join([TENANT, 'MachineImage', 'c5a2d3e4'])
+    return {'resourceURI': NS + '/MachineImage',
+            'id': image_id,
+            'type': 'IMAGE',
+            'name': 'cirros',
+            'created': '2012-10-01T12:00:00Z',
+            'updated': '2012-10-01T12:00:00Z',
+            'state': 'AVAILABLE',
+            'imageLocation': image_id}
+
+
+def machine_volume():
+    volume_id = '/'.join([TENANT, 'MachineVolume', SERVER, VOLUME])
+    return {'resourceURI': NS + '/MachineVolume',
+            'id': volume_id,
+            'initialLocation': '/dev/vdb',
+            'volume': {'href': '/'.join([TENANT, 'Volume', VOLUME])},
+            'operations': [op('edit', volume_id), op('delete', volume_id)]}
+
+
+def interfaces():
+    return {'resourceURI': NS + '/MachineNetworkInterfacesCollection',
+            'id': '/'.join([TENANT, 'NetworkInterfacesCollection', SERVER]),
+            'entries': [{'resourceURI': NS + '/NetworkInterface',
+                         'id': '/'.join([TENANT, 'NetworkInterface',
+                                         SERVER, 'private']),
+                         'addresses': {'href': '/'.join([TENANT,
+                             'MachineNetworkInterfaceAddressesCollection',
+                             SERVER, 'private'])}}]}
+
+
+def addresses():
+    return {'resourceURI': NS + '/MachineNetworkInterfaceAddressesCollection',
+            'id': '/'.join([TENANT, 'Addresses', SERVER, 'private']),
+            'entries': [{'resourceURI': NS + '/Address',
+                         'id': '/'.join([TENANT, 'Address', SERVER,
+                                         'private', '10.0.0.2']),
+                         'address': {'href': '/'.join([TENANT, 'Address',
+                                     SERVER, 'private', '10.0.0.2'])}}]}
+
+
+def address():
+    return {'resourceURI': NS + '/Address',
+            'id': '/'.join([TENANT, 'Address', SERVER, 'private',
+                            '10.0.0.2']),
+            'ip': '10.0.0.2',
+            'property': {'version': 4, 'type': 'fixed'}}
+
+
+def cloud_entry_point():
+    return {'resourceURI': NS + '/CloudEntryPoint',
+            'id': TENANT + '/cloudEntryPoint',
+            'name': 'CIMI',
+            'baseURI': 'http://localhost:8774/cimiv1/',
+            'machines': {'href': TENANT + '/MachineCollection'},
+            'machineConfigs': {'href': TENANT +
+                               '/MachineConfigurationCollection'},
+            'machineImages': {'href': TENANT + '/MachineImageCollection'},
+            'volumes': {'href': TENANT + '/VolumeCollection'},
+            'jobs': {'href': TENANT + '/JobCollection'}}
+
+
+def job():
+    return {'resourceURI': NS + '/Job',
+            'id': '/'.join([TENANT, 'Job', '9f3c2b1a']),
+            'created': '2012-10-01T12:00:00Z',
+            'updated': '2012-10-01T12:00:05Z',
+            'targetResource': {'href': '/'.join([TENANT, 'Machine',
+                                                 SERVER])},
+            'action': NS + '/action/stop',
+            'status': 'FAILED',
+            'progress': 100,
+            'returnCode': 1,
+            'statusMessage': 'timed out',
+            'timeOfStatusChange': '2012-10-01T12:00:05Z',
+            'isCancellable': 'false'}
+
+
+def action_results():
+    return {'resourceURI': NS + '/MachineActionResults',
+            'id': TENANT + '/MachineCollection',
+            'action': NS + '/action/stop',
+            'count': 2,
+            'results': [{'machine': {'href': '/'.join([TENANT, 'Machine',
+                                                       SERVER])},
+                         'status': 202,
+                         'job': {'href': '/'.join([TENANT, 'Job',
+                                                   '9f3c2b1a'])}},
+                        {'machine': {'href': '/'.join([TENANT, 'Machine',
+                                                       VOLUME])},
+                         'status': 409,
+                         'statusMessage': 'action not allowed in state '
+                                          'STOPPED'}]}
+
+
+# the documents of each resource, with the root element used for xml
+DOCUMENTS = {
+    'MACHINE_METADATA': ('Machine', machine()),
+    'MACHINE_COL_METADATA': ('Collection', collection('MachineCollection',
+        [machine(), machine()], 'machines')),
+    'VOLUME_METADATA': ('Volume', volume()),
+    'VOLUME_COL_METADATA': ('Collection', collection('VolumeCollection',
+        [volume(), volume()], 'volumes')),
+    'MACHINECONFIG_METADATA': ('MachineConfiguration', machine_config()),
+    'MACHINECONFIG_COL_METADATA': ('Collection', collection(
+        'MachineConfigurationCollection', [machine_config()],
+        'machineConfigurations')),
+    'MACHINEIMAGE_METADATA': ('MachineImage', machine_image()),
+    'MACHINEIMAGE_COL_METADATA': ('Collection', collection(
+        'MachineImageCollection', [machine_image()] * 3, 'machineImages')),
+    'MACHINEVOLUME_METADATA': ('MachineVolume', machine_volume()),
+    'MACHINEVOLUME_COL_METADATA': ('Collection', collection(
+        'MachineVolumeCollection', [machine_volume()], 'machineVolumes')),
+    'NETWORK_METADATA': ('NetworkInterface', interfaces()['entries'][0]),
+    'NETWORK_COL_METADATA': ('MachineNetworkInterfacesCollection',
+                             interfaces()),
+    'ADDRESS_METADATA': ('Address', address()),
+    'ADDRESS_COL_METADATA': ('Collection', addresses()),
+    'CLOUDENTRYPOINT_METADATA': ('CloudEntryPoint', cloud_entry_point()),
+    'JOB_METADATA': ('Job', job()),
+    'MACHINE_ACTION_RESULTS_METADATA': ('Collection', action_results()),
+    'JOB_COL_METADATA': ('Collection', collection('JobCollection',
+        [job(), job()], 'jobs')),
+}
+
+
+# the xml documents the serializers must give, written out by hand
+MACHINE_ID = '/'.join([TENANT, 'Machine', SERVER])
+VOLUME_ID = '/'.join([TENANT, 'Volume', VOLUME])
+EXPECTED_XML = {
+    'VOLUME_METADATA': """<?xml version="1.0" encoding="UTF-8"?>
+<Volume xmlns="%(ns)s">
+  <id>%(volume)s</id>
+  <name>data</name>
+  <description>a volume</description>
+  <created>2012-10-01T12:00:00Z</created>
+  <state>AVAILABLE</state>
+  <type>%(ns)s/volume/DATA</type>
+  <capacity>10000000</capacity>
+  <bootable>False</bootable>
+  <operation href="%(volume)s" rel="delete"/>
+  <resourceURI>%(ns)s/Volume</resourceURI>
+</Volume>
+""" % {'ns': NS, 'volume': VOLUME_ID},
+    'MACHINE_METADATA': """<?xml version="1.0" encoding="UTF-8"?>
+<Machine xmlns="%(ns)s">
+  <id>%(machine)s</id>
+  <name>web &lt;1&gt; &amp; &quot;db&quot;</name>
+  <created>2012-10-01T12:00:00Z</created>
+  <updated>2012-10-02T08:30:00Z</updated>
+  <property key="role">
+    <value>caf\xc3\xa9</value>
+  </property>
+  <state>STARTED</state>
+  <cpu>2</cpu>
+  <memory>4096000</memory>
+  <disk>
+    <capacity>20000000</capacity>
+  </disk>
+  <volumes>
+    <count>1</count>
+    <MachineVolume>
+      <id>%(tenant)s/MachineVolume/%(server)s/%(volume_id)s</id>
+      <initialLocation>/dev/vdb</initialLocation>
+      <volume href="%(volume)s"/>
+      <state>CREATING</state>
+    </MachineVolume>
+  </volumes>
+  <networkInterfaces href="%(tenant)s/NetworkInterfacesCollection/%(server)s"/>
+  <operation href="%(machine)s" rel="edit"/>
+  <operation href="%(machine)s" rel="delete"/>
+  <operation href="%(machine)s" rel="%(ns)s/action/stop"/>
+  <resourceURI>%(ns)s/Machine</resourceURI>
+</Machine>
+""" % {'ns': NS, 'machine': MACHINE_ID, 'volume': VOLUME_ID,
+       'tenant': TENANT, 'server': SERVER, 'volume_id': VOLUME},
+}
+
+
+class SerializerTestCase(unittest.TestCase):
+
+    def test_every_resource_has_a_document(self):
+        names = [name for name in dir(Consts) if name.endswith('_METADATA')]
+        self.assertEqual(sorted(names), sorted(DOCUMENTS.keys()))
+
+    def test_xml_matches_expected_document(self):
+        for name, expected in EXPECTED_XML.items():
+            root, body = DOCUMENTS[name]
+            compiled = get_serializers(getattr(Consts, name),
+                                       NS)['application/xml']
+            self.assertEqual(compiled.to_string({root: body}), expected,
+                             name)
+
+    def test_xml_is_well_formed(self):
+        for name, (root, body) in DOCUMENTS.items():
+            metadata = getattr(Consts, name)
+            data = {root: body}
+            original = copy.deepcopy(data)
+            compiled = get_serializers(metadata, NS)['application/xml']
+            doc = minidom.parseString(compiled.to_string(data))
+            self.assertEqual(doc.documentElement.tagName, root, name)
+            self.assertEqual(doc.documentElement.getAttribute('xmlns'), NS,
+                             name)
+            self.assertEqual(data, original, name)
+
+    def test_json_is_indented_as_json_dumps(self):
+        for name, (root, body) in DOCUMENTS.items():
+            metadata = getattr(Consts, name)
+            compiled = get_serializers(metadata, NS,
+                                       pretty=True)['application/json']
+            self.assertEqual(compiled.to_string(body),
+                             json.dumps(body, indent=2), name)
+
+    def test_compact_json(self):
+        for name, (root, body) in DOCUMENTS.items():
+            metadata = getattr(Consts, name)
+            compiled = get_serializers(metadata, NS)['application/json']
+            result = compiled.to_string(body)
+            self.assertFalse('\n' in result, name)
+            self.assertEqual(json.loads(result), json.loads(json.dumps(body)),
+                             name)
+
+    def test_streamed_entries_match(self):
+        root, body = DOCUMENTS['MACHINE_COL_METADATA']
+        metadata = Consts.MACHINE_COL_METADATA
+        serializers = get_serializers(metadata, NS, pretty=True)
+        streamed = dict(body, machines=EntryStream(body['machines'],
+                                                    copy.deepcopy))
+        self.assertEqual(
+            json.loads(serializers['application/json'].to_string(streamed)),
+            json.loads(json.dumps(body)))
+        listed = dict(body, machines=[copy.deepcopy(machine)
+                                      for machine in body['machines']])
+        self.assertEqual(
+            serializers['application/xml'].to_string({root: streamed}),
+            serializers['application/xml'].to_string({root: listed}))
+
+    def test_serializers_are_compiled_once(self):
+        metadata = Consts.VOLUME_METADATA
+        self.assertTrue(get_serializers(metadata, NS) is
+                        get_serializers(metadata, NS))
+
+    def test_compact_entries_are_streamed(self):
+        root, body = DOCUMENTS['MACHINE_COL_METADATA']
+        serializer = get_serializers(Consts.MACHINE_COL_METADATA,
+                                     NS)['application/json']
+        streamed = dict(body, machines=EntryStream(body['machines'],
+                                                    copy.deepcopy))
+        self.assertEqual(json.loads(serializer.to_string(streamed)),
+                         json.loads(serializer.to_string(body)))
+
+
+if __name__ == '__main__':
+    unittest.main()
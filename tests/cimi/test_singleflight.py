@@ -0,0 +1,102 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+import eventlet
+import eventlet.debug
+from eventlet.event import Event
+
+from singleflight import SingleFlight
+
+
+class Interrupted(BaseException):
+    pass
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # the failing calls are expected, the hub need not print them
+        eventlet.debug.hub_exceptions(False)
+        self.flights = SingleFlight()
+        self.calls = []
+        self.release = Event()
+
+    def tearDown(self):
+        eventlet.debug.hub_exceptions(True)
+
+    def blocked(self, value):
+        """
+        A call which runs until the test releases it
+        """
+        self.calls.append(value)
+        outcome = self.release.wait()
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    def run_flight(self, count):
+        threads = [eventlet.spawn(self.flights.do, 'key', self.blocked, idx)
+                   for idx in range(count)]
+        # let every thread join the flight before it is released
+        eventlet.sleep(0)
+        return threads
+
+    def test_followers_get_the_leader_result(self):
+        threads = self.run_flight(3)
+        self.release.send('done')
+        self.assertEqual([thread.wait() for thread in threads],
+                         ['done'] * 3)
+        self.assertEqual(self.calls, [0])
+        self.assertEqual(self.flights.stats(),
+                         {'leaders': 1, 'followers': 2, 'in_flight': 0})
+
+    def test_flight_ends_with_the_call(self):
+        self.assertEqual(self.flights.do('key', lambda: 1), 1)
+        self.assertEqual(self.flights.do('key', lambda: 2), 2)
+        self.assertEqual(self.flights.stats()['leaders'], 2)
+
+    def test_followers_get_the_leader_exception(self):
+        threads = self.run_flight(2)
+        self.release.send(ValueError('backend'))
+        for thread in threads:
+            self.assertRaises(ValueError, thread.wait)
+        self.assertEqual(self.calls, [0])
+        self.assertEqual(self.flights.stats()['in_flight'], 0)
+
+    def test_flight_lands_on_any_exception(self):
+        threads = self.run_flight(2)
+        self.release.send(Interrupted())
+        for thread in threads:
+            self.assertRaises(Interrupted, thread.wait)
+        self.assertEqual(self.flights.stats()['in_flight'], 0)
+        self.assertEqual(self.flights.do('key', lambda: 'again'), 'again')
+
+    def test_keys_do_not_share_flights(self):
+        first = eventlet.spawn(self.flights.do, 'a', self.blocked, 'a')
+        second = eventlet.spawn(self.flights.do, 'b', self.blocked, 'b')
+        eventlet.sleep(0)
+        self.release.send('done')
+        self.assertEqual([first.wait(), second.wait()], ['done', 'done'])
+        self.assertEqual(sorted(self.calls), ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+from conditional import GENERATIONS
+from snapshot import ReadError, Snapshots, TenantSnapshot
+
+TENANT = 'tenant-a'
+
+
+def server(server_id, created, status='ACTIVE'):
+    return {'id': server_id, 'status': status, 'created': created}
+
+
+class TenantSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = TenantSnapshot(TENANT, {})
+        self.snapshot.update([server('a', '2012-10-01'),
+                              server('b', '2012-10-03'),
+                              server('c', '2012-10-02')],
+                             True, None, [], 100.0, 0)
+
+    def ids(self):
+        return [item['id'] for item in self.snapshot.server_list]
+
+    def test_servers_are_listed_newest_first(self):
+        self.assertEqual(self.ids(), ['b', 'c', 'a'])
+        self.assertEqual(self.snapshot.read_at, 100.0)
+
+    def test_changes_are_merged(self):
+        self.snapshot.update([server('d', '2012-10-04'),
+                              server('a', '2012-10-01', 'SHUTOFF'),
+                              server('c', '2012-10-02', 'DELETED')],
+                             False, None, [], 110.0, 0)
+        self.assertEqual(self.ids(), ['d', 'b', 'a'])
+        self.assertEqual(self.snapshot.servers['a']['status'], 'SHUTOFF')
+        self.assertEqual(self.snapshot.read_at, 110.0)
+
+    def test_full_listing_replaces_servers(self):
+        self.snapshot.update([server('d', '2012-10-04')], True, None, [],
+                             110.0, 0)
+        self.assertEqual(self.ids(), ['d'])
+
+    def test_flavors_are_kept_when_not_read(self):
+        self.snapshot.update([], False, ([], {'1': {}}), [], 110.0, 0)
+        self.snapshot.update([], False, None, [{'id': 'v'}], 120.0, 0)
+        self.assertEqual(self.snapshot.flavors, ([], {'1': {}}))
+        self.assertEqual(self.snapshot.volumes, {'v': {'id': 'v'}})
+
+
+class SnapshotsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.reads = []
+        self.result = ([server('a', '2012-10-01')], None, [])
+        self.snapshots = Snapshots()
+        self.snapshots.configure({'snapshot_enabled': 'true',
+                                  'snapshot_interval': '5'}, self.read)
+        self.snapshot = TenantSnapshot(TENANT, {})
+        self.snapshots._tenants[TENANT] = self.snapshot
+
+    def read(self, tenant_id, env, since):
+        self.reads.append(since)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def test_never_read_snapshot_is_not_fresh(self):
+        self.assertTrue(self.snapshots.fresh(TENANT) is None)
+        self.assertTrue(self.snapshots.fresh('tenant-b') is None)
+
+    def test_refresh_reads_in_full_then_incrementally(self):
+        self.snapshots._refresh(self.snapshot)
+        self.assertTrue(self.snapshots.fresh(TENANT) is self.snapshot)
+        self.snapshots._refresh(self.snapshot)
+        self.assertEqual(self.reads[0], None)
+        self.assertTrue(self.reads[1] is not None)
+        self.assertEqual(self.snapshots.stats()['refreshes'], 2)
+
+    def test_stale_snapshot_is_not_fresh(self):
+        self.snapshots._refresh(self.snapshot)
+        self.snapshot.read_at -= self.snapshots.max_staleness + 1
+        self.assertTrue(self.snapshots.fresh(TENANT) is None)
+
+    def test_write_makes_snapshot_not_fresh(self):
+        self.snapshots._refresh(self.snapshot)
+        GENERATIONS.bump(TENANT)
+        self.assertTrue(self.snapshots.fresh(TENANT) is None)
+        self.assertEqual(self.snapshots._due(time.time()), [self.snapshot])
+        self.snapshots._refresh(self.snapshot)
+        self.assertTrue(self.snapshots.fresh(TENANT) is self.snapshot)
+
+    def test_expired_credentials_drop_the_tenant(self):
+        self.result = ReadError(401)
+        self.snapshots._refresh(self.snapshot)
+        self.assertFalse(TENANT in self.snapshots._tenants)
+        self.assertEqual(self.snapshots.stats()['failures'], 1)
+
+    def test_idle_tenants_are_dropped(self):
+        self.snapshot.used -= self.snapshots.idle_timeout + 1
+        self.assertEqual(self.snapshots._due(time.time()), [])
+        self.assertFalse(TENANT in self.snapshots._tenants)
+
+    def test_lags_are_aggregated(self):
+        self.snapshots._refresh(self.snapshot)
+        stale = TenantSnapshot('tenant-b', {})
+        stale.added -= self.snapshots.max_staleness + 10
+        self.snapshots._tenants['tenant-b'] = stale
+        lags = self.snapshots.lags()
+        self.assertEqual(sorted(lags), ['max_seconds', 'stale'])
+        self.assertTrue(lags['max_seconds'] >=
+                        self.snapshots.max_staleness + 10)
+        self.assertEqual(lags['stale'], 1)
+
+    def test_no_lag_without_tenants(self):
+        self.snapshots._tenants.clear()
+        self.assertEqual(self.snapshots.lags(),
+                         {'max_seconds': 0.0, 'stale': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+from conditional import GENERATIONS
+from snapshot import ReadError
+from transitions import TrackedMachine, TransitionTracker
+
+TENANT = 'tenant-t'
+
+
+def server(server_id, status, updated='2012-10-01T12:00:05Z'):
+    return {'id': server_id, 'status': status, 'updated': updated}
+
+
+class TrackedMachineTestCase(unittest.TestCase):
+
+    def test_expected_state_settles(self):
+        machine = TrackedMachine('STOPPED', None)
+        self.assertFalse(machine.settled(server('a', 'ACTIVE')))
+        self.assertTrue(machine.settled(server('a', 'SHUTOFF')))
+
+    def test_any_stable_state_settles(self):
+        machine = TrackedMachine(None, None)
+        self.assertFalse(machine.settled(server('a', 'BUILD')))
+        self.assertTrue(machine.settled(server('a', 'ACTIVE')))
+
+    def test_unchanged_server_has_not_moved(self):
+        machine = TrackedMachine('STOPPED', '2012-10-01T12:00:00Z')
+        self.assertFalse(machine.settled(server('a', 'SHUTOFF',
+                                                '2012-10-01T12:00:00Z')))
+        self.assertTrue(machine.settled(server('a', 'SHUTOFF')))
+
+    def test_deleted_and_failed_machines_settle(self):
+        machine = TrackedMachine('STARTED', '2012-10-01T12:00:00Z')
+        self.assertTrue(machine.settled(server('a', 'DELETED',
+                                               '2012-10-01T12:00:00Z')))
+        self.assertTrue(machine.settled(server('a', 'ERROR')))
+
+
+class TransitionTrackerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.reads = []
+        self.result = []
+        self.tracker = TransitionTracker()
+        self.tracker.configure({'transition_tracking': 'true'}, self.read)
+        # keep the poller green thread from starting
+        self.tracker._poller = object()
+
+    def read(self, tenant_id, env, since):
+        self.reads.append(since)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def test_moving_machine_answers_reads(self):
+        self.tracker.track(TENANT, 'a', {}, 'STOPPED')
+        self.assertTrue(self.tracker.server(TENANT, 'a') is None)
+        tenant = self.tracker._tenants[TENANT]
+        self.tracker._update(tenant, [server('a', 'ACTIVE'),
+                                      server('b', 'ACTIVE')],
+                             time.time(), GENERATIONS.get(TENANT))
+        self.assertEqual(self.tracker.server(TENANT, 'a')['status'],
+                         'ACTIVE')
+        self.assertTrue(self.tracker.server(TENANT, 'b') is None)
+
+    def test_write_hides_polled_machine(self):
+        self.tracker.track(TENANT, 'a', {}, 'STOPPED')
+        tenant = self.tracker._tenants[TENANT]
+        self.tracker._update(tenant, [server('a', 'ACTIVE')], time.time(),
+                             GENERATIONS.get(TENANT))
+        GENERATIONS.bump(TENANT)
+        self.assertTrue(self.tracker.server(TENANT, 'a') is None)
+
+    def test_settled_machines_are_dropped(self):
+        self.tracker.track(TENANT, 'a', {}, 'STOPPED')
+        self.tracker.track(TENANT, 'b', {}, 'STOPPED')
+        tenant = self.tracker._tenants[TENANT]
+        self.tracker._update(tenant, [server('a', 'SHUTOFF')], time.time(),
+                             GENERATIONS.get(TENANT))
+        self.assertEqual(self.tracker.stats()['tracked'], 1)
+        self.assertEqual(self.tracker.stats()['settled'], 1)
+        self.tracker._update(tenant, [server('b', 'SHUTOFF')], time.time(),
+                             GENERATIONS.get(TENANT))
+        self.assertFalse(TENANT in self.tracker._tenants)
+
+    def test_refresh_polls_and_backs_off(self):
+        self.tracker.track(TENANT, 'a', {}, 'STOPPED')
+        tenant = self.tracker._tenants[TENANT]
+        self.result = [server('a', 'ACTIVE')]
+        self.tracker._refresh(tenant)
+        self.tracker._refresh(tenant)
+        self.assertEqual(len(self.reads), 2)
+        self.assertTrue(self.reads[1] > self.reads[0])
+        self.assertEqual(tenant.delay, self.tracker.poll_min * 4)
+
+    def test_timed_out_machines_are_dropped(self):
+        self.tracker.track(TENANT, 'a', {}, 'STOPPED')
+        tenant = self.tracker._tenants[TENANT]
+        tenant.machines['a'].added -= self.tracker.timeout + 1
+        self.result = [server('a', 'ACTIVE')]
+        self.tracker._refresh(tenant)
+        self.assertEqual(self.tracker.stats()['timeouts'], 1)
+        self.assertFalse(TENANT in self.tracker._tenants)
+
+    def test_expired_credentials_drop_the_tenant(self):
+        self.tracker.track(TENANT, 'a', {}, 'STOPPED')
+        self.result = ReadError(403)
+        self.tracker._refresh(self.tracker._tenants[TENANT])
+        self.assertFalse(TENANT in self.tracker._tenants)
+        self.assertEqual(self.tracker.stats()['tracked'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..', 'cimi', 'cimiapp'))
+
+import eventlet
+
+from waiters import StateWaiters
+
+TENANT = 'tenant-w'
+
+
+def server(server_id, status):
+    return {'id': server_id, 'status': status}
+
+
+class StateWaitersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+        self.tokens = []
+        self.waiters = StateWaiters()
+        self.waiters.configure({}, self.read_servers, None)
+        # keep the poller green thread from starting
+        self.waiters._poller = object()
+
+    def read_servers(self, tenant_id, env, since):
+        self.tokens.append(env.get('HTTP_X_AUTH_TOKEN'))
+        return self.servers
+
+    def wait(self, token, timeout=5):
+        env = {'HTTP_X_AUTH_TOKEN': token}
+        return eventlet.spawn(self.waiters.wait, TENANT, 'servers', 'a',
+                              env, ('STOPPED',), timeout)
+
+    def refresh(self):
+        self.waiters._refresh(self.waiters._tenants[TENANT])
+
+    def test_waiter_is_woken_in_its_state(self):
+        thread = self.wait('first')
+        eventlet.sleep(0)
+        self.servers = [server('a', 'ACTIVE')]
+        self.refresh()
+        self.assertEqual(self.waiters.stats()['woken'], 0)
+        self.servers = [server('a', 'SHUTOFF')]
+        self.refresh()
+        self.assertEqual(thread.wait(), server('a', 'SHUTOFF'))
+        self.assertEqual(self.waiters.stats()['waiting'], 0)
+        self.assertFalse(TENANT in self.waiters._tenants)
+
+    def test_timed_out_waiter_gets_last_polled_resource(self):
+        thread = self.wait('first', timeout=0.01)
+        eventlet.sleep(0)
+        self.servers = [server('a', 'ACTIVE')]
+        self.refresh()
+        self.assertEqual(thread.wait(), server('a', 'ACTIVE'))
+        self.assertEqual(self.waiters.stats()['timeouts'], 1)
+
+    def test_tenant_is_polled_with_latest_credentials(self):
+        first = self.wait('first')
+        eventlet.sleep(0)
+        self.refresh()
+        second = self.wait('second')
+        eventlet.sleep(0)
+        self.servers = [server('a', 'SHUTOFF')]
+        self.refresh()
+        self.assertEqual(self.tokens, ['first', 'second'])
+        first.wait()
+        second.wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Fake Nova and Cinder services for running cimi without a cloud.
+
+FakeNova and FakeCinder are WSGI applications serving the endpoints the
+cimi controllers call for generated tenants. How each endpoint behaves,
+its latency, error rate and payload size, is set with Behaviours. They run
+in process, or from a local HTTP server:
+
+    PYTHONPATH=tests python -m fakecloud --port 8776 --latency nova:*=exp:20
+"""
+
+from apps import FakeBackends, FakeCinder, FakeNova
+from behaviour import Behaviour, Behaviours
+from server import serve
+from tenant import FakeTenant
@@ -0,0 +1,326 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from urlparse import parse_qsl
+import json
+import re
+
+import eventlet
+
+from behaviour import Behaviours
+
+STATUS_LINES = {200: '200 OK', 202: '202 Accepted', 204: '204 No Content',
+                400: '400 Bad Request', 404: '404 Not Found',
+                405: '405 Method Not Allowed',
+                500: '500 Internal Server Error', 502: '502 Bad Gateway',
+                503: '503 Service Unavailable', 504: '504 Gateway Timeout'}
+
+
+def respond(start_response, status, data=None):
+    body = json.dumps(data) if data is not None else ''
+    start_response(STATUS_LINES.get(status, '%d Fake Status' % status),
+                   [('Content-Type', 'application/json'),
+                    ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def fault(status, message):
+    name = 'itemNotFound' if status == 404 else \
+        'badRequest' if status == 400 else 'computeFault'
+    return {name: {'code': status, 'message': message}}
+
+
+def route_of(parts):
+    """
+    The route of the path parts below the tenant, the ids replaced by {id}:
+    servers/{id}/os-volume_attachments/{id} for example
+    """
+    route = []
+    for idx, part in enumerate(parts):
+        if idx % 2 and not (idx == 1 and part == 'detail'):
+            part = '{id}'
+        route.append(part)
+    return '/'.join(route)
+
+
+def listing(items, params):
+    """
+    Apply the Nova listing parameters the controllers send
+    """
+    if 'changes-since' in params:
+        items = [item for item in items
+                 if item.get('updated', '') >= params['changes-since']]
+    if 'status' in params:
+        items = [item for item in items
+                 if item.get('status') == params['status']]
+    if 'name' in params:
+        pattern = re.compile(params['name'])
+        items = [item for item in items if pattern.search(item['name'])]
+    if 'marker' in params:
+        ids = [item['id'] for item in items]
+        if params['marker'] not in ids:
+            return None
+        items = items[ids.index(params['marker']) + 1:]
+    if 'limit' in params:
+        items = items[:int(params['limit'])]
+    return items
+
+
+def summary(item):
+    return {'id': item['id'], 'name': item['name'], 'links': []}
+
+
+def padded(item, size):
+    """
+    The item with size bytes of metadata added, to make payloads larger
+    """
+    if not size:
+        return item
+    metadata = dict(item.get('metadata') or {})
+    metadata['padding'] = 'x' * size
+    item = dict(item)
+    item['metadata'] = metadata
+    return item
+
+
+class FakeService(object):
+    """
+    Routes the requests of one service to the handler methods named after
+    the method and the route, GET servers/{id} goes to
+    GET_servers_id for example. Every endpoint behaves as its behaviour
+    says: the request is delayed, may fail, and its resources are padded.
+    """
+    service = None
+
+    def __init__(self, tenants, behaviours=None):
+        self.tenants = dict((tenant.tenant_id, tenant) for tenant in tenants)
+        self.behaviours = behaviours or Behaviours()
+
+    def __call__(self, env, start_response):
+        parts = env.get('PATH_INFO', '').strip('/').split('/')
+        method = env.get('REQUEST_METHOD', 'GET')
+        tenant = self.tenants.get(parts[0])
+        if tenant is None or len(parts) < 2:
+            return respond(start_response, 404,
+                           fault(404, 'no such tenant'))
+
+        route = route_of(parts[1:])
+        behaviour = self.behaviours.get('%s:%s' % (self.service, route))
+        delay = behaviour.delay(self.behaviours.rand)
+        if delay:
+            eventlet.sleep(delay)
+        if behaviour.fails(self.behaviours.rand):
+            return respond(start_response, behaviour.error_status,
+                           fault(behaviour.error_status, 'injected fault'))
+
+        name = '_'.join([method] + [part.strip('{}').replace('-', '_')
+                                    for part in route.split('/')])
+        handler = getattr(self, name, None)
+        if handler is None:
+            return respond(start_response, 405)
+
+        body = None
+        length = int(env.get('CONTENT_LENGTH') or 0)
+        if length:
+            try:
+                body = json.loads(env['wsgi.input'].read(length))
+            except ValueError:
+                return respond(start_response, 400,
+                               fault(400, 'malformed body'))
+        params = dict(parse_qsl(env.get('QUERY_STRING', '')))
+        tenant.settle()
+        status, data = handler(tenant, parts[2::2], params, body or {},
+                               behaviour.payload)
+        return respond(start_response, status, data)
+
+
+class FakeNova(FakeService):
+    """
+    The servers, flavors, images and os-volume_attachments endpoints of
+    the Nova API, below /v2
+    """
+    service = 'nova'
+
+    def _list(self, key, items, params, payload, detail):
+        items = listing(items, params)
+        if items is None:
+            return 400, fault(400, 'marker not found')
+        if detail:
+            items = [padded(item, payload) for item in items]
+        else:
+            items = [summary(item) for item in items]
+        return 200, {key: items}
+
+    def _show(self, tenant, key, item_id, payload):
+        item = tenant.find(key + 's', item_id)
+        if item is None:
+            return 404, fault(404, '%s not found' % key)
+        return 200, {key: padded(item, payload)}
+
+    def GET_servers(self, tenant, ids, params, body, payload):
+        return self._list('servers', tenant.servers, params, payload, False)
+
+    def GET_servers_detail(self, tenant, ids, params, body, payload):
+        return self._list('servers', tenant.servers, params, payload, True)
+
+    def GET_servers_id(self, tenant, ids, params, body, payload):
+        return self._show(tenant, 'server', ids[0], payload)
+
+    def POST_servers(self, tenant, ids, params, body, payload):
+        data = body.get('server')
+        if not data or not data.get('flavorRef') or \
+           not data.get('imageRef'):
+            return 400, fault(400, 'flavorRef and imageRef are required')
+        server = tenant.create_server(data)
+        return 202, {'server': {'id': server['id'], 'links': [],
+                                'adminPass': data.get('adminPass',
+                                                      'password')}}
+
+    def DELETE_servers_id(self, tenant, ids, params, body, payload):
+        server = tenant.find('servers', ids[0])
+        if server is None:
+            return 404, fault(404, 'server not found')
+        tenant.delete_server(server)
+        return 204, None
+
+    def POST_servers_id_action(self, tenant, ids, params, body, payload):
+        server = tenant.find('servers', ids[0])
+        if server is None:
+            return 404, fault(404, 'server not found')
+        if len(body) != 1 or not tenant.server_action(server, body.keys()[0]):
+            return 400, fault(400, 'unknown action')
+        return 202, None
+
+    def GET_servers_id_os_volume_attachments(self, tenant, ids, params,
+                                             body, payload):
+        if tenant.find('servers', ids[0]) is None:
+            return 404, fault(404, 'server not found')
+        return 200, {'volumeAttachments':
+                     tenant.attachments.get(ids[0], [])}
+
+    def GET_servers_id_os_volume_attachments_id(self, tenant, ids, params,
+                                                body, payload):
+        for attachment in tenant.attachments.get(ids[0], []):
+            if attachment['id'] == ids[1]:
+                return 200, {'volumeAttachment': attachment}
+        return 404, fault(404, 'volume attachment not found')
+
+    def POST_servers_id_os_volume_attachments(self, tenant, ids, params,
+                                              body, payload):
+        server = tenant.find('servers', ids[0])
+        if server is None:
+            return 404, fault(404, 'server not found')
+        data = body.get('volumeAttachment') or {}
+        volume = tenant.find('volumes', data.get('volumeId'))
+        if volume is None:
+            return 404, fault(404, 'volume not found')
+        if volume['attachments']:
+            return 400, fault(400, 'volume is attached')
+        attachment = tenant.attach_volume(server, volume,
+                                          data.get('device'))
+        return 200, {'volumeAttachment': attachment}
+
+    def DELETE_servers_id_os_volume_attachments_id(self, tenant, ids,
+                                                   params, body, payload):
+        server = tenant.find('servers', ids[0])
+        if server is None or not tenant.detach_volume(server, ids[1]):
+            return 404, fault(404, 'volume attachment not found')
+        return 202, None
+
+    def GET_flavors(self, tenant, ids, params, body, payload):
+        return self._list('flavors', tenant.flavors, params, payload, False)
+
+    def GET_flavors_detail(self, tenant, ids, params, body, payload):
+        return self._list('flavors', tenant.flavors, params, payload, True)
+
+    def GET_flavors_id(self, tenant, ids, params, body, payload):
+        return self._show(tenant, 'flavor', ids[0], payload)
+
+    def GET_images(self, tenant, ids, params, body, payload):
+        return self._list('images', tenant.images, params, payload, False)
+
+    def GET_images_detail(self, tenant, ids, params, body, payload):
+        return self._list('images', tenant.images, params, payload, True)
+
+    def GET_images_id(self, tenant, ids, params, body, payload):
+        return self._show(tenant, 'image', ids[0], payload)
+
+
+class FakeCinder(FakeService):
+    """
+    The volumes endpoints of the Cinder API, below /v1
+    """
+    service = 'cinder'
+
+    def _volumes(self, tenant, params, payload, detail):
+        volumes = tenant.volumes
+        if 'display_name' in params:
+            volumes = [volume for volume in volumes
+                       if volume['display_name'] == params['display_name']]
+        if 'status' in params:
+            volumes = [volume for volume in volumes
+                       if volume['status'] == params['status']]
+        if detail:
+            volumes = [padded(volume, payload) for volume in volumes]
+        else:
+            volumes = [{'id': volume['id'],
+                        'display_name': volume['display_name']}
+                       for volume in volumes]
+        return 200, {'volumes': volumes}
+
+    def GET_volumes(self, tenant, ids, params, body, payload):
+        return self._volumes(tenant, params, payload, False)
+
+    def GET_volumes_detail(self, tenant, ids, params, body, payload):
+        return self._volumes(tenant, params, payload, True)
+
+    def GET_volumes_id(self, tenant, ids, params, body, payload):
+        volume = tenant.find('volumes', ids[0])
+        if volume is None:
+            return 404, fault(404, 'volume not found')
+        return 200, {'volume': padded(volume, payload)}
+
+    def POST_volumes(self, tenant, ids, params, body, payload):
+        data = body.get('volume')
+        if not data or not data.get('size'):
+            return 400, fault(400, 'size is required')
+        return 200, {'volume': tenant.create_volume(data)}
+
+    def DELETE_volumes_id(self, tenant, ids, params, body, payload):
+        volume = tenant.find('volumes', ids[0])
+        if volume is None:
+            return 404, fault(404, 'volume not found')
+        if volume['attachments']:
+            return 400, fault(400, 'volume is attached')
+        tenant.delete_volume(volume)
+        return 202, None
+
+
+class FakeBackends(object):
+    """
+    Nova below /v2 and Cinder below /v1, as the local HTTP server serves
+    them
+    """
+
+    def __init__(self, nova, cinder):
+        self.apps = (('/v2', nova), ('/v1', cinder))
+
+    def __call__(self, env, start_response):
+        path = env.get('PATH_INFO', '')
+        for prefix, app in self.apps:
+            if path.startswith(prefix + '/'):
+                env['SCRIPT_NAME'] = env.get('SCRIPT_NAME', '') + prefix
+                env['PATH_INFO'] = path[len(prefix):]
+                return app(env, start_response)
+        return respond(start_response, 404, fault(404, 'no such service'))
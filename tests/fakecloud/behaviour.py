@@ -0,0 +1,146 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from fnmatch import fnmatchcase
+import json
+import random
+
+# the latency distributions, the parameters are in milliseconds but for
+# the sigma of lognormal
+DISTRIBUTIONS = {
+    'none': (0, lambda rand: 0.0),
+    'fixed': (1, lambda rand, value: value),
+    'uniform': (2, lambda rand, low, high: rand.uniform(low, high)),
+    'exp': (1, lambda rand, mean: rand.expovariate(1.0 / mean)),
+    'normal': (2, lambda rand, mean, dev: max(0.0, rand.gauss(mean, dev))),
+    'lognormal': (2, lambda rand, median, sigma:
+                  rand.lognormvariate(0, sigma) * median)}
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution such as fixed:10, uniform:5:50, exp:20,
+    normal:20:5 or lognormal:20:0.8, the values are in milliseconds
+    """
+    parts = str(spec).split(':')
+    name = parts[0].strip().lower()
+    if name not in DISTRIBUTIONS:
+        raise ValueError('unknown latency distribution %r' % spec)
+    count, func = DISTRIBUTIONS[name]
+    try:
+        values = [float(value) for value in parts[1:]]
+    except ValueError:
+        raise ValueError('bad latency distribution %r' % spec)
+    if len(values) != count:
+        raise ValueError('%s takes %d values, %r' % (name, count, spec))
+    return name, values, func
+
+
+class Behaviour(object):
+    """
+    How one endpoint behaves: the latency it adds, the part of its requests
+    which fail and with which status, and the bytes of metadata added to
+    every resource it returns
+    """
+
+    def __init__(self, latency='none', error_rate=0.0, error_status=500,
+                 payload=0):
+        self.latency = latency
+        self.error_rate = float(error_rate)
+        self.error_status = int(error_status)
+        self.payload = int(payload)
+        self._distribution = parse_latency(latency)
+
+    def delay(self, rand):
+        """
+        The latency of one request, in seconds
+        """
+        name, values, func = self._distribution
+        return func(rand, *values) / 1000.0
+
+    def fails(self, rand):
+        return self.error_rate > 0 and rand.random() < self.error_rate
+
+
+class Behaviours(object):
+    """
+    The behaviour of every endpoint. Endpoints are named
+    <service>:<route>, nova:servers/detail or cinder:volumes/{id} for
+    example, and the rules are fnmatch patterns of those names. Each
+    setting of an endpoint comes from the longest matching pattern which
+    sets it.
+    """
+    SETTINGS = ('latency', 'error_rate', 'error_status', 'payload')
+
+    def __init__(self, seed=None):
+        self.rules = {}
+        self.rand = random.Random(seed)
+        self._matches = {}
+
+    def set(self, pattern, **values):
+        """
+        Change settings of the pattern, the others keep their value
+        """
+        for name in values:
+            if name not in self.SETTINGS:
+                raise ValueError('unknown setting %r' % name)
+        rule = dict(self.rules.get(pattern, {}))
+        rule.update(values)
+        # fail now on a bad value rather than on the first request
+        Behaviour(**dict((str(name), value)
+                         for name, value in rule.items()))
+        self.rules[pattern] = rule
+        self._matches = {}
+
+    def get(self, endpoint):
+        behaviour = self._matches.get(endpoint)
+        if behaviour is None:
+            values = {}
+            for pattern in sorted(self.rules, key=len):
+                if fnmatchcase(endpoint, pattern):
+                    values.update(self.rules[pattern])
+            behaviour = Behaviour(**dict((str(name), value)
+                                         for name, value in values.items()))
+            self._matches[endpoint] = behaviour
+        return behaviour
+
+    def load(self, path):
+        """
+        Read rules from a JSON file mapping patterns to settings, such as
+        {"nova:servers/detail": {"latency": "lognormal:40:0.6",
+                                 "error_rate": 0.01}}
+        """
+        with open(path) as data:
+            for pattern, values in json.load(data).items():
+                self.set(pattern, **dict((str(name), value)
+                                         for name, value in values.items()))
+
+    def parse(self, name, specs):
+        """
+        Set one setting from command line values of the form PATTERN=VALUE,
+        a value without pattern applies to every endpoint. Error rates may
+        carry the status, 0.05:503.
+        """
+        for spec in specs or []:
+            pattern, sep, value = spec.rpartition('=')
+            pattern = pattern or '*'
+            if name == 'error_rate' and ':' in value:
+                value, status = value.split(':', 1)
+                self.set(pattern, error_rate=value, error_status=status)
+            else:
+                self.set(pattern, **{name: value})
+
+    def to_dict(self):
+        return dict((pattern, dict(rule))
+                    for pattern, rule in self.rules.items())
@@ -0,0 +1,110 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from optparse import OptionParser
+import socket
+import sys
+
+import eventlet
+import eventlet.wsgi
+
+from apps import FakeBackends, FakeCinder, FakeNova
+from behaviour import Behaviours
+from tenant import FakeTenant
+
+
+class NullLog(object):
+
+    def write(self, data):
+        pass
+
+
+def listen(host='127.0.0.1', port=0):
+    sock = eventlet.listen((host, port))
+    # the server sends the headers and a large body apart, without this the
+    # body waits for the delayed ack of the headers
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def serve(app, host='127.0.0.1', port=0, log=None):
+    """
+    Serve the app from a green thread, return the port it listens on
+    """
+    sock = listen(host, port)
+    eventlet.spawn_n(eventlet.wsgi.server, sock, app, log=log or NullLog())
+    return sock.getsockname()[1]
+
+
+def add_options(parser):
+    """
+    Add the options describing the tenant and the behaviour of the
+    endpoints to an OptionParser
+    """
+    parser.add_option('--machines', type='int', default=100)
+    parser.add_option('--volumes', type='int', default=50)
+    parser.add_option('--flavors', type='int', default=5)
+    parser.add_option('--images', type='int', default=10)
+    parser.add_option('--attachments', type='int', default=25,
+                      help='volumes attached to the machines')
+    parser.add_option('--transition', type='float', default=0.0,
+                      help='seconds created or changed resources stay in '
+                           'their transitional state')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--latency', action='append', metavar='PATTERN=SPEC',
+                      help='latency of the endpoints, nova:*=exp:20 for '
+                           'example')
+    parser.add_option('--errors', action='append', metavar='PATTERN=RATE',
+                      help='part of the requests which fail, '
+                           'cinder:volumes/*=0.05:503 for example')
+    parser.add_option('--payload', action='append', metavar='PATTERN=BYTES',
+                      help='metadata bytes added to every resource')
+    parser.add_option('--behaviours', metavar='FILE',
+                      help='JSON file of endpoint behaviours')
+
+
+def make_tenant(tenant_id, options):
+    return FakeTenant(tenant_id, options.machines, options.volumes,
+                      options.flavors, options.images, options.attachments,
+                      options.seed, options.transition)
+
+
+def make_behaviours(options):
+    behaviours = Behaviours(options.seed)
+    if options.behaviours:
+        behaviours.load(options.behaviours)
+    behaviours.parse('latency', options.latency)
+    behaviours.parse('error_rate', options.errors)
+    behaviours.parse('payload', options.payload)
+    return behaviours
+
+
+def main(args=None):
+    parser = OptionParser(usage='%prog [options] [tenant ...]')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8776)
+    add_options(parser)
+    options, tenant_ids = parser.parse_args(args)
+
+    tenants = [make_tenant(tenant_id, options)
+               for tenant_id in tenant_ids or ['demo']]
+    behaviours = make_behaviours(options)
+    app = FakeBackends(FakeNova(tenants, behaviours),
+                       FakeCinder(tenants, behaviours))
+    sock = listen(options.host, options.port)
+    base = 'http://%s:%d' % sock.getsockname()[:2]
+    print 'Nova at %s/v2, Cinder at %s/v1, tenants %s' % (base, base,
+        ', '.join(tenant.tenant_id for tenant in tenants))
+    sys.stdout.flush()
+    eventlet.wsgi.server(sock, app, log=NullLog())
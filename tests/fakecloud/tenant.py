@@ -0,0 +1,286 @@
+# Copyright (c) 2012 IBM
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import random
+import time
+
+NOVA_STATES = ['ACTIVE', 'ACTIVE', 'ACTIVE', 'SHUTOFF', 'PAUSED',
+               'SUSPENDED', 'BUILD']
+
+# the state a server is in while an action runs and the one it ends in
+SERVER_ACTIONS = {'os-start': ('ACTIVE', 'ACTIVE'),
+                  'os-stop': ('ACTIVE', 'SHUTOFF'),
+                  'reboot': ('REBOOT', 'ACTIVE'),
+                  'pause': ('ACTIVE', 'PAUSED'),
+                  'unpause': ('PAUSED', 'ACTIVE'),
+                  'suspend': ('ACTIVE', 'SUSPENDED'),
+                  'resume': ('SUSPENDED', 'ACTIVE')}
+
+
+def uuid(kind, idx):
+    return '%08x-0000-4000-8000-%012d' % (kind, idx)
+
+
+def timestamp(rand):
+    return '2012-%02d-%02dT%02d:%02d:%02dZ' % (rand.randint(1, 9),
+        rand.randint(1, 28), rand.randint(0, 23), rand.randint(0, 59),
+        rand.randint(0, 59))
+
+
+def now():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+class FakeTenant(object):
+    """
+    The resources of one tenant, as Nova and Cinder would list them. The
+    first attachments volumes are attached to the servers in turn.
+
+    Created servers and volumes, and servers running an action, are in a
+    transitional state for transition seconds before they settle.
+    """
+
+    def __init__(self, tenant_id, machines=100, volumes=50, flavors=5,
+                 images=10, attachments=25, seed=0, transition=0.0):
+        rand = random.Random(seed)
+        self.tenant_id = tenant_id
+        self.transition = transition
+        self.created = 0
+        # id of a resource in a transitional state: the time it settles,
+        # its final status, None when it goes away
+        self.pending = {}
+
+        self.flavors = []
+        for idx in range(flavors):
+            self.flavors.append({'id': str(idx + 1),
+                                 'name': 'm1.flavor%d' % idx,
+                                 'vcpus': 2 ** (idx % 4),
+                                 'ram': 512 * 2 ** (idx % 6),
+                                 'disk': 10 * (idx + 1),
+                                 'links': []})
+
+        self.images = []
+        for idx in range(images):
+            self.images.append({'id': uuid(1, idx),
+                                'name': 'image-%d' % idx,
+                                'status': 'ACTIVE',
+                                'created': timestamp(rand),
+                                'updated': timestamp(rand),
+                                'minDisk': 0, 'minRam': 0,
+                                'metadata': {}, 'links': []})
+
+        self.servers = []
+        for idx in range(machines):
+            created = timestamp(rand)
+            self.servers.append(self._server(uuid(2, idx),
+                'server-%d' % idx, rand.choice(NOVA_STATES), created,
+                max(created, timestamp(rand)),
+                rand.choice(self.flavors)['id'] if self.flavors else '',
+                rand.choice(self.images)['id'] if self.images else '',
+                idx))
+
+        self.volumes = []
+        self.attachments = {}
+        for idx in range(volumes):
+            volume = self._volume(uuid(3, idx), 'volume-%d' % idx,
+                                  'volume %d' % idx, timestamp(rand),
+                                  rand.randint(1, 100))
+            self.volumes.append(volume)
+            if idx < attachments and self.servers:
+                server = self.servers[idx % len(self.servers)]
+                self._attach(server, volume, '/dev/vd%s' %
+                             chr(ord('b') + idx / len(self.servers) % 24))
+
+        # every resource by id, with the name of its collection
+        self.by_id = {}
+        for kind in ('flavors', 'images', 'servers', 'volumes'):
+            for item in getattr(self, kind):
+                self.by_id[item['id']] = (kind, item)
+
+    def _server(self, server_id, name, status, created, updated, flavor_id,
+                image_id, idx):
+        return {'id': server_id,
+                'name': name,
+                'status': status,
+                'created': created,
+                'updated': updated,
+                'tenant_id': self.tenant_id,
+                'flavor': {'id': flavor_id, 'links': []},
+                'image': {'id': image_id, 'links': []},
+                'addresses': {
+                    'private': [{'addr': '10.0.%d.%d' % (idx / 250 % 256,
+                                                         idx % 250 + 2),
+                                 'version': 4}],
+                    'public': [{'addr': '172.24.%d.%d' % (idx / 250 % 256,
+                                                          idx % 250 + 2),
+                                'version': 4}]},
+                'metadata': {}, 'links': []}
+
+    def _volume(self, volume_id, name, description, created, size):
+        return {'id': volume_id,
+                'display_name': name,
+                'display_description': description,
+                'created_at': created,
+                'size': size,
+                'status': 'available',
+                'attachments': [],
+                'availability_zone': 'nova',
+                'volume_type': None, 'snapshot_id': None,
+                'metadata': {}}
+
+    def _attach(self, server, volume, device):
+        volume['status'] = 'in-use'
+        volume['attachments'] = [{'id': volume['id'],
+                                  'volume_id': volume['id'],
+                                  'server_id': server['id'],
+                                  'device': device}]
+        attachment = {'id': volume['id'], 'volumeId': volume['id'],
+                      'serverId': server['id'], 'device': device}
+        self.attachments.setdefault(server['id'], []).append(attachment)
+        return attachment
+
+    def sample(self, idx):
+        """
+        The ids of the resources the idx-th request of a case reads, they
+        go round all the resources of the tenant
+        """
+        server = self.servers[idx % len(self.servers)]
+        attached = sorted(self.attachments)
+        values = {'server': server['id'],
+                  'ip': server['addresses']['private'][0]['addr'],
+                  'flavor': self.flavors[idx % len(self.flavors)]['id'],
+                  'image': self.images[idx % len(self.images)]['id'],
+                  'volume': self.volumes[idx % len(self.volumes)]['id']}
+        if attached:
+            server_id = attached[idx % len(attached)]
+            values['attached_server'] = server_id
+            values['attached_volume'] = \
+                self.attachments[server_id][0]['volumeId']
+        return values
+
+    def find(self, kind, item_id):
+        """
+        Return the resource of the collection with the id, None if there is
+        no such resource
+        """
+        self.settle()
+        found, item = self.by_id.get(item_id, (None, None))
+        return item if found == kind else None
+
+    def settle(self):
+        """
+        Move the resources whose transition is over to their final state
+        """
+        if not self.pending:
+            return
+        current = time.time()
+        for item_id, (at, status) in self.pending.items():
+            if at > current:
+                continue
+            del self.pending[item_id]
+            kind, item = self.by_id.get(item_id, (None, None))
+            if item is None:
+                continue
+            if status is None:
+                self._remove(kind, item)
+            else:
+                item['status'] = status
+                if 'updated' in item:
+                    item['updated'] = now()
+
+    def _change(self, item, status, final):
+        """
+        Put the resource in a transitional status, it settles in final
+        """
+        item['status'] = status
+        if 'updated' in item:
+            item['updated'] = now()
+        self.pending[item['id']] = (time.time() + self.transition, final)
+        self.settle()
+
+    def _remove(self, kind, item):
+        getattr(self, kind).remove(item)
+        del self.by_id[item['id']]
+        if kind == 'servers':
+            for attachment in self.attachments.pop(item['id'], []):
+                found, volume = self.by_id.get(attachment['volumeId'],
+                                               (None, None))
+                if volume is not None:
+                    volume['status'] = 'available'
+                    volume['attachments'] = []
+
+    def create_server(self, data):
+        self.created += 1
+        idx = len(self.servers) + self.created
+        server = self._server(uuid(4, self.created),
+                              data.get('name') or 'server-%d' % idx,
+                              'BUILD', now(), now(),
+                              str(data.get('flavorRef', '')),
+                              str(data.get('imageRef', '')), idx)
+        self.servers.append(server)
+        self.by_id[server['id']] = ('servers', server)
+        self._change(server, 'BUILD', 'ACTIVE')
+        return server
+
+    def delete_server(self, server):
+        self._change(server, server['status'], None)
+
+    def server_action(self, server, action):
+        """
+        Run an action on the server, False when Nova does not know it
+        """
+        if action not in SERVER_ACTIONS:
+            return False
+        status, final = SERVER_ACTIONS[action]
+        self._change(server, status, final)
+        return True
+
+    def attach_volume(self, server, volume, device):
+        attachment = self._attach(server, volume, device)
+        self._change(volume, 'attaching', 'in-use')
+        return attachment
+
+    def detach_volume(self, server, volume_id):
+        """
+        Detach the volume from the server, False if it is not attached
+        """
+        attachments = self.attachments.get(server['id'], [])
+        for attachment in attachments:
+            if attachment['volumeId'] == volume_id:
+                attachments.remove(attachment)
+                if not attachments:
+                    del self.attachments[server['id']]
+                volume = self.find('volumes', volume_id)
+                if volume is not None:
+                    volume['attachments'] = []
+                    self._change(volume, 'detaching', 'available')
+                return True
+        return False
+
+    def create_volume(self, data):
+        self.created += 1
+        volume = self._volume(uuid(5, self.created),
+                              data.get('display_name') or
+                              'volume-%d' % self.created,
+                              data.get('display_description'), now(),
+                              int(data.get('size') or 1))
+        if data.get('metadata'):
+            volume['metadata'] = data['metadata']
+        self.volumes.append(volume)
+        self.by_id[volume['id']] = ('volumes', volume)
+        self._change(volume, 'creating', 'available')
+        return volume
+
+    def delete_volume(self, volume):
+        self._change(volume, 'deleting', None)